@@ -0,0 +1,33 @@
+"""add nickname to the user directory
+
+Revision ID: 4c7a2e9d1b58
+Revises: 9b1f4c2d7e30
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c7a2e9d1b58'
+down_revision: Union[str, None] = '9b1f4c2d7e30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('user_directory', sa.Column('nickname', sa.String(length=50), nullable=True))
+    # Entries filled from existing users get their nicknames
+    op.execute(
+        "UPDATE user_directory SET nickname = "
+        "(SELECT users.nickname FROM users WHERE users.id = user_directory.user_id)"
+    )
+    op.create_unique_constraint('uq_user_directory_nickname', 'user_directory', ['nickname'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_user_directory_nickname', 'user_directory', type_='unique')
+    op.drop_column('user_directory', 'nickname')
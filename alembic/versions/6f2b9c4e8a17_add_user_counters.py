@@ -0,0 +1,33 @@
+"""add maintained per-role user counters
+
+Revision ID: 6f2b9c4e8a17
+Revises: d3e8a61f5c20
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6f2b9c4e8a17'
+down_revision: Union[str, None] = 'd3e8a61f5c20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('user_counters',
+    sa.Column('role', sa.String(length=32), nullable=False),
+    sa.Column('slot', sa.Integer(), nullable=False),
+    sa.Column('count', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('role', 'slot')
+    )
+    # Seed the counters with the users that already exist
+    op.execute("INSERT INTO user_counters (role, slot, count) SELECT CAST(role AS VARCHAR), 0, count(*) FROM users GROUP BY role")
+
+
+def downgrade() -> None:
+    op.drop_table('user_counters')
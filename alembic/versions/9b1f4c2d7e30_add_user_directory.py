@@ -0,0 +1,42 @@
+"""add user directory for sharded user storage
+
+Revision ID: 9b1f4c2d7e30
+Revises: 25d814bc83ed
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b1f4c2d7e30'
+down_revision: Union[str, None] = '25d814bc83ed'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Users that exist before sharding stay in this database, which becomes the first shard
+# (list it first in DATABASE_SHARD_URLS); `app.utils.shard_rebalance` then moves those
+# whose id hashes to another shard and updates their entries.
+EXISTING_USERS_SHARD = 'shard_0'
+
+
+def upgrade() -> None:
+    op.create_table('user_directory',
+    sa.Column('email', sa.String(length=255), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('shard_id', sa.String(length=64), nullable=False),
+    sa.PrimaryKeyConstraint('email')
+    )
+    op.create_index(op.f('ix_user_directory_user_id'), 'user_directory', ['user_id'], unique=True)
+    op.execute(
+        sa.text("INSERT INTO user_directory (email, user_id, shard_id) SELECT email, id, :shard_id FROM users")
+        .bindparams(shard_id=EXISTING_USERS_SHARD)
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_user_directory_user_id'), table_name='user_directory')
+    op.drop_table('user_directory')
@@ -0,0 +1,33 @@
+"""add bootstrap state for the first-admin election
+
+Revision ID: a81d5f3c6e94
+Revises: 6f2b9c4e8a17
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a81d5f3c6e94'
+down_revision: Union[str, None] = '6f2b9c4e8a17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('bootstrap_state',
+    sa.Column('key', sa.String(length=64), nullable=False),
+    sa.Column('user_id', sa.UUID(), nullable=True),
+    sa.Column('claimed_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('key')
+    )
+    # Databases that already have users have had their first admin
+    op.execute("INSERT INTO bootstrap_state (key) SELECT 'first_admin' WHERE EXISTS (SELECT 1 FROM users)")
+
+
+def downgrade() -> None:
+    op.drop_table('bootstrap_state')
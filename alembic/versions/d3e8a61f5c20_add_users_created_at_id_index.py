@@ -0,0 +1,25 @@
+"""add (created_at, id) index for keyset pagination of users
+
+Revision ID: d3e8a61f5c20
+Revises: 4c7a2e9d1b58
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd3e8a61f5c20'
+down_revision: Union[str, None] = '4c7a2e9d1b58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_users_created_at_id', 'users', ['created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_users_created_at_id', table_name='users')
@@ -1,16 +1,18 @@
-from celery import Celery
+from builtins import dict, getattr, int, max
+import logging
+import os
+from typing import Any, Dict, Optional
+
+from celery import Celery, signals
+from celery.worker.control import inspect_command
 from kombu import Exchange, Queue
 
 from app.database import Database
 from app.dependencies import get_settings
+from app.utils.pool_metrics import pool_gauges
 
 settings = get_settings()
-
-Database.initialize(
-    database_url     = None,
-    sync_database_url= settings.sync_database_url,
-    echo             = settings.debug
-)
+logger = logging.getLogger(__name__)
 
 celery = Celery(
     "myapp",
@@ -37,3 +39,76 @@ celery.conf.update(
         "reports.generate": {"queue": "reports", "routing_key": "reports.generate"},
     },
 )
+
+# The sync engine is created per process, never at import time: prefork children would
+# otherwise inherit the parent's engine and share its sockets.
+_worker_concurrency: Optional[int] = None
+
+
+def worker_pool_options(concurrency: int) -> Dict[str, Any]:
+    """Pool limits of one worker process, so that all `concurrency` processes together stay within the budget."""
+    per_process = max(1, settings.celery_db_connection_budget // max(1, concurrency))
+    return {"pool_size": per_process, "max_overflow": 0}
+
+
+def _initialize_sync_database(concurrency: int) -> None:
+    Database.initialize(
+        database_url=None,
+        sync_database_url=settings.sync_database_url,
+        echo=settings.debug,
+        pool_options=worker_pool_options(concurrency),
+        shard_urls=settings.database_shard_urls,
+    )
+
+
+@signals.worker_init.connect
+def capture_worker_concurrency(sender=None, **kwargs) -> None:
+    """Remember `--concurrency` in the parent so forked children can size their pools from it."""
+    global _worker_concurrency
+    _worker_concurrency = getattr(sender, "concurrency", None) or celery.conf.worker_concurrency or os.cpu_count()
+
+
+@signals.worker_process_init.connect
+def init_worker_process_database(**kwargs) -> None:
+    """Give each prefork child its own sync engine with its share of the connection budget."""
+    Database.dispose_sync(close=False)  # drop anything inherited from the parent
+    _initialize_sync_database(_worker_concurrency or 1)
+    logger.info("Worker process %d: sync pool limits %s", os.getpid(), worker_pool_options(_worker_concurrency or 1))
+
+
+@signals.worker_process_shutdown.connect
+def dispose_worker_process_database(**kwargs) -> None:
+    Database.dispose_sync()
+
+
+@signals.task_prerun.connect
+def ensure_sync_database(**kwargs) -> None:
+    """
+    Lazily create the engine where no child process is forked (solo/threads pools, eager
+    execution in the web process); a single process may then use the whole budget.
+    """
+    if Database._sync_engine is None:
+        _initialize_sync_database(1)
+
+
+def worker_connection_stats() -> Dict[str, Any]:
+    """Connections held by the current process's sync engine, next to its configured limits."""
+    stats: Dict[str, Any] = {"pid": os.getpid(), "concurrency": _worker_concurrency}
+    if Database._sync_engine is not None:
+        gauges = pool_gauges(Database._sync_engine.pool)
+        stats.update(gauges)
+        stats["connections"] = gauges.get("checked_in", 0) + gauges.get("checked_out", 0)
+    return stats
+
+
+@inspect_command()
+def db_connections(state, **kwargs) -> Dict[str, Any]:
+    """`celery inspect db_connections`: the worker's connection limits across its child processes."""
+    concurrency = _worker_concurrency or 1
+    options = worker_pool_options(concurrency)
+    return {
+        "concurrency": concurrency,
+        "budget": settings.celery_db_connection_budget,
+        "per_process": options,
+        "max_connections": concurrency * (options["pool_size"] + options["max_overflow"]),
+    }
@@ -1,4 +1,4 @@
-from app.celery.celery_app import celery
+from app.celery.celery_app import celery, worker_connection_stats
 from app.dependencies import get_email_service, get_sync_db
 from app.models.user_model import User
 
@@ -6,6 +6,11 @@ from app.models.user_model import User
 def verification_task(*args, **kwargs):
     return True
 
+@celery.task(name="workers.db_connections", queue="default")
+def db_connections_task():
+    """Report the database connections held by the worker process that runs this task."""
+    return worker_connection_stats()
+
 @celery.task(name="account.send_verification", queue="account_notifications")
 def verify_email_task(
     user_id: int,
@@ -1,32 +1,185 @@
-from typing import Optional
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, List, Optional, Tuple, Type
 
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import declarative_base, sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy.engine import Connection, make_url
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncConnection, AsyncSession
+from sqlalchemy.ext.horizontal_shard import ShardedSession
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
+from sqlalchemy import create_engine, event
+
+from app.utils.pool_metrics import InstrumentedAsyncQueuePool, InstrumentedQueuePool, PoolMetrics
+from app.utils.sharding import DIRECTORY_SHARD, ShardRouter, sync_url
+from app.utils.slow_query_log import instrument_slow_query_log
+from app.utils.statement_cache import asyncpg_connect_args, instrument_engine, is_asyncpg_url
+from app.utils.statement_stats import instrument_statement_stats
+from settings.config import settings
 
 Base = declarative_base()
+logger = logging.getLogger(__name__)
+
+# Session.info keys used for primary/replica routing
+USE_PRIMARY_KEY = "use_primary"
+READ_YOUR_WRITES_KEY = "read_your_writes_key"
+# Session.info keys describing the current transaction (used to decide whether it can be replayed)
+TXN_HAS_WRITES_KEY = "txn_has_writes"
+COMMIT_COUNT_KEY = "commit_count"
+# Session.info key of the callbacks deferred until the current transaction commits
+AFTER_COMMIT_KEY = "after_commit_callbacks"
+
+
+def call_after_commit(session, callback: Callable, *args, **kwargs) -> None:
+    """
+    Run `callback(*args, **kwargs)` once the session's current transaction has committed,
+    e.g. to enqueue a Celery task only for data that is actually persisted. A rollback
+    discards the pending callbacks.
+    """
+    session.info.setdefault(AFTER_COMMIT_KEY, []).append((callback, args, kwargs))
+
+
+def run_after_commit_callbacks(session) -> None:
+    """Run and clear the callbacks registered with `call_after_commit`."""
+    for callback, args, kwargs in session.info.pop(AFTER_COMMIT_KEY, []):
+        try:
+            callback(*args, **kwargs)
+        except Exception as e:
+            # The data is committed already; a failed side effect must not fail the request
+            logger.error(f"After-commit callback {callback!r} failed: {e}")
 
 class Database:
     """Handles database connections and sessions."""
     _async_engine = None
     _async_session_factory = None
+    _async_pool_metrics: Optional[PoolMetrics] = None
 
     _sync_engine = None
     _sync_session_factory = None
+    _sync_pool_metrics: Optional[PoolMetrics] = None
+
+    _replica_engines: List = []
+    _replica_session_factories: List[sessionmaker] = []
+    _replica_cursor = 0
+    # read-your-writes key -> monotonic deadline until which that client reads from the primary
+    _recent_writers: "OrderedDict[Hashable, float]" = OrderedDict()
+    _max_recent_writers = 10_000
+
+    # Hash sharding of users: shard id -> engine; the primary engine serves as the directory
+    _shard_router: Optional[ShardRouter] = None
+    _shard_engines: Dict[str, Any] = {}
+    _sync_shard_engines: Dict[str, Any] = {}
+
+    @staticmethod
+    def _pool_options(url: str, pool_options: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Build the pool keyword arguments for `url` from settings, overridden by `pool_options`.
+
+        SQLite uses single-connection/static pools that reject sizing arguments, so only
+        liveness and recycling options are applied there.
+        """
+        options = {
+            "pool_size": settings.db_pool_size,
+            "max_overflow": settings.db_max_overflow,
+            "pool_timeout": settings.db_pool_timeout,
+            "pool_recycle": settings.db_pool_recycle,
+            "pool_pre_ping": settings.db_pool_pre_ping,
+            "pool_use_lifo": settings.db_pool_use_lifo,
+        }
+        options.update(pool_options or {})
+        if make_url(url).get_backend_name() == "sqlite":
+            return {key: options[key] for key in ("pool_recycle", "pool_pre_ping")}
+        return options
+
+    @classmethod
+    def _create_async_engine(cls, url: str, echo: bool, pool_options: Optional[Dict[str, Any]], metrics_name: str):
+        options = cls._pool_options(url, pool_options)
+        if "pool_size" in options:
+            options["poolclass"] = InstrumentedAsyncQueuePool
+        if is_asyncpg_url(url):
+            options["connect_args"] = asyncpg_connect_args()
+        engine = create_async_engine(url, echo=echo, future=True, **options)
+        engine.pool.metrics = PoolMetrics(metrics_name)
+        if is_asyncpg_url(url):
+            instrument_engine(engine)
+        if settings.db_statement_stats_enabled:
+            instrument_statement_stats(engine)
+        instrument_slow_query_log(engine)
+        return engine
+
+    @classmethod
+    def _create_sync_engine(cls, url: str, echo: bool, pool_options: Optional[Dict[str, Any]], metrics_name: str):
+        options = cls._pool_options(url, pool_options)
+        if "pool_size" in options:
+            options["poolclass"] = InstrumentedQueuePool
+        engine = create_engine(url, echo=echo, future=True, **options)
+        engine.pool.metrics = PoolMetrics(metrics_name)
+        if settings.db_statement_stats_enabled:
+            instrument_statement_stats(engine)
+        instrument_slow_query_log(engine)
+        return engine
 
     @classmethod
-    def initialize(cls, database_url: Optional[str], sync_database_url: Optional[str], echo: bool = False):
-        """Initialize the async engine and sessionmaker."""
+    def _shard_session_options(cls, directory_engine, shard_engines: Dict[str, Any]) -> Dict[str, Any]:
+        """`ShardedSession` arguments routing users to `shard_engines` and everything else to `directory_engine`."""
+        router = cls._shard_router
+        return {
+            "shards": {DIRECTORY_SHARD: directory_engine, **shard_engines},
+            "shard_chooser": router.shard_chooser,
+            "identity_chooser": router.identity_chooser,
+            "execute_chooser": router.execute_chooser,
+        }
+
+    @classmethod
+    def initialize(cls, database_url: Optional[str], sync_database_url: Optional[str], echo: bool = False,
+                   pool_options: Optional[Dict[str, Any]] = None, replica_urls: Optional[List[str]] = None,
+                   shard_urls: Optional[List[str]] = None):
+        """
+        Initialize the async engine and sessionmaker, plus one read-only engine per replica URL.
+
+        With `shard_urls`, users are hash-sharded across those databases (see
+        `app.utils.sharding`) and the primary database only holds the email directory and
+        other unsharded tables. The sync engine is sharded the same way, using the
+        synchronous driver of each shard URL. Shards may only ever be appended, followed by
+        `python -m app.utils.shard_rebalance`.
+        """
+        if shard_urls and replica_urls:
+            raise ValueError("Read replicas cannot be combined with sharding.")
+        if shard_urls and cls._shard_router is None:
+            cls._shard_router = ShardRouter([f"shard_{index}" for index in range(len(shard_urls))])
+
         if database_url and cls._async_engine is None:  # Ensure engine is created once
-            cls._async_engine = create_async_engine(database_url, echo=echo, future=True)
+            cls._async_engine = cls._create_async_engine(database_url, echo, pool_options, "async")
+            cls._async_pool_metrics = cls._async_engine.pool.metrics
             cls._async_session_factory = sessionmaker(
                 bind=cls._async_engine, class_=AsyncSession, expire_on_commit=False, future=True
             )
 
-        if sync_database_url and cls._sync_engine is None:
-            cls._sync_engine = create_engine(
-                sync_database_url, echo=echo, future=True
+        if shard_urls and cls._async_engine is not None and not cls._shard_engines:
+            cls._shard_engines = {
+                shard_id: cls._async_engine if url == database_url else cls._create_async_engine(url, echo, pool_options, shard_id)
+                for shard_id, url in zip(cls._shard_router.shard_ids, shard_urls)
+            }
+            cls._async_session_factory = sessionmaker(
+                class_=AsyncSession, sync_session_class=ShardedSession, expire_on_commit=False, future=True,
+                **cls._shard_session_options(
+                    cls._async_engine.sync_engine,
+                    {shard_id: engine.sync_engine for shard_id, engine in cls._shard_engines.items()},
+                ),
             )
+
+        if replica_urls and not cls._replica_engines:
+            for index, replica_url in enumerate(replica_urls):
+                engine = cls._create_async_engine(replica_url, echo, pool_options, f"replica_{index}")
+                cls._replica_engines.append(engine)
+                cls._replica_session_factories.append(sessionmaker(
+                    bind=engine, class_=AsyncSession, expire_on_commit=False, future=True
+                ))
+
+        if sync_database_url and cls._sync_engine is None:
+            cls._sync_engine = cls._create_sync_engine(sync_database_url, echo, pool_options, "sync")
+            cls._sync_pool_metrics = cls._sync_engine.pool.metrics
             cls._sync_session_factory = sessionmaker(
                 bind=cls._sync_engine,
                 autocommit=False,
@@ -34,6 +187,32 @@ class Database:
                 future=True,
             )
 
+        if shard_urls and cls._sync_engine is not None and not cls._sync_shard_engines:
+            cls._sync_shard_engines = {
+                shard_id: cls._create_sync_engine(sync_url(url), echo, pool_options, f"sync_{shard_id}")
+                for shard_id, url in zip(cls._shard_router.shard_ids, shard_urls)
+            }
+            cls._sync_session_factory = sessionmaker(
+                class_=ShardedSession, autocommit=False, autoflush=False, future=True,
+                **cls._shard_session_options(cls._sync_engine, cls._sync_shard_engines),
+            )
+
+    @classmethod
+    def dispose_sync(cls, close: bool = True) -> None:
+        """
+        Dispose of the sync engine and forget it, so that the next `initialize` builds a new one.
+
+        A forked child must pass `close=False`: the inherited connections still belong to
+        the parent, so they are dereferenced without sending anything over their sockets.
+        """
+        for engine in [cls._sync_engine, *cls._sync_shard_engines.values()]:
+            if engine is not None:
+                engine.dispose(close=close)
+        cls._sync_shard_engines = {}
+        cls._sync_engine = None
+        cls._sync_session_factory = None
+        cls._sync_pool_metrics = None
+
     @classmethod
     def get_async_factory(cls) -> sessionmaker:
             if cls._async_session_factory is None:
@@ -46,3 +225,167 @@ class Database:
             raise RuntimeError("Sync engine not initialized.")
         return cls._sync_session_factory
 
+    @classmethod
+    @asynccontextmanager
+    async def unit_of_work(cls, commit_on: Tuple[Type[BaseException], ...] = ()) -> AsyncIterator[AsyncSession]:
+        """
+        Session that commits exactly once when the block finishes, or rolls back if it raises.
+
+        Code inside the block only flushes; side effects registered with `call_after_commit`
+        run after the commit. Read-only blocks skip the commit and let `close()` end the
+        transaction. Exceptions listed in `commit_on` are expected outcomes (e.g. an HTTP
+        401 after recording a failed login) and still commit before propagating.
+        """
+        async with cls.get_async_factory()() as session:
+            try:
+                yield session
+            except commit_on:
+                await cls._commit_if_needed(session)
+                raise
+            except Exception:
+                await session.rollback()
+                raise
+            else:
+                await cls._commit_if_needed(session)
+
+    @staticmethod
+    async def _commit_if_needed(session: AsyncSession) -> None:
+        if (session.info.get(TXN_HAS_WRITES_KEY) or session.info.get(AFTER_COMMIT_KEY)
+                or session.new or session.dirty or session.deleted):
+            await session.commit()
+
+    @classmethod
+    def async_engines(cls) -> List:
+        """The primary async engine followed by the replica and shard engines."""
+        engines = [cls._async_engine] if cls._async_engine is not None else []
+        shards = [engine for engine in cls._shard_engines.values() if engine is not cls._async_engine]
+        return engines + list(cls._replica_engines) + shards
+
+    @classmethod
+    def is_sharded(cls) -> bool:
+        return cls._shard_router is not None
+
+    @classmethod
+    def shard_for(cls, user_id: Hashable) -> str:
+        """Id of the shard that holds (or will hold) the user with `user_id`."""
+        return cls._shard_router.shard_for(user_id)
+
+    @classmethod
+    def shard_engines(cls) -> Dict[str, Any]:
+        return dict(cls._shard_engines)
+
+    @classmethod
+    def dialect(cls, session):
+        """The dialect behind an async or sync `session` (or connection), e.g. to check `update_returning`."""
+        if isinstance(session, (AsyncConnection, Connection)):
+            return session.dialect
+        # Sharded sessions have no single bind; the directory and the shards share a dialect
+        bind = getattr(session, "sync_session", session).bind or cls._async_engine
+        return bind.dialect
+
+    @classmethod
+    def dialect_name(cls, session) -> str:
+        """Name of the dialect behind an async or sync `session`."""
+        return cls.dialect(session).name
+
+    @classmethod
+    def insert(cls, session, entity):
+        """An INSERT of `entity` supporting `on_conflict_do_nothing()`/`on_conflict_do_update()` on the database behind `session`."""
+        dialect = postgresql if cls.dialect_name(session) == "postgresql" else sqlite
+        return dialect.insert(entity)
+
+    @classmethod
+    def get_read_factory(cls) -> sessionmaker:
+        """Sessionmaker of the next replica (round robin), or of the primary when none are configured."""
+        if not cls._replica_session_factories:
+            return cls.get_async_factory()
+        factory = cls._replica_session_factories[cls._replica_cursor % len(cls._replica_session_factories)]
+        cls._replica_cursor += 1
+        return factory
+
+    @classmethod
+    def pin_to_primary(cls, session: AsyncSession) -> None:
+        """Route every further read of `session` to the primary (e.g. at the start of a write path)."""
+        session.info[USE_PRIMARY_KEY] = True
+
+    @classmethod
+    def mark_written(cls, key: Hashable) -> None:
+        """Start the read-your-writes window for `key`."""
+        cls._recent_writers.pop(key, None)
+        cls._recent_writers[key] = time.monotonic() + settings.read_your_writes_seconds
+        while len(cls._recent_writers) > cls._max_recent_writers:
+            cls._recent_writers.popitem(last=False)
+
+    @classmethod
+    def recently_wrote(cls, key: Optional[Hashable]) -> bool:
+        if key is None:
+            return False
+        deadline = cls._recent_writers.get(key)
+        if deadline is None:
+            return False
+        if deadline < time.monotonic():
+            del cls._recent_writers[key]
+            return False
+        return True
+
+    @classmethod
+    @asynccontextmanager
+    async def read_session(cls, session: AsyncSession) -> AsyncIterator[AsyncSession]:
+        """
+        Yield a session for a read-only query issued on behalf of `session`.
+
+        Reads go to a replica unless no replica is configured, `session` has already written
+        (or was pinned to the primary), or its client wrote within the read-your-writes window;
+        in those cases `session` itself is yielded.
+        """
+        if (not cls._replica_session_factories
+                or session.info.get(USE_PRIMARY_KEY)
+                or cls.recently_wrote(session.info.get(READ_YOUR_WRITES_KEY))):
+            yield session
+            return
+        async with cls.get_read_factory()() as replica_session:
+            yield replica_session
+
+    @classmethod
+    def pool_stats(cls) -> Dict[str, Dict]:
+        """Checkout wait histogram and live occupancy for every initialized engine."""
+        stats = {}
+        if cls._async_engine is not None:
+            stats["async"] = cls._async_pool_metrics.snapshot(cls._async_engine.pool)
+        for engine in [*cls._replica_engines, *cls._shard_engines.values(), *cls._sync_shard_engines.values()]:
+            stats[engine.pool.metrics.name] = engine.pool.metrics.snapshot(engine.pool)
+        if cls._sync_engine is not None:
+            stats["sync"] = cls._sync_pool_metrics.snapshot(cls._sync_engine.pool)
+        return stats
+
+
+def _record_write(session: Session) -> None:
+    session.info[USE_PRIMARY_KEY] = True
+    session.info[TXN_HAS_WRITES_KEY] = True
+
+
+@event.listens_for(Session, "after_flush")
+def _record_flush(session: Session, flush_context) -> None:
+    _record_write(session)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _record_bulk_write(orm_execute_state) -> None:
+    if not orm_execute_state.is_select:
+        _record_write(orm_execute_state.session)
+
+
+@event.listens_for(Session, "after_commit")
+def _end_transaction(session: Session) -> None:
+    key = session.info.get(READ_YOUR_WRITES_KEY)
+    if key is not None and session.info.get(TXN_HAS_WRITES_KEY):
+        Database.mark_written(key)
+    session.info[TXN_HAS_WRITES_KEY] = False
+    session.info[COMMIT_COUNT_KEY] = session.info.get(COMMIT_COUNT_KEY, 0) + 1
+    run_after_commit_callbacks(session)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_transaction(session: Session) -> None:
+    session.info[TXN_HAS_WRITES_KEY] = False
+    session.info.pop(AFTER_COMMIT_KEY, None)
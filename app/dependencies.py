@@ -1,16 +1,19 @@
 from builtins import Exception, dict, str
+import hashlib
 from contextlib import contextmanager
 from typing import Generator
 
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.database import Database
+from app.database import Database, READ_YOUR_WRITES_KEY
 from app.utils.template_manager import TemplateManager
 from app.services.email_service import EmailService
 from app.services.jwt_service import decode_token
+from app.utils.client_address import client_address
+from app.utils.db_retry import RETRY_BUDGET_KEY, RetryBudget
 from settings.config import Settings
 from fastapi import Depends
 
@@ -22,10 +25,22 @@ def get_email_service() -> EmailService:
     template_manager = TemplateManager()
     return EmailService(template_manager=template_manager)
 
-async def get_db() -> AsyncSession:
-    """Dependency that provides a database session for each request."""
-    async_session_factory = Database.get_async_factory()
-    async with async_session_factory() as session:
+def _read_your_writes_key(request: Request):
+    """Identify the client for read-your-writes routing by its bearer token, falling back to its address."""
+    authorization = request.headers.get("authorization")
+    if authorization:
+        return hashlib.sha256(authorization.encode("utf-8")).hexdigest()
+    return client_address(request.scope)
+
+async def get_db(request: Request) -> AsyncSession:
+    """
+    Dependency that provides a request-scoped unit of work: services only flush, and the
+    session commits once after the endpoint succeeds (or rolls back if it raises).
+    An `HTTPException` is a regular response, so work done before it is still committed.
+    """
+    async with Database.unit_of_work(commit_on=(HTTPException,)) as session:
+        session.info[READ_YOUR_WRITES_KEY] = _read_your_writes_key(request)
+        session.info[RETRY_BUDGET_KEY] = RetryBudget(get_settings().db_retry_budget)
         yield session
 
 @contextmanager
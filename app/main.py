@@ -1,11 +1,16 @@
-from builtins import Exception
+from builtins import Exception, str
+import asyncio
 from fastapi import FastAPI
 from starlette.responses import JSONResponse
 from starlette.middleware.cors import CORSMiddleware  # Import the CORSMiddleware
 from app.database import Database
 from app.dependencies import get_settings
-from app.routers import user_routes
+from app.routers import admin_routes, user_routes
 from app.utils.api_description import getDescription
+from app.utils.query_budget import QueryBudgetMiddleware
+from app.utils.hashing_admission import HashingClientMiddleware, HashingOverloaded
+from app.utils.security import calibrate_hashing, default_hasher, shutdown_hashing_executor
+from app.utils.statement_cache import SchemaRevisionWatcher, is_asyncpg_url
 app = FastAPI(
     title="User Management",
     description=getDescription(),
@@ -27,16 +32,43 @@ app.add_middleware(
     allow_methods=["*"],  # Allowed HTTP methods
     allow_headers=["*"],  # Allowed HTTP headers
 )
+# Counts the statements of each request against the route's @query_budget
+app.add_middleware(QueryBudgetMiddleware)
+# Identifies the client for fair admission to the password hashing pool
+app.add_middleware(HashingClientMiddleware)
 
 @app.on_event("startup")
 async def startup_event():
     settings = get_settings()
-    Database.initialize(settings.database_url, None, settings.debug)
+    Database.initialize(settings.database_url, None, settings.debug, replica_urls=settings.database_replica_urls,
+                        shard_urls=settings.database_shard_urls)
+    # Fails on an unknown (or not installed) password_hash_algorithm before the first login does
+    default_hasher()
+    # Tune the bcrypt cost to this host; stored hashes of another cost are rehashed on login
+    if settings.password_hash_target_ms > 0 and default_hasher().name == "bcrypt":
+        await calibrate_hashing()
+    # Re-prepare cached statements after migrations instead of failing on the first stale one
+    if settings.db_schema_check_interval > 0 and is_asyncpg_url(settings.database_url):
+        watcher = SchemaRevisionWatcher(Database.async_engines())
+        app.state.schema_watcher_task = asyncio.create_task(watcher.run(settings.db_schema_check_interval))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    watcher_task = getattr(app.state, "schema_watcher_task", None)
+    if watcher_task is not None:
+        watcher_task.cancel()
+    shutdown_hashing_executor()
+
+@app.exception_handler(HashingOverloaded)
+async def hashing_overloaded_handler(request, exc: HashingOverloaded):
+    return JSONResponse(status_code=exc.status_code, content={"message": "Too many logins in progress, please retry."},
+                        headers={"Retry-After": str(exc.retry_after)})
 
 @app.exception_handler(Exception)
 async def exception_handler(request, exc):
     return JSONResponse(status_code=500, content={"message": "An unexpected error occurred."})
 
 app.include_router(user_routes.router)
+app.include_router(admin_routes.router)
 
 
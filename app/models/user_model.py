@@ -3,7 +3,7 @@ from datetime import datetime
 from enum import Enum
 import uuid
 from sqlalchemy import (
-    Column, String, Integer, DateTime, Boolean, func, Enum as SQLAlchemyEnum
+    BigInteger, Column, String, Integer, DateTime, Boolean, Index, func, Enum as SQLAlchemyEnum
 )
 from sqlalchemy.dialects.postgresql import UUID, ENUM
 from sqlalchemy.orm import Mapped, mapped_column
@@ -52,6 +52,8 @@ class User(Base):
     """
     __tablename__ = "users"
     __mapper_args__ = {"eager_defaults": True}
+    # Keyset pagination walks users in (created_at, id) order
+    __table_args__ = (Index("ix_users_created_at_id", "created_at", "id"),)
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     nickname: Mapped[str] = Column(String(50), unique=True, nullable=False, index=True)
@@ -95,3 +97,48 @@ class User(Base):
         """Updates the professional status and logs the update time."""
         self.is_professional = status
         self.professional_status_updated_at = func.now()
+
+
+class UserDirectory(Base):
+    """
+    Email -> shard directory of sharded user storage (see `app.utils.sharding`).
+
+    Lives on the primary database and lets lookups by email, such as login, go to the one
+    shard holding the user instead of all of them. The primary key and the nickname's
+    unique constraint also keep emails and nicknames unique across shards.
+    """
+    __tablename__ = "user_directory"
+
+    email: Mapped[str] = Column(String(255), primary_key=True)
+    nickname: Mapped[str] = Column(String(50), unique=True, nullable=True)
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), unique=True, nullable=False, index=True)
+    shard_id: Mapped[str] = Column(String(64), nullable=False)
+
+
+class UserCounter(Base):
+    """
+    Number of users per role, maintained in the same transaction as the writes that change
+    it (see `app.services.user_count_service`) so listing pages need no `count(*)`.
+
+    Each role is spread over a few slots picked at random, so concurrent registrations
+    rarely wait on the same row; a count is the sum of the slots.
+    """
+    __tablename__ = "user_counters"
+
+    role: Mapped[str] = Column(String(32), primary_key=True)
+    slot: Mapped[int] = Column(Integer, primary_key=True)
+    count: Mapped[int] = Column(BigInteger, nullable=False, default=0)
+
+
+class BootstrapState(Base):
+    """
+    One-time bootstrap steps of the application, such as electing the first admin.
+
+    A step is claimed by inserting its row; the primary key lets exactly one transaction
+    succeed however many race for it.
+    """
+    __tablename__ = "bootstrap_state"
+
+    key: Mapped[str] = Column(String(64), primary_key=True)
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), nullable=True)
+    claimed_at: Mapped[datetime] = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,99 @@
+"""
+Operational endpoints for administrators.
+
+These routes expose runtime diagnostics of the service (database connection pools and
+similar internals) so that capacity can be tuned against real traffic. All of them
+require the ADMIN role.
+"""
+
+from builtins import dict, int, str
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from app.database import Database
+from app.dependencies import get_settings, require_role
+from app.services.jwt_service import token_cache
+from app.utils.db_retry import retry_stats
+from app.utils.hashing_admission import hashing_admission
+from app.utils.security import default_hasher, target_rounds
+from app.utils.slow_query_log import slow_query_log
+from app.utils.statement_cache import statement_cache_metrics
+from app.utils.statement_stats import StatementStats, statement_stats
+
+settings = get_settings()
+
+router = APIRouter(prefix="/admin", tags=["Administration Requires (Admin Role)"])
+
+
+@router.get("/db/pool", name="db_pool_stats")
+async def db_pool_stats(current_user: dict = Depends(require_role(["ADMIN"]))):
+    """
+    Connection pool statistics for the async (and, if initialized, sync) engine.
+
+    Reports checked-out and overflow connections together with a histogram of how
+    long requests waited to obtain a connection.
+    """
+    return Database.pool_stats()
+
+
+@router.get("/db/retries", name="db_retry_stats")
+async def db_retry_stats(current_user: dict = Depends(require_role(["ADMIN"]))):
+    """Counters of retried and given-up database operations, by error class."""
+    return retry_stats.snapshot()
+
+
+@router.get("/db/statement-cache", name="db_statement_cache_stats")
+async def db_statement_cache_stats(current_user: dict = Depends(require_role(["ADMIN"]))):
+    """Prepared-statement cache hits, misses and schema-change invalidations of the asyncpg engine."""
+    return statement_cache_metrics.snapshot()
+
+
+@router.get("/db/statements", name="db_statement_stats")
+async def db_statement_stats(
+    order_by: str = Query("total_ms", description="One of total_ms, mean_ms, p99_ms, calls, rows"),
+    limit: Optional[int] = Query(50, ge=1),
+    current_user: dict = Depends(require_role(["ADMIN"])),
+):
+    """
+    Per-statement statistics (pg_stat_statements-style) for every engine of this process:
+    calls, total/mean/p99/max latency and rows, keyed by the normalized SQL.
+    """
+    if order_by not in StatementStats.ORDERINGS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"order_by must be one of {', '.join(StatementStats.ORDERINGS)}")
+    return statement_stats.snapshot(order_by=order_by, limit=limit)
+
+
+@router.delete("/db/statements", name="reset_db_statement_stats", status_code=status.HTTP_204_NO_CONTENT)
+async def reset_db_statement_stats(current_user: dict = Depends(require_role(["ADMIN"]))):
+    """Discard the collected statement statistics."""
+    statement_stats.reset()
+
+
+@router.get("/db/slow-queries", name="db_slow_queries")
+async def db_slow_queries(current_user: dict = Depends(require_role(["ADMIN"]))):
+    """
+    Statements slower than the configured threshold, most recent first, with their
+    bind-parameter types, the calling service method and the captured query plan.
+    """
+    return {"threshold_ms": settings.db_slow_query_threshold_ms, "queries": slow_query_log.entries()}
+
+
+@router.delete("/db/slow-queries", name="reset_db_slow_queries", status_code=status.HTTP_204_NO_CONTENT)
+async def reset_db_slow_queries(current_user: dict = Depends(require_role(["ADMIN"]))):
+    """Clear the slow-query log."""
+    slow_query_log.reset()
+
+
+@router.get("/password-hashing", name="password_hashing_stats")
+async def password_hashing_stats(current_user: dict = Depends(require_role(["ADMIN"]))):
+    """
+    Load of the password hashing pool: calls running and waiting, a histogram of how long
+    calls waited for a worker, the calls rejected by admission control, by reason, and the
+    algorithm and bcrypt cost of new hashes.
+    """
+    return {**hashing_admission.snapshot(), "algorithm": default_hasher().name, "rounds": target_rounds()}
+
+
+@router.get("/token-cache", name="token_cache_stats")
+async def token_cache_stats(current_user: dict = Depends(require_role(["ADMIN"]))):
+    """Hits, misses and evictions of the cache of verified access tokens."""
+    return token_cache.snapshot()
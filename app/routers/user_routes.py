@@ -18,20 +18,29 @@ Key Highlights:
 - Utilizes OAuth2PasswordBearer for securing API endpoints, requiring valid access tokens for operations.
 """
 
-from builtins import dict, int, len, str
-from datetime import timedelta
+from builtins import ValueError, dict, int, len, str
+from typing import Optional
+from datetime import datetime, timedelta
 from logging import getLogger
 from uuid import UUID
 from fastapi import APIRouter, Depends, HTTPException, Response, status, Request
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.dependencies import get_current_user, get_db, get_email_service, require_role
+from app.database import Database
+from app.models.user_model import UserRole
 from app.schemas.pagination_schema import EnhancedPagination
 from app.schemas.token_schema import TokenResponse
-from app.schemas.user_schemas import LoginRequest, UserBase, UserCreate, UserListResponse, UserResponse, UserUpdate
-from app.services.user_service import UserService
+from app.schemas.user_schemas import LoginRequest, UserBase, UserBulkActionReport, UserBulkActionRequest, UserCreate, UserImportReport, UserListResponse, UserResponse, UserUpdate
+from app.services.user_service import EmailAlreadyExists, NicknameUnavailable, UserService
+from app.services.user_bulk_action_service import UserBulkActionService
+from app.services.user_export_service import FORMATS as EXPORT_FORMATS, UserExportService
+from app.services.user_import_service import CONTENT_TYPES, FORMATS, UserImportService, iter_lines, iter_rows
 from app.services.jwt_service import create_access_token
+from app.utils.cursor_pagination import decode_cursor, encode_cursor
 from app.utils.link_generation import create_user_links, generate_pagination_links
+from app.utils.query_budget import query_budget
 from app.dependencies import get_settings
 from app.services.email_service import EmailService
 router = APIRouter()
@@ -39,7 +48,41 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 settings = get_settings()
 
 logger = getLogger(__name__)
+
+
+# Declared before /users/{user_id}, which would otherwise take "export" for a user id
+@router.get("/users/export", tags=["User Management Requires (Admin or Manager Roles)"], name="export_users")
+async def export_users(
+    format: str = "ndjson",
+    columns: Optional[str] = None,
+    role: Optional[UserRole] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    gzip: bool = False,
+    token: str = Depends(oauth2_scheme),
+    current_user: dict = Depends(require_role(["ADMIN"]))
+):
+    """
+    Stream all users (or those with `role`, created in `[created_after, created_before)`)
+    as NDJSON or CSV, gzipped with `gzip=true`. `columns` is a comma-separated subset of
+    the exported columns; credentials are never exported.
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Format must be one of: {', '.join(EXPORT_FORMATS)}")
+    try:
+        selected = UserExportService.columns(columns)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    filename = f"users.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        UserExportService.stream(Database.get_read_factory(), format, selected, role, created_after, created_before, gzip),
+        media_type="application/gzip" if gzip else EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
 @router.get("/users/{user_id}", response_model=UserResponse, name="get_user", tags=["User Management Requires (Admin or Manager Roles)"])
+@query_budget(1)
 async def get_user(user_id: UUID, request: Request, db: AsyncSession = Depends(get_db), token: str = Depends(oauth2_scheme), current_user: dict = Depends(require_role(["ADMIN", "MANAGER"]))):
     """
     Endpoint to fetch a user by their unique identifier (UUID).
@@ -82,6 +125,7 @@ async def get_user(user_id: UUID, request: Request, db: AsyncSession = Depends(g
 # experience by adhering to REST principles and providing self-discoverable operations.
 
 @router.put("/users/{user_id}", response_model=UserResponse, name="update_user", tags=["User Management Requires (Admin or Manager Roles)"])
+@query_budget(2)
 async def update_user(user_id: UUID, user_update: UserUpdate, request: Request, db: AsyncSession = Depends(get_db), token: str = Depends(oauth2_scheme), current_user: dict = Depends(require_role(["ADMIN", "MANAGER"]))):
     """
     Update user information.
@@ -113,6 +157,7 @@ async def update_user(user_id: UUID, user_update: UserUpdate, request: Request,
 
 
 @router.delete("/users/{user_id}", status_code=status.HTTP_204_NO_CONTENT, name="delete_user", tags=["User Management Requires (Admin or Manager Roles)"])
+@query_budget(2)
 async def delete_user(user_id: UUID, db: AsyncSession = Depends(get_db), token: str = Depends(oauth2_scheme), current_user: dict = Depends(require_role(["ADMIN", "MANAGER"]))):
     """
     Delete a user by their ID.
@@ -127,6 +172,7 @@ async def delete_user(user_id: UUID, db: AsyncSession = Depends(get_db), token:
 
 
 @router.post("/users/", response_model=UserResponse, status_code=status.HTTP_201_CREATED, tags=["User Management Requires (Admin or Manager Roles)"], name="create_user")
+@query_budget(3, sharded=4)  # first-admin claim, insert, counter; sharded: the directory entry first
 async def create_user(user: UserCreate, request: Request, db: AsyncSession = Depends(get_db), token: str = Depends(oauth2_scheme), current_user: dict = Depends(require_role(["ADMIN", "MANAGER"]))):
     """
     Create a new user.
@@ -143,11 +189,13 @@ async def create_user(user: UserCreate, request: Request, db: AsyncSession = Dep
     Returns:
     - UserResponse: The newly created user's information along with navigation links.
     """
-    existing_user = await UserService.get_by_email(db, user.email)
-    if existing_user:
+    # The insert itself detects a taken email, so there is no separate lookup beforehand
+    try:
+        created_user = await UserService.create(db, user.model_dump())
+    except EmailAlreadyExists:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already exists")
-    
-    created_user = await UserService.create(db, user.model_dump())
+    except NicknameUnavailable:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Could not generate a unique nickname, please retry")
     if not created_user:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create user")
     
@@ -168,28 +216,75 @@ async def create_user(user: UserCreate, request: Request, db: AsyncSession = Dep
     )
 
 
+@router.post("/users/import", response_model=UserImportReport, tags=["User Management Requires (Admin or Manager Roles)"], name="import_users")
+async def import_users(request: Request, format: Optional[str] = None, db: AsyncSession = Depends(get_db), token: str = Depends(oauth2_scheme), current_user: dict = Depends(require_role(["ADMIN"]))):
+    """
+    Import users from a CSV (with a header line) or NDJSON request body, streamed rather
+    than read whole. The format is the `format` parameter, else the content type. Rows
+    are committed in batches and each failed row is reported with its line number.
+    """
+    format = format or CONTENT_TYPES.get(request.headers.get("content-type", "").split(";")[0].strip())
+    if format not in FORMATS:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail="Send text/csv or application/x-ndjson")
+    return await UserImportService.import_users(db, iter_rows(iter_lines(request.stream()), format))
+
+
+@router.post("/users/actions", response_model=UserBulkActionReport, tags=["User Management Requires (Admin or Manager Roles)"], name="bulk_user_action")
+async def bulk_user_action(action: UserBulkActionRequest, db: AsyncSession = Depends(get_db), token: str = Depends(oauth2_scheme), current_user: dict = Depends(require_role(["ADMIN"]))):
+    """
+    Lock, unlock, change the role of or grant professional status to all users matching
+    `filter` (every user when it is empty). Users are changed and committed in chunks, and
+    notified in batches; users the action would not change are skipped.
+    """
+    return await UserBulkActionService.apply(db, action.action, action.filter, action.role)
+
+
 @router.get("/users/", response_model=UserListResponse, tags=["User Management Requires (Admin or Manager Roles)"])
+@query_budget(2)
 async def list_users(
     request: Request,
     skip: int = 0,
     limit: int = 10,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(require_role(["ADMIN", "MANAGER"]))
 ):
-    total_users = await UserService.count(db)
-    users = await UserService.list_users(db, skip, limit)
+    """
+    List users ordered by creation time, either by offset (`skip`) or, for deep pages,
+    by the opaque `cursor` taken from the `next`/`prev`/`next_cursor` links of a page.
+    With `include_total=false` the total is not computed and a full page is assumed to
+    have a next one.
+    """
+    total_users = await UserService.count(db) if include_total else None
+    next_cursor = prev_cursor = None
+    if cursor is None:
+        users = await UserService.list_users(db, skip, limit)
+        has_next = skip + limit < total_users if total_users is not None else len(users) == limit
+        if users and has_next:
+            next_cursor = encode_cursor(users[-1].created_at, users[-1].id)
+    else:
+        try:
+            position = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+        users, has_more = await UserService.list_users_by_cursor(db, limit, position)
+        if users and (has_more or position.backwards):
+            next_cursor = encode_cursor(users[-1].created_at, users[-1].id)
+        if users and (has_more or not position.backwards):
+            prev_cursor = encode_cursor(users[0].created_at, users[0].id, backwards=True)
 
     user_responses = [
         UserResponse.model_validate(user) for user in users
     ]
     
-    pagination_links = generate_pagination_links(request, skip, limit, total_users)
+    pagination_links = generate_pagination_links(request, skip, limit, total_users, cursor, next_cursor, prev_cursor)
     
     # Construct the final response with pagination details
     return UserListResponse(
         items=user_responses,
         total=total_users,
-        page=skip // limit + 1,
+        page=skip // limit + 1 if cursor is None else None,
         size=len(user_responses),
         links=pagination_links  # Ensure you have appropriate logic to create these links
     )
@@ -197,26 +292,28 @@ async def list_users(
 
 @router.post("/register/", response_model=UserResponse, tags=["Login and Registration"])
 async def register(user_data: UserCreate, session: AsyncSession = Depends(get_db)):
-    user = await UserService.register_user(session, user_data.model_dump())
+    try:
+        user = await UserService.register_user(session, user_data.model_dump())
+    except EmailAlreadyExists:
+        raise HTTPException(status_code=400, detail="Email already exists")
+    except NicknameUnavailable:
+        raise HTTPException(status_code=503, detail="Could not generate a unique nickname, please retry")
     if user:
         return user
     raise HTTPException(status_code=400, detail="Email already exists")
 
 @router.post("/login/", response_model=TokenResponse, tags=["Login and Registration"])
+@query_budget(2, sharded=3)  # sharded: the directory lookup of the user's shard first
 async def login(form_data: OAuth2PasswordRequestForm = Depends(), session: AsyncSession = Depends(get_db)):
-    if await UserService.is_account_locked(session, form_data.username):
+    result = await UserService.login_user(session, form_data.username, form_data.password)
+    if result.locked:
         raise HTTPException(status_code=400, detail="Account locked due to too many failed login attempts.")
 
-    logger.error(f"form_data: {form_data}")
-    logger.error(f"form_data.username: {form_data.username}")
-    user = await UserService.login_user(session, form_data.username, form_data.password)
-    logger.error(f"user: {user}")
-
-    if user:
+    if result.user:
         access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
 
         access_token = create_access_token(
-            data={"sub": user.email, "role": str(user.role.name)},
+            data={"sub": result.user.email, "role": str(result.user.role.name)},
             expires_delta=access_token_expires
         )
 
@@ -224,23 +321,23 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), session: Async
     raise HTTPException(status_code=401, detail="Incorrect email or password.")
 
 @router.post("/login/", include_in_schema=False, response_model=TokenResponse, tags=["Login and Registration"])
+@query_budget(2, sharded=3)  # sharded: the directory lookup of the user's shard first
 async def login(form_data: OAuth2PasswordRequestForm = Depends(), session: AsyncSession = Depends(get_db)):
-    if await UserService.is_account_locked(session, form_data.username):
+    result = await UserService.login_user(session, form_data.username, form_data.password)
+    if result.locked:
         raise HTTPException(status_code=400, detail="Account locked due to too many failed login attempts.")
 
-    user = await UserService.login_user(session, form_data.username, form_data.password)
-    if user:
+    if result.user:
         access_token_expires = timedelta(minutes=settings.access_token_expire_minutes)
 
         access_token = create_access_token(
-            data={"sub": user.email, "role": str(user.role.name)},
+            data={"sub": result.user.email, "role": str(result.user.role.name)},
             expires_delta=access_token_expires
         )
 
         return {"access_token": access_token, "token_type": "bearer"}
     raise HTTPException(status_code=401, detail="Incorrect email or password.")
 
-
 @router.get("/verify-email/{user_id}/{token}", status_code=status.HTTP_200_OK, name="verify_email", tags=["Login and Registration"])
 async def verify_email(user_id: UUID, token: str, db: AsyncSession = Depends(get_db), email_service: EmailService = Depends(get_email_service)):
     """
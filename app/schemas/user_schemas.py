@@ -6,6 +6,7 @@ from enum import Enum
 import uuid
 import re
 from app.models.user_model import UserRole
+from app.schemas.pagination_schema import PaginationLink
 from app.utils.nickname_gen import generate_nickname
 
 
@@ -78,6 +79,47 @@ class UserListResponse(BaseModel):
         "linkedin_profile_url": "https://linkedin.com/in/johndoe", 
         "github_profile_url": "https://github.com/johndoe"
     }])
-    total: int = Field(..., example=100)
-    page: int = Field(..., example=1)
+    total: Optional[int] = Field(None, example=100, description="Number of users; not set when requested with include_total=false")
+    page: Optional[int] = Field(None, example=1, description="Page number; not set for cursor-paginated pages")
     size: int = Field(..., example=10)
+    links: List[PaginationLink] = Field(default_factory=list, description="Offset and cursor links to neighbouring pages")
+
+
+class UserImportError(BaseModel):
+    row: int = Field(..., example=42, description="Line of the row in the uploaded file (the CSV header is line 1)")
+    email: Optional[str] = Field(None, example="john.doe@example.com")
+    error: str = Field(..., example="Email already exists")
+
+class UserImportReport(BaseModel):
+    imported: int = Field(0, example=998)
+    failed: int = Field(0, example=2)
+    errors: List[UserImportError] = Field(default_factory=list)
+
+
+class BulkUserAction(str, Enum):
+    LOCK = "lock"
+    UNLOCK = "unlock"
+    CHANGE_ROLE = "change_role"
+    GRANT_PROFESSIONAL = "grant_professional"
+
+class UserFilter(BaseModel):
+    role: Optional[UserRole] = Field(None, example="ANONYMOUS")
+    created_after: Optional[datetime] = Field(None, example="2024-05-01T00:00:00Z", description="Inclusive")
+    created_before: Optional[datetime] = Field(None, example="2024-05-02T00:00:00Z", description="Exclusive")
+    email_verified: Optional[bool] = Field(None, example=False)
+    is_locked: Optional[bool] = Field(None, example=False)
+
+class UserBulkActionRequest(BaseModel):
+    action: BulkUserAction = Field(..., example="lock")
+    role: Optional[UserRole] = Field(None, example="AUTHENTICATED", description="New role, for change_role only")
+    filter: UserFilter = Field(default_factory=UserFilter, description="Users the action applies to; all users when empty")
+
+    @root_validator(skip_on_failure=True)
+    def check_role(cls, values):
+        if (values.get("action") == BulkUserAction.CHANGE_ROLE) != (values.get("role") is not None):
+            raise ValueError("A role must be given for change_role, and only for change_role")
+        return values
+
+class UserBulkActionReport(BaseModel):
+    action: BulkUserAction = Field(..., example="lock")
+    affected: int = Field(..., example=1200, description="Users changed; users the action would not change are skipped")
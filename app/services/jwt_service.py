@@ -1,7 +1,12 @@
 # app/services/jwt_service.py
-from builtins import dict, str
+from builtins import dict, float, int, isinstance, len, str
+import hashlib
+import threading
+import time
 import jwt
+from collections import OrderedDict
 from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
 from settings.config import settings
 
 def create_access_token(*, data: dict, expires_delta: timedelta = None):
@@ -14,9 +19,88 @@ def create_access_token(*, data: dict, expires_delta: timedelta = None):
     encoded_jwt = jwt.encode(to_encode, settings.jwt_secret_key, algorithm=settings.jwt_algorithm)
     return encoded_jwt
 
+
+class TokenCache:
+    """
+    Bounded LRU of verified token payloads, keyed by the SHA-256 digest of the token and
+    kept until the token's `exp`, so a client repeating its token skips the signature
+    check and claims validation. Only valid tokens with an `exp` are cached.
+    """
+
+    def __init__(self, max_size: Optional[int] = None):
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self.reset()
+
+    @property
+    def max_size(self) -> int:
+        return self._max_size if self._max_size is not None else settings.token_cache_size
+
+    def reset(self) -> None:
+        with self._lock:
+            self._entries: "OrderedDict[bytes, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+            self.hits = 0
+            self.misses = 0
+            self.expired = 0
+            self.evicted = 0
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """The cached payload of `token`, or None if it is not cached (or has expired)."""
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.time():
+                del self._entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[1])
+
+    def put(self, token: str, payload: Dict[str, Any]) -> None:
+        expires_at = payload.get("exp")
+        if self.max_size <= 0 or not isinstance(expires_at, (int, float)):
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (expires_at, dict(payload))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else None,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+            }
+
+
+token_cache = TokenCache()
+
+
 def decode_token(token: str):
+    """The claims of a valid token, from `token_cache` when it was verified before; None if invalid."""
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
     try:
         decoded = jwt.decode(token, settings.jwt_secret_key, algorithms=[settings.jwt_algorithm])
-        return decoded
     except jwt.PyJWTError:
         return None
+    token_cache.put(token, decoded)
+    return decoded
@@ -0,0 +1,98 @@
+"""
+Mass admin actions: lock, unlock, change the role of or grant professional status to
+every user matching a `UserFilter`, e.g. during incident response.
+
+An action runs as set-based UPDATEs of at most `bulk_action_chunk_size` users each
+(`UPDATE users ... WHERE id IN (SELECT id ... LIMIT n) RETURNING id`), committed one by
+one so that no transaction holds the locks of millions of rows. Users the action would
+not change (an unlock of an unlocked account, say) are not matched, which also lets each
+chunk simply take the next users still matching. After each commit, the notifications
+of the chunk are sent to Celery in messages of `bulk_action_notification_batch_size`.
+"""
+
+from builtins import classmethod, len, list, staticmethod
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.celery.tasks import account_locked_task, account_unlocked_task, professional_status_upgrade_task, role_upgrade_task
+from app.database import call_after_commit
+from app.models.user_model import User, UserRole
+from app.schemas.user_schemas import BulkUserAction, UserBulkActionReport, UserFilter
+from app.services.user_count_service import UserCountService
+from app.utils.cursor_pagination import sortable_timestamp
+from settings.config import settings
+
+
+class UserBulkActionService:
+    @classmethod
+    def criteria(cls, user_filter: UserFilter) -> List:
+        criteria = []
+        if user_filter.role is not None:
+            criteria.append(User.role == user_filter.role)
+        if user_filter.created_after is not None:
+            criteria.append(sortable_timestamp(User.created_at) >= sortable_timestamp(user_filter.created_after))
+        if user_filter.created_before is not None:
+            criteria.append(sortable_timestamp(User.created_at) < sortable_timestamp(user_filter.created_before))
+        if user_filter.email_verified is not None:
+            criteria.append(User.email_verified.is_(user_filter.email_verified))
+        if user_filter.is_locked is not None:
+            criteria.append(User.is_locked.is_(True) if user_filter.is_locked else User.is_locked.isnot(True))
+        return criteria
+
+    @classmethod
+    def _changes(cls, action: BulkUserAction, role: Optional[UserRole]) -> List[Tuple[List, Dict[str, Any], Optional[UserRole]]]:
+        """
+        (criteria of the users the action changes, values it sets, their old role) triples;
+        a role change has one per old role, so that each chunk knows how to move the counters.
+        """
+        if action == BulkUserAction.LOCK:
+            return [([User.is_locked.isnot(True)], {"is_locked": True}, None)]
+        if action == BulkUserAction.UNLOCK:
+            return [([User.is_locked.is_(True)], {"is_locked": False, "failed_login_attempts": 0}, None)]
+        if action == BulkUserAction.GRANT_PROFESSIONAL:
+            values = {"is_professional": True, "professional_status_updated_at": datetime.now(timezone.utc)}
+            return [([User.is_professional.isnot(True)], values, None)]
+        return [([User.role == old_role], {"role": role}, old_role) for old_role in UserRole if old_role != role]
+
+    @classmethod
+    async def apply(cls, session: AsyncSession, action: BulkUserAction, user_filter: UserFilter,
+                    role: Optional[UserRole] = None, chunk_size: Optional[int] = None) -> UserBulkActionReport:
+        """Apply `action` to the users matching `user_filter`, committing every chunk."""
+        chunk_size = chunk_size or settings.bulk_action_chunk_size
+        criteria = cls.criteria(user_filter)
+        affected = 0
+        for change_criteria, values, old_role in cls._changes(action, role):
+            matching = select(User.id).where(*criteria, *change_criteria).limit(chunk_size).scalar_subquery()
+            query = (update(User).where(User.id.in_(matching)).values(**values)
+                     .returning(User.id).execution_options(synchronize_session=False))
+            while True:
+                user_ids = list((await session.execute(query)).scalars().all())
+                if user_ids:
+                    # The UPDATE bypasses the unit of work, so the role counters are moved here
+                    if old_role is not None:
+                        await UserCountService.record(session, {old_role: -len(user_ids), role: len(user_ids)})
+                    call_after_commit(session, cls._notify, action, role, user_ids)
+                await session.commit()
+                affected += len(user_ids)
+                # Changed users no longer match, so the next chunk is the next users still matching
+                if len(user_ids) < chunk_size:
+                    break
+        return UserBulkActionReport(action=action, affected=affected)
+
+    @staticmethod
+    def _notify(action: BulkUserAction, role: Optional[UserRole], user_ids: List[UUID]) -> None:
+        """One Celery message per `bulk_action_notification_batch_size` notifications."""
+        if action == BulkUserAction.CHANGE_ROLE:
+            task, args = role_upgrade_task, [(user_id, role.name) for user_id in user_ids]
+        else:
+            task = {
+                BulkUserAction.LOCK: account_locked_task,
+                BulkUserAction.UNLOCK: account_unlocked_task,
+                BulkUserAction.GRANT_PROFESSIONAL: professional_status_upgrade_task,
+            }[action]
+            args = [(user_id,) for user_id in user_ids]
+        task.chunks(args, settings.bulk_action_notification_batch_size).apply_async(queue="account_notifications")
@@ -0,0 +1,129 @@
+"""
+User totals without `count(*)` over the users table.
+
+Every change to the number of users per role is added to the `user_counters` rows in
+the same transaction as the write itself: inserts, deletes and role changes made through
+the ORM unit of work are picked up from the flush, while statements that bypass it
+(such as the single-statement registration insert) report their change with
+`UserCountService.record`. The counter rows live next to the other unsharded tables.
+"""
+
+from builtins import ValueError, any, classmethod, dict, int, isinstance, str, sum
+import random
+from collections import Counter
+from typing import Dict, Optional
+
+from sqlalchemy import delete, event, func, inspect, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.database import Database
+from app.models.user_model import User, UserCounter, UserRole
+from settings.config import settings
+
+# Session.info key of the counter changes of a flush, applied once the flush has run
+PENDING_COUNTS_KEY = "pending_user_counts"
+
+STRATEGIES = ("counter", "estimate", "exact")
+
+
+def _role_name(role) -> str:
+    return role.name if isinstance(role, UserRole) else str(role)
+
+
+class UserCountService:
+    @classmethod
+    def _increment(cls, session, deltas: Dict[str, int]):
+        """Upsert adding `deltas` (role name -> change) to one random slot per role."""
+        rows = [
+            {"role": role, "slot": random.randrange(settings.user_counter_slots), "count": delta}
+            for role, delta in deltas.items() if delta
+        ]
+        if not rows:
+            return None
+        query = Database.insert(session, UserCounter.__table__).values(rows)
+        return query.on_conflict_do_update(
+            index_elements=["role", "slot"],
+            set_={"count": UserCounter.__table__.c.count + query.excluded.count},
+        )
+
+    @classmethod
+    async def record(cls, session: AsyncSession, deltas: Dict[UserRole, int]) -> None:
+        """Count users added (positive) or removed (negative) by a statement outside the unit of work."""
+        query = cls._increment(session, {_role_name(role): delta for role, delta in deltas.items()})
+        if query is not None:
+            await session.execute(query)
+
+    @classmethod
+    async def count(cls, session: AsyncSession, role: Optional[UserRole] = None, strategy: Optional[str] = None) -> int:
+        """Number of users (with `role`, if given) according to `strategy`, by default the configured one."""
+        strategy = strategy or settings.user_count_strategy
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown user count strategy: {strategy}")
+        async with Database.read_session(session) as read_session:
+            if strategy == "estimate" and role is None and not Database.is_sharded() and Database.dialect_name(read_session) == "postgresql":
+                estimate = await cls._estimate(read_session)
+                if estimate is not None:
+                    return estimate
+            if strategy == "exact":
+                query = select(func.count()).select_from(User)
+                if role is not None:
+                    query = query.where(User.role == role)
+                result = await read_session.execute(query)
+                # One row per shard when sharded
+                return sum(result.scalars().all())
+            query = select(func.coalesce(func.sum(UserCounter.count), 0))
+            if role is not None:
+                query = query.where(UserCounter.role == _role_name(role))
+            return int((await read_session.execute(query)).scalar())
+
+    @classmethod
+    async def _estimate(cls, session: AsyncSession) -> Optional[int]:
+        """The planner's row estimate for the users table; None until the table was analyzed."""
+        query = text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)")
+        estimate = (await session.execute(query, {"table": User.__tablename__})).scalar()
+        return estimate if estimate is not None and estimate >= 0 else None
+
+    @classmethod
+    async def rebuild(cls, session: AsyncSession) -> Dict[str, int]:
+        """Recompute the counters from the users table, e.g. after rows were changed by hand."""
+        result = await session.execute(select(User.role, func.count()).group_by(User.role))
+        totals = Counter()
+        for role, count in result.all():
+            totals[_role_name(role)] += count
+        await session.execute(delete(UserCounter))
+        if totals:
+            await session.execute(UserCounter.__table__.insert(), [
+                {"role": role, "slot": 0, "count": count} for role, count in totals.items()
+            ])
+        return dict(totals)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_counts(session: Session, flush_context) -> None:
+    deltas = Counter()
+    for instance in session.new:
+        if isinstance(instance, User):
+            deltas[_role_name(instance.role)] += 1
+    for instance in session.deleted:
+        if isinstance(instance, User):
+            history = inspect(instance).attrs.role.history
+            deltas[_role_name((history.deleted or history.unchanged or [instance.role])[0])] -= 1
+    for instance in session.dirty:
+        if isinstance(instance, User):
+            history = inspect(instance).attrs.role.history
+            if history.added and history.deleted:
+                deltas[_role_name(history.deleted[0])] -= 1
+                deltas[_role_name(history.added[0])] += 1
+    if any(deltas.values()):
+        pending = session.info.setdefault(PENDING_COUNTS_KEY, Counter())
+        pending.update(deltas)
+
+
+@event.listens_for(Session, "after_flush_postexec")
+def _apply_counts(session: Session, flush_context) -> None:
+    deltas = session.info.pop(PENDING_COUNTS_KEY, None)
+    if deltas:
+        query = UserCountService._increment(session, deltas)
+        if query is not None:
+            session.execute(query)
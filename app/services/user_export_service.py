@@ -0,0 +1,114 @@
+"""
+Streaming export of users as NDJSON or CSV, optionally gzipped, for `GET /users/export`.
+
+The rows come from a single query read through a server-side cursor (one per shard when
+sharded) in chunks of `export_chunk_size`, and each chunk is serialized and sent before
+the next is fetched, so memory stays constant however many users are exported. The
+export opens its own session because the response body is produced after the request's
+session has been closed.
+"""
+
+from builtins import ValueError, classmethod, isinstance, list, str, zip
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from enum import Enum
+from typing import Any, AsyncIterator, Iterable, List, Optional, Sequence
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Database
+from app.models.user_model import User, UserRole
+from app.utils.cursor_pagination import sortable_timestamp
+from settings.config import settings
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+# Everything but the credentials and the verification token
+EXPORT_COLUMNS = (
+    "id", "nickname", "email", "first_name", "last_name", "bio", "profile_picture_url",
+    "linkedin_profile_url", "github_profile_url", "role", "is_professional",
+    "professional_status_updated_at", "email_verified", "is_locked", "last_login_at",
+    "created_at", "updated_at",
+)
+
+users = User.__table__
+
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, UUID):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Enum):
+        return value.name
+    return value
+
+
+class UserExportService:
+    @classmethod
+    def columns(cls, names: Optional[str]) -> List[str]:
+        """The exported columns from a comma-separated list, all of them by default; raises ValueError for unknown ones."""
+        if not names:
+            return list(EXPORT_COLUMNS)
+        columns = [name.strip() for name in names.split(",") if name.strip()]
+        unknown = [name for name in columns if name not in EXPORT_COLUMNS]
+        if unknown or not columns:
+            raise ValueError(f"Unknown export columns: {', '.join(unknown)}" if unknown else "No export columns given")
+        return columns
+
+    @classmethod
+    def query(cls, columns: Sequence[str], role: Optional[UserRole] = None,
+              created_after: Optional[datetime] = None, created_before: Optional[datetime] = None):
+        query = select(*(users.c[name] for name in columns)).order_by(users.c.created_at, users.c.id)
+        if role is not None:
+            query = query.where(users.c.role == role)
+        if created_after is not None:
+            query = query.where(sortable_timestamp(users.c.created_at) >= sortable_timestamp(created_after))
+        if created_before is not None:
+            query = query.where(sortable_timestamp(users.c.created_at) < sortable_timestamp(created_before))
+        return query.execution_options(yield_per=settings.export_chunk_size)
+
+    @classmethod
+    async def rows(cls, session_factory: sessionmaker, query) -> AsyncIterator[Sequence[Sequence[Any]]]:
+        """Chunks of rows of `query`, one shard after the other when sharded (each in creation order)."""
+        shards = list(Database.shard_engines()) if Database.is_sharded() else [None]
+        async with session_factory() as session:
+            for shard_id in shards:
+                bind_arguments = {"shard_id": shard_id} if shard_id is not None else None
+                result = await session.stream(query, bind_arguments=bind_arguments)
+                async for chunk in result.partitions():
+                    yield chunk
+
+    @classmethod
+    async def stream(cls, session_factory: sessionmaker, format: str, columns: Sequence[str],
+                     role: Optional[UserRole] = None, created_after: Optional[datetime] = None,
+                     created_before: Optional[datetime] = None, gzip: bool = False) -> AsyncIterator[bytes]:
+        """The export as a stream of byte chunks, one per chunk of rows."""
+        compressor = zlib.compressobj(settings.export_gzip_level, zlib.DEFLATED, 31) if gzip else None
+
+        def encode(text: str) -> bytes:
+            data = text.encode("utf-8")
+            return compressor.compress(data) if compressor is not None else data
+
+        if format == "csv":
+            yield encode(cls._csv([columns]))
+        async for chunk in cls.rows(session_factory, cls.query(columns, role, created_after, created_before)):
+            if format == "csv":
+                data = encode(cls._csv(chunk))
+            else:
+                data = encode("".join(json.dumps({name: _plain(value) for name, value in zip(columns, row)}) + "\n" for row in chunk))
+            if data:
+                yield data
+        if compressor is not None:
+            yield compressor.flush()
+
+    @staticmethod
+    def _csv(rows: Iterable[Sequence[Any]]) -> str:
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerows([_plain(value) for value in row] for row in rows)
+        return buffer.getvalue()
@@ -0,0 +1,302 @@
+"""
+Bulk import of users from CSV or NDJSON, for onboarding customers with many accounts.
+
+    python -m app.services.user_import_service users.csv [--format ndjson] [--batch-size 1000] [--allow-role AUTHENTICATED]
+
+The same import backs `POST /users/import`. Rows are parsed as they arrive and handled in
+batches of `import_batch_size`: a batch is validated with `UserCreate`, its passwords are
+hashed in the password hashing pool, it is inserted with one statement (COPY into a staging table
+on PostgreSQL, a multi-row INSERT elsewhere) and committed on its own, after which the
+verification emails of its users are sent to Celery in chunks. A row that cannot be
+imported is reported with its line number and the reason; it does not stop the import.
+Rows may only set the roles the caller allows (ANONYMOUS unless given `--allow-role`), so
+an import file cannot create admins.
+"""
+
+from builtins import dict, isinstance, len, list, max, print, range, set, str, tuple, zip
+import argparse
+import asyncio
+import codecs
+import csv
+import json
+import logging
+from collections import Counter
+from typing import Any, AsyncIterable, AsyncIterator, Collection, Dict, List, Optional, Set, Tuple, Union
+from uuid import UUID, uuid4
+
+import anyio
+from pydantic import ValidationError
+from sqlalchemy import column, select, table
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.celery.tasks import verify_email_task
+from app.database import Database, call_after_commit
+from app.models.user_model import User, UserDirectory, UserRole
+from app.schemas.user_schemas import UserCreate, UserImportError, UserImportReport
+from app.services.user_count_service import UserCountService
+from app.utils.nickname_gen import generate_nickname, taken_nicknames
+from app.utils.hashing_admission import hashing_admission
+from app.utils.security import generate_verification_token, hash_password, run_hashing
+from settings.config import settings
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "ndjson")
+CONTENT_TYPES = {"text/csv": "csv", "application/x-ndjson": "ndjson", "application/ndjson": "ndjson"}
+STAGING_TABLE = "user_import_staging"
+
+users = User.__table__
+
+# A parsed row, or the reason its line could not be parsed
+Row = Union[Dict[str, Any], str]
+
+
+async def iter_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[str]:
+    """Decode a stream of UTF-8 byte chunks into lines without reading it whole."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+
+async def iter_rows(lines: AsyncIterable[str], format: str) -> AsyncIterator[Tuple[int, Row]]:
+    """
+    (line number, row) pairs of a CSV file with a header line, or of NDJSON with one
+    object per line. Empty CSV fields are left out, so the schema defaults apply; fields
+    cannot span lines.
+    """
+    header = None
+    number = 0
+    async for line in lines:
+        number += 1
+        if not line.strip():
+            continue
+        if format == "csv":
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [name.strip() for name in values]
+            elif len(values) != len(header):
+                yield number, f"Expected {len(header)} fields, got {len(values)}"
+            else:
+                yield number, {name: value for name, value in zip(header, values) if value != ""}
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, f"Invalid JSON: {e}"
+            continue
+        yield number, row if isinstance(row, dict) else "Expected a JSON object"
+
+
+def _describe(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in error.errors())
+
+
+class UserImportService:
+    @classmethod
+    async def import_users(cls, session: AsyncSession, rows: AsyncIterable[Tuple[int, Row]],
+                           batch_size: Optional[int] = None,
+                           roles: Collection[UserRole] = (UserRole.ANONYMOUS,)) -> UserImportReport:
+        """
+        Import `rows` (see `iter_rows`), committing each batch; returns what was imported and
+        what failed. A row may set its role only to one of `roles`; without one it is ANONYMOUS.
+        """
+        batch_size = batch_size or settings.import_batch_size
+        report = UserImportReport()
+        batch: List[Tuple[int, Row]] = []
+        async for number, row in rows:
+            batch.append((number, row))
+            if len(batch) >= batch_size:
+                await cls._import_batch(session, batch, report, roles)
+                batch = []
+        if batch:
+            await cls._import_batch(session, batch, report, roles)
+        return report
+
+    @classmethod
+    async def _import_batch(cls, session: AsyncSession, batch: List[Tuple[int, Row]], report: UserImportReport,
+                            roles: Collection[UserRole]) -> None:
+        valid: List[Tuple[int, Dict[str, Any]]] = []
+        for number, row in batch:
+            if isinstance(row, str):
+                cls._fail(report, number, None, row)
+                continue
+            try:
+                data = UserCreate(**{"role": UserRole.ANONYMOUS.name, **row}).model_dump()
+            except ValidationError as e:
+                cls._fail(report, number, row.get("email"), _describe(e))
+                continue
+            if data["role"] != UserRole.ANONYMOUS and data["role"] not in roles:
+                cls._fail(report, number, data["email"], f"Role {data['role'].name} may not be imported")
+                continue
+            valid.append((number, data))
+        if not valid:
+            return
+
+        hashed = await cls._hash([data.pop("password") for _, data in valid])
+        records: Dict[int, Dict[str, Any]] = {}
+        generated: Set[int] = set()
+        for (number, data), hashed_password in zip(valid, hashed):
+            if data["nickname"] is None:
+                data["nickname"] = generate_nickname()
+                generated.add(number)
+            records[number] = dict(
+                data, id=uuid4(), hashed_password=hashed_password, email_verified=False,
+                verification_token=generate_verification_token(), is_professional=False,
+                failed_login_attempts=0, is_locked=False,
+            )
+
+        inserted: Dict[int, Dict[str, Any]] = {}
+        pending = records
+        # A second pass retries the rows whose generated nickname collided
+        for attempt in range(2):
+            ids = await cls._insert(session, list(pending.values()))
+            missed = {number: record for number, record in pending.items() if record["id"] not in ids}
+            inserted.update({number: record for number, record in pending.items() if record["id"] in ids})
+            if not missed:
+                break
+            taken_emails = await cls._existing_emails(session, [record["email"] for record in missed.values()])
+            pending = {}
+            for number, record in missed.items():
+                if record["email"] in taken_emails:
+                    cls._fail(report, number, record["email"], "Email already exists")
+                elif number in generated and attempt == 0:
+                    pending[number] = dict(record, nickname=generate_nickname())
+                else:
+                    cls._fail(report, number, record["email"], "Nickname already exists")
+            if not pending:
+                break
+
+        if inserted:
+            await UserCountService.record(session, Counter(record["role"] for record in inserted.values()))
+            taken_nicknames.update(record["nickname"] for record in inserted.values())
+            call_after_commit(session, cls._enqueue_verification, [record["id"] for record in inserted.values()])
+        # Each batch is committed on its own, so a failure keeps the batches before it
+        await session.commit()
+        report.imported += len(inserted)
+        logger.info(f"Imported {len(inserted)} of {len(batch)} row(s) ending at line {batch[-1][0]}")
+
+    @staticmethod
+    def _fail(report: UserImportReport, number: int, email: Optional[str], error: str) -> None:
+        report.failed += 1
+        if len(report.errors) < settings.import_max_reported_errors:
+            report.errors.append(UserImportError(row=number, email=email, error=error))
+
+    @classmethod
+    async def _hash(cls, passwords: List[str]) -> List[str]:
+        """Hash the passwords of a batch, spread over the workers of the password hashing pool."""
+        size = -(-len(passwords) // max(1, settings.password_hash_workers))
+        parts = [passwords[start:start + size] for start in range(0, len(passwords), size)]
+        results = await asyncio.gather(*(cls._hash_part(part) for part in parts))
+        return [hashed for part in results for hashed in part]
+
+    @staticmethod
+    async def _hash_part(passwords: List[str]) -> List[str]:
+        # One admission per password, so logins queue behind at most one import hash per worker
+        hashed = []
+        for password in passwords:
+            async with hashing_admission.admit(background=True):
+                hashed.append(await run_hashing(hash_password, password))
+        return hashed
+
+    @classmethod
+    async def _insert(cls, session: AsyncSession, records: List[Dict[str, Any]]) -> Set[UUID]:
+        """Insert the records, skipping those whose email or nickname is taken; returns the inserted ids."""
+        if Database.is_sharded():
+            return await cls._insert_sharded(session, records)
+        if Database.dialect_name(session) == "postgresql":
+            return await cls._copy_insert(session, records)
+        query = Database.insert(session, users).on_conflict_do_nothing().returning(users.c.id)
+        return set((await session.execute(query, records)).scalars().all())
+
+    @classmethod
+    async def _copy_insert(cls, session: AsyncSession, records: List[Dict[str, Any]]) -> Set[UUID]:
+        """COPY the records into a temporary staging table, then move them with one INSERT ... SELECT."""
+        columns = list(records[0])
+        connection = await session.connection()
+        driver_connection = (await connection.get_raw_connection()).driver_connection
+        await driver_connection.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} (LIKE {users.name} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+        )
+        await driver_connection.execute(f"TRUNCATE {STAGING_TABLE}")
+        await driver_connection.copy_records_to_table(
+            STAGING_TABLE,
+            records=[tuple(value.name if isinstance(value, UserRole) else value for value in (record[name] for name in columns)) for record in records],
+            columns=columns,
+        )
+        staging = table(STAGING_TABLE, *(column(name) for name in columns))
+        query = (Database.insert(session, users)
+                 .from_select(columns, select(*(staging.c[name] for name in columns)))
+                 .on_conflict_do_nothing()
+                 .returning(users.c.id))
+        return set((await session.execute(query)).scalars().all())
+
+    @classmethod
+    async def _insert_sharded(cls, session: AsyncSession, records: List[Dict[str, Any]]) -> Set[UUID]:
+        """Claim emails and nicknames in the directory, then insert the users on their shards."""
+        entries = [
+            {"email": record["email"], "nickname": record["nickname"], "user_id": record["id"], "shard_id": Database.shard_for(record["id"])}
+            for record in records
+        ]
+        directory = UserDirectory.__table__
+        query = Database.insert(session, directory).on_conflict_do_nothing().returning(directory.c.user_id)
+        claimed = set((await session.execute(query, entries)).scalars().all())
+        by_shard: Dict[str, List[Dict[str, Any]]] = {}
+        for record in records:
+            if record["id"] in claimed:
+                by_shard.setdefault(Database.shard_for(record["id"]), []).append(record)
+        for shard_id, shard_records in by_shard.items():
+            await session.execute(users.insert(), shard_records, bind_arguments={"shard_id": shard_id})
+        return claimed
+
+    @classmethod
+    async def _existing_emails(cls, session: AsyncSession, emails: List[str]) -> Set[str]:
+        owner = UserDirectory if Database.is_sharded() else User
+        result = await session.execute(select(owner.email).where(owner.email.in_(emails)))
+        return set(result.scalars().all())
+
+    @staticmethod
+    def _enqueue_verification(user_ids: List[UUID]) -> None:
+        """One Celery message per `import_email_batch_size` verification emails."""
+        verify_email_task.chunks([(user_id,) for user_id in user_ids], settings.import_email_batch_size).apply_async(
+            queue="account_notifications"
+        )
+
+
+async def _read_file(path: str) -> AsyncIterator[bytes]:
+    # Reads run in a worker thread, so the event loop keeps serving the import meanwhile
+    async with await anyio.open_file(path, "rb") as file:
+        while chunk := await file.read(1 << 16):
+            yield chunk
+
+
+async def _main(path: str, format: str, batch_size: Optional[int], roles: List[UserRole]) -> None:
+    Database.initialize(settings.database_url, None, settings.debug, shard_urls=settings.database_shard_urls)
+    try:
+        async with Database.unit_of_work() as session:
+            report = await UserImportService.import_users(session, iter_rows(iter_lines(_read_file(path)), format), batch_size,
+                                                          [UserRole.ANONYMOUS, *roles])
+    finally:
+        for engine in Database.async_engines():
+            await engine.dispose()
+    for error in report.errors:
+        print(f"line {error.row}: {error.email or '-'}: {error.error}")
+    print(f"Imported {report.imported} user(s), {report.failed} row(s) failed")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import users from a CSV or NDJSON file.")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=FORMATS, help="Defaults to the file extension (.csv, else NDJSON)")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--allow-role", dest="roles", action="append", default=[], type=UserRole.__getitem__,
+                        choices=list(UserRole), metavar="ROLE", help="A role rows may set besides ANONYMOUS; repeatable")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(args.path, args.format or ("csv" if args.path.endswith(".csv") else "ndjson"), args.batch_size, args.roles))
@@ -1,21 +1,25 @@
-from builtins import Exception, bool, classmethod, int, str
+from builtins import Exception, RuntimeError, any, isinstance, bool, classmethod, int, len, range, setattr, sorted, staticmethod, str, zip
 from datetime import datetime, timezone
 import secrets
-from time import sleep
-from typing import Optional, Dict, List
+from typing import NamedTuple, Optional, Dict, List, Set, Tuple
 
-import backoff
-from asyncpg.exceptions import InvalidCachedStatementError
 from pydantic import ValidationError
-from sqlalchemy import func, null, update, select
-from sqlalchemy.exc import SQLAlchemyError, NotSupportedError, InternalError
+from sqlalchemy import Row, delete, func, literal, or_, tuple_, update, select
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.horizontal_shard import set_shard_id
+from app.database import Database, call_after_commit
 from app.dependencies import get_settings
-from app.models.user_model import User
+from app.models.user_model import BootstrapState, User, UserDirectory
 from app.schemas.user_schemas import UserCreate, UserUpdate
-from app.utils.nickname_gen import generate_nickname
-from app.utils.security import generate_verification_token, hash_password, verify_password
-from uuid import UUID
+from app.services.user_count_service import UserCountService
+from app.utils.cursor_pagination import Cursor, sortable_timestamp
+from app.utils.db_retry import classify_error, retry_transaction
+from app.utils.hashing_admission import HashingOverloaded
+from app.utils.nickname_gen import generate_nickname, nickname_candidates, taken_nicknames
+from app.utils.slow_query_log import record_caller
+from app.utils.security import generate_verification_token, hash_password_async, needs_rehash, verify_password_async
+from uuid import UUID, uuid4
 from app.models.user_model import UserRole
 from app.celery.tasks import (
     verify_email_task,
@@ -29,74 +33,145 @@ import logging
 settings = get_settings()
 logger = logging.getLogger(__name__)
 
+# Nicknames tried before registration gives up on a crowded nickname space
+NICKNAME_ATTEMPTS = 10
+# Bootstrap step electing the first registered user as admin
+FIRST_ADMIN_KEY = "first_admin"
+# Times a conditional update re-reads a row that changed under it (SQLite only)
+CONDITIONAL_UPDATE_ATTEMPTS = 3
+
+# What a login reads, instead of the whole user
+LOGIN_COLUMNS = (User.id, User.email, User.role, User.hashed_password, User.email_verified, User.is_locked)
+
+
+class EmailAlreadyExists(ValueError):
+    """The email of the user being created is taken."""
+
+
+class NicknameUnavailable(Exception):
+    """No free nickname was found for the user being created within `NICKNAME_ATTEMPTS`."""
+
+
+class LoginResult(NamedTuple):
+    """Outcome of `UserService.login_user`: the user's `LOGIN_COLUMNS` if the credentials are valid."""
+    user: Optional[Row] = None
+    locked: bool = False
+
+
+@record_caller
 class UserService:
-    @classmethod
-    @backoff.on_exception(
-        backoff.expo,
-        (NotSupportedError, InternalError),
-        max_tries=2,
-        jitter=None,
-    )
-    async def _backoff_query(cls, session: AsyncSession, query):
-        try:
-            logger.error(f"Backoff before committing query: {query}")
-            result = await session.execute(query)
-            await session.commit()
-            logger.error("Backoff after committing query:")
-            print(f"Rusult: {result}")
-        except (NotSupportedError, InternalError) as e:
-            logger.error(f"Error during query execution: {e}, backing off and retrying.")
-            await session.rollback()
-            sleep(1)
-            raise
-        return result
+    # Set once this process knows the first admin has been elected
+    _first_admin_claimed: bool = False
 
     @classmethod
     async def _execute_query(cls, session: AsyncSession, query):
         """
-        Executes & commits.  If the 'cached statement invalid'
-        error fires, backoff will rollback and retry once.
+        Executes the query inside the session's current transaction; committing is left
+        to the request's unit of work (`Database.unit_of_work`). Transient errors propagate
+        so that the enclosing `retry_transaction` can replay the whole operation.
         """
         try:
-            logger.error("Executing query:")
-            result = await cls._backoff_query(session, query)
-            logger.error("Query executed successfully.")
+            result = await session.execute(query)
         except SQLAlchemyError as e:
+            if classify_error(e):
+                raise
             logger.error(f"Database error: {e}")
             await session.rollback()
             return None
         return result
 
     @classmethod
-    async def _fetch_user(cls, session: AsyncSession, **filters) -> Optional[User]:
+    async def _fetch_user(cls, session: AsyncSession, shard_id: Optional[str] = None, **filters) -> Optional[User]:
         query = select(User).filter_by(**filters)
+        if shard_id is not None:
+            query = query.options(set_shard_id(shard_id))
         result = await cls._execute_query(session, query)
         return result.scalars().first() if result else None
 
     @classmethod
+    async def _directory_shard(cls, session: AsyncSession, email: str) -> Optional[str]:
+        """Shard holding the user with `email`, according to the directory on the primary."""
+        query = select(UserDirectory.shard_id).where(UserDirectory.email == email)
+        result = await cls._execute_query(session, query)
+        return result.scalar() if result else None
+
+    @classmethod
+    async def _read_user(cls, session: AsyncSession, **filters) -> Optional[User]:
+        """Like `_fetch_user`, but served by a read replica when `Database.read_session` allows it."""
+        async with Database.read_session(session) as read_session:
+            return await cls._fetch_user(read_session, **filters)
+
+    @classmethod
+    async def _update_user(cls, session: AsyncSession, user_id: UUID, values: Dict, *criteria,
+                           previous: Tuple = ()) -> Optional[Row]:
+        """
+        Update the user with `user_id` if it also meets `criteria`, without loading it first.
+
+        Returns a row of the updated user followed by the `previous` columns as they were
+        before the update, or None if no user matched. On PostgreSQL this is one
+        `UPDATE ... FROM (SELECT ... FOR UPDATE) ... RETURNING` statement; the subquery
+        locks the row, so the old values cannot be changed by a concurrent edit in between.
+        SQLite cannot return columns of the FROM clause, so there the old values are read
+        first and the UPDATE only applies if they are still the same.
+        """
+        if not previous or Database.dialect_name(session) == "postgresql":
+            query = update(User).where(User.id == user_id, *criteria).values(**values)
+            if previous:
+                before = select(User.id, *previous).where(User.id == user_id).with_for_update().subquery("previous")
+                query = query.where(User.id == before.c.id).returning(User, *(before.c[column.key] for column in previous))
+            else:
+                query = query.returning(User)
+            result = await cls._execute_query(session, query.execution_options(synchronize_session=False, populate_existing=True))
+            return result.first() if result else None
+        for _ in range(CONDITIONAL_UPDATE_ATTEMPTS):
+            result = await cls._execute_query(session, select(*previous).where(User.id == user_id, *criteria))
+            old = result.first() if result else None
+            if old is None:
+                return None
+            unchanged = [column == value for column, value in zip(previous, old)]
+            query = (update(User).where(User.id == user_id, *criteria, *unchanged).values(**values).returning(User)
+                     .execution_options(synchronize_session=False, populate_existing=True))
+            result = await cls._execute_query(session, query)
+            updated = result.scalars().first() if result else None
+            if updated is not None:
+                return (updated, *old)
+        raise RuntimeError(f"User {user_id} kept changing during the update")
+
+    @classmethod
+    @retry_transaction
     async def get_by_id(cls, session: AsyncSession, user_id: UUID) -> Optional[User]:
-        return await cls._fetch_user(session, id=user_id)
+        return await cls._read_user(session, id=user_id)
 
     @classmethod
+    @retry_transaction
     async def get_by_nickname(cls, session: AsyncSession, nickname: str) -> Optional[User]:
-        return await cls._fetch_user(session, nickname=nickname)
+        return await cls._read_user(session, nickname=nickname)
 
     @classmethod
+    @retry_transaction
     async def get_by_email(cls, session: AsyncSession, email: str) -> Optional[User]:
-        return await cls._fetch_user(session, email=email)
+        if Database.is_sharded():
+            shard_id = await cls._directory_shard(session, email)
+            return await cls._fetch_user(session, shard_id=shard_id, email=email) if shard_id else None
+        return await cls._read_user(session, email=email)
 
     @classmethod
+    @retry_transaction
     async def create(cls, session: AsyncSession, user_data: Dict[str, str]) -> Optional[User]:
+        """
+        Create the user; None if `user_data` is invalid. Raises `EmailAlreadyExists` or
+        `NicknameUnavailable` when the user cannot be inserted.
+        """
         try:
-            new_user = await cls._create_user_in_db(session, user_data)
+            new_user = await cls._create_user_in_db(session, user_data, generate_verification_token())
 
             if not new_user.email_verified:
-                new_user.verification_token = generate_verification_token()
-                await session.commit()
-                verify_email_task.delay(new_user.id)
+                call_after_commit(session, verify_email_task.delay, new_user.id)
 
             return new_user
 
+        except EmailAlreadyExists:
+            raise
         except ValidationError as e:
             logger.error(f"Validation error during user creation: {e}")
             return None
@@ -106,70 +181,195 @@ class UserService:
 
 
     @classmethod
-    async def _create_user_in_db(cls, session: AsyncSession, user_data: Dict[str, str]) -> User:
+    async def _create_user_in_db(cls, session: AsyncSession, user_data: Dict[str, str],
+                                 verification_token: Optional[str] = None) -> User:
+        """
+        Inserts the user with a single `INSERT ... ON CONFLICT DO NOTHING RETURNING`.
+
+        Email and nickname uniqueness are left to the unique constraints instead of being
+        checked beforehand: when the insert returns no row, one lookup tells a taken email
+        (`EmailAlreadyExists`) from a nickname collision, and only the nickname is
+        regenerated, up to `NICKNAME_ATTEMPTS` times (then `NicknameUnavailable`). The
+        first user (see `_claim_first_admin`) becomes a verified admin; everyone else gets
+        `verification_token`.
+        """
         validated_data = UserCreate(**user_data).model_dump()
+        # Conflict lookups must not be answered by a lagging replica
+        Database.pin_to_primary(session)
 
-        if await cls.get_by_email(session, validated_data['email']):
-            raise ValueError("User with given email already exists.")
+        validated_data['hashed_password'] = await hash_password_async(validated_data.pop('password'))
+        # The id decides the shard, so it is assigned up front rather than by the column default
+        validated_data['id'] = uuid4()
 
-        validated_data['hashed_password'] = hash_password(validated_data.pop('password'))
+        is_first = await cls._claim_first_admin(session, validated_data['id'])
+        validated_data.update(cls._initial_state(is_first, verification_token))
 
-        new_user = User(**validated_data)
+        try:
+            candidates = nickname_candidates(1) or [generate_nickname()]
+            for _ in range(NICKNAME_ATTEMPTS):
+                nickname = validated_data['nickname'] = candidates[0]
+                new_user = await cls._insert_user(session, validated_data)
+                if new_user is not None:
+                    taken_nicknames.add(nickname)
+                    await UserCountService.record(session, {new_user.role: 1})
+                    if is_first:
+                        # Only remembered once the claim is committed; a rollback gives it back
+                        call_after_commit(session, setattr, cls, "_first_admin_claimed", True)
+                    return new_user
+                # One query tells a taken email from a taken nickname and checks a whole batch
+                # of replacement nicknames at once
+                candidates = nickname_candidates(settings.nickname_batch_size)
+                email_taken, taken = await cls._conflicts(session, validated_data['email'], [nickname] + candidates)
+                if email_taken:
+                    raise EmailAlreadyExists("User with given email already exists.")
+                taken_nicknames.update(taken)
+                candidates = [candidate for candidate in candidates if candidate not in taken] or [generate_nickname()]
+            raise NicknameUnavailable("Could not generate a unique nickname.")
+        except (EmailAlreadyExists, NicknameUnavailable):
+            # These are answered with an HTTP error, which commits the transaction, so the
+            # claim is given back; database errors roll it back with everything else
+            if is_first:
+                await session.execute(delete(BootstrapState).where(BootstrapState.key == FIRST_ADMIN_KEY))
+            raise
 
-        # Generate unique nickname
-        new_nickname = generate_nickname()
-        while await cls.get_by_nickname(session, new_nickname):
-            new_nickname = generate_nickname()
-        new_user.nickname = new_nickname
+    @classmethod
+    async def _claim_first_admin(cls, session: AsyncSession, user_id: UUID) -> bool:
+        """
+        Whether the user being created is the first admin, decided by claiming the
+        bootstrap row: only one transaction can insert it. Once the claim is known to be
+        taken, later registrations skip the query.
+        """
+        if cls._first_admin_claimed:
+            return False
+        query = (Database.insert(session, BootstrapState)
+                 .values(key=FIRST_ADMIN_KEY, user_id=user_id)
+                 .on_conflict_do_nothing()
+                 .returning(BootstrapState.key))
+        if (await session.execute(query)).first() is None:
+            cls._first_admin_claimed = True
+            return False
+        return True
 
-        user_count = await cls.count(session)
-        new_user.role = UserRole.ADMIN if user_count == 0 else UserRole.ANONYMOUS
-        new_user.email_verified = new_user.role == UserRole.ADMIN
+    @staticmethod
+    def _initial_state(is_first: bool, verification_token: Optional[str]) -> Dict:
+        """Role, verification flag and token of a new user; the first user is a verified admin."""
+        return {
+            'role': UserRole.ADMIN if is_first else UserRole.ANONYMOUS,
+            'email_verified': is_first,
+            'verification_token': None if is_first else verification_token,
+        }
 
-        session.add(new_user)
-        await session.commit()
-        await session.refresh(new_user)
+    @classmethod
+    async def _insert_user(cls, session: AsyncSession, values: Dict) -> Optional[User]:
+        """Insert the user row, returning it; None when the email or nickname is already taken."""
+        bind_arguments = None
+        if Database.is_sharded():
+            entry = (Database.insert(session, UserDirectory)
+                     .values(email=values['email'], nickname=values['nickname'], user_id=values['id'],
+                             shard_id=Database.shard_for(values['id']))
+                     .on_conflict_do_nothing()
+                     .returning(UserDirectory.user_id))
+            if (await session.execute(entry)).first() is None:
+                return None
+            bind_arguments = {"shard_id": Database.shard_for(values['id'])}
+        query = Database.insert(session, User).values(**values).on_conflict_do_nothing().returning(User)
+        return (await session.execute(query, bind_arguments=bind_arguments)).scalars().first()
 
-        return new_user
+    @classmethod
+    async def _conflicts(cls, session: AsyncSession, email: str, nicknames: List[str]) -> Tuple[bool, Set[str]]:
+        """Whether `email` is taken, and which of `nicknames` are."""
+        owner = UserDirectory if Database.is_sharded() else User
+        query = select(owner.email, owner.nickname).where(or_(owner.email == email, owner.nickname.in_(nicknames)))
+        rows = (await session.execute(query)).all()
+        return any(row.email == email for row in rows), {row.nickname for row in rows if row.nickname in nicknames}
 
     @classmethod
+    @retry_transaction
     async def update(cls, session: AsyncSession, user_id: UUID, update_data: Dict[str, str]) -> Optional[User]:
         try:
             # validated_data = UserUpdate(**update_data).dict(exclude_unset=True)
             validated_data = UserUpdate(**update_data).model_dump(exclude_unset=True)
 
             if 'password' in validated_data:
-                validated_data['hashed_password'] = hash_password(validated_data.pop('password'))
-            query = update(User).where(User.id == user_id).values(**validated_data).execution_options(synchronize_session="fetch")
-            await cls._execute_query(session, query)
-            updated_user = await cls.get_by_id(session, user_id)
-            logger.error(f"Updated user: {updated_user}")
-            if updated_user:
-                session.refresh(updated_user)  # Explicitly refresh the updated user object
-                logger.error(f"User {user_id} updated successfully.")
-                return updated_user
-            else:
-                logger.error(f"User {user_id} not found after update attempt.")
-            return None
+                validated_data['hashed_password'] = await hash_password_async(validated_data.pop('password'))
+            # The UPDATE bypasses the unit of work, so a role change moves the role counters here
+            previous = (User.role,) if validated_data.get('role') is not None else ()
+            row = await cls._update_user(session, user_id, validated_data, previous=previous)
+            if row is None:
+                logger.error(f"User {user_id} not found for update.")
+                return None
+            directory_data = {key: validated_data[key] for key in ('email', 'nickname') if key in validated_data}
+            if directory_data and Database.is_sharded():
+                await cls._execute_query(session, update(UserDirectory).where(UserDirectory.user_id == user_id).values(**directory_data))
+            if previous and row[1].name != validated_data['role']:
+                await UserCountService.record(session, {row[1].name: -1, validated_data['role']: 1})
+            logger.info(f"User {user_id} updated successfully.")
+            return row[0]
         except Exception as e:  # Broad exception handling for debugging
+            # Transient database errors are retried, an overloaded hashing pool is answered with 503
+            if classify_error(e) or isinstance(e, HashingOverloaded):
+                raise
             logger.error(f"Error during user update: {e}")
             return None
 
     @classmethod
+    @retry_transaction
     async def delete(cls, session: AsyncSession, user_id: UUID) -> bool:
-        user = await cls.get_by_id(session, user_id)
-        if not user:
+        query = delete(User).where(User.id == user_id)
+        if Database.dialect(session).delete_returning:
+            result = await cls._execute_query(session, query.returning(User.role))
+            role = result.scalar() if result else None
+        else:
+            result = await cls._execute_query(session, select(User.role).where(User.id == user_id).with_for_update())
+            role = result.scalar() if result else None
+            if role is not None:
+                await cls._execute_query(session, query)
+        if role is None:
             logger.info(f"User with ID {user_id} not found.")
             return False
-        await session.delete(user)
-        await session.commit()
+        # The DELETE bypasses the unit of work, which would otherwise count the removal
+        await UserCountService.record(session, {role: -1})
+        if Database.is_sharded():
+            await cls._execute_query(session, delete(UserDirectory).where(UserDirectory.user_id == user_id))
         return True
 
     @classmethod
+    @retry_transaction
     async def list_users(cls, session: AsyncSession, skip: int = 0, limit: int = 10) -> List[User]:
-        query = select(User).offset(skip).limit(limit)
-        result = await cls._execute_query(session, query)
-        return result.scalars().all() if result else []
+        if Database.is_sharded():
+            # Every shard returns its first skip+limit users in the global order; the page is
+            # cut from the merged rows
+            query = select(User).order_by(User.created_at, User.id).limit(skip + limit)
+            result = await cls._execute_query(session, query)
+            users = sorted(result.scalars().all(), key=lambda user: (user.created_at, user.id)) if result else []
+            return users[skip:skip + limit]
+        query = select(User).order_by(User.created_at, User.id).offset(skip).limit(limit)
+        async with Database.read_session(session) as read_session:
+            result = await cls._execute_query(read_session, query)
+            return result.scalars().all() if result else []
+
+    @classmethod
+    @retry_transaction
+    async def list_users_by_cursor(cls, session: AsyncSession, limit: int = 10, cursor: Optional[Cursor] = None) -> Tuple[List[User], bool]:
+        """
+        The page of users following `cursor` in `(created_at, id)` order (or preceding it,
+        for a backwards cursor), and whether more users lie beyond the page in that direction.
+        """
+        created_at = sortable_timestamp(User.created_at)
+        key = tuple_(created_at, User.id)
+        backwards = cursor is not None and cursor.backwards
+        query = select(User).limit(limit + 1)
+        if cursor is not None:
+            bound = tuple_(sortable_timestamp(literal(cursor.created_at, User.created_at.type)), literal(cursor.id, User.id.type))
+            query = query.where(key < bound if backwards else key > bound)
+        query = query.order_by(created_at.desc(), User.id.desc()) if backwards else query.order_by(created_at, User.id)
+
+        async with Database.read_session(session) as read_session:
+            result = await cls._execute_query(read_session, query)
+            # Sharded sessions return each shard's rows in turn, so the page is cut from the merged rows
+            users = sorted(result.scalars().all() if result else [], key=lambda user: (user.created_at, user.id), reverse=backwards)
+        page = users[:limit]
+        return (page[::-1] if backwards else page), len(users) > limit
 
     @classmethod
     async def register_user(cls, session: AsyncSession, user_data: Dict[str, str]) -> Optional[User]:
@@ -177,95 +377,110 @@ class UserService:
 
 
     @classmethod
-    async def login_user(cls, session: AsyncSession, email: str, password: str) -> Optional[User]:
-        user = await cls.get_by_email(session, email)
-        if user:
-            if user.email_verified is False:
-                return None
-            if user.is_locked:
-                return None
-            if verify_password(password, user.hashed_password):
-                user.failed_login_attempts = 0
-                user.last_login_at = datetime.now(timezone.utc)
-                session.add(user)
-                await session.commit()
-                return user
-            else:
-                user.failed_login_attempts += 1
-                if user.failed_login_attempts >= settings.max_login_attempts:
-                    user.is_locked = True
-                    # Schedule account locked notification
-                    account_locked_task.delay(user.id)
-                session.add(user)
-                await session.commit()
-        return None
+    @retry_transaction
+    async def login_user(cls, session: AsyncSession, email: str, password: str) -> LoginResult:
+        """
+        Check a login with one SELECT of the columns it needs, then record the attempt with
+        one UPDATE. Failed attempts are counted in SQL (`failed_login_attempts + 1`), so
+        concurrent attempts cannot overwrite each other's increments, and only the attempt
+        that actually locks the account schedules the notification.
+        """
+        query = select(*LOGIN_COLUMNS).where(User.email == email)
+        if Database.is_sharded():
+            shard_id = await cls._directory_shard(session, email)
+            if shard_id is None:
+                return LoginResult()
+            query = query.options(set_shard_id(shard_id))
+        result = await cls._execute_query(session, query)
+        user = result.first() if result else None
+        if user is None:
+            return LoginResult()
+        if user.is_locked:
+            return LoginResult(locked=True)
+        if not user.email_verified:
+            return LoginResult()
+        if await verify_password_async(password, user.hashed_password):
+            values = {"failed_login_attempts": 0, "last_login_at": datetime.now(timezone.utc)}
+            if needs_rehash(user.hashed_password):
+                # The plain password is at hand only now; move the hash to the current hasher and parameters
+                try:
+                    values["hashed_password"] = await hash_password_async(password)
+                except HashingOverloaded:
+                    logger.info(f"Hashing pool busy, rehash of user {user.id} left for a later login")
+            # A concurrent failed guess may have locked the account while this one was verified
+            if await cls._update_user(session, user.id, values, User.is_locked.isnot(True)) is None:
+                return LoginResult(locked=True)
+            return LoginResult(user)
+        attempts = func.coalesce(User.failed_login_attempts, 0) + 1
+        values = {"failed_login_attempts": attempts, "is_locked": attempts >= settings.max_login_attempts}
+        # Skips accounts locked meanwhile, so the lock happens (and is notified) once
+        row = await cls._update_user(session, user.id, values, User.is_locked.isnot(True))
+        if row is not None and row[0].is_locked:
+            # Schedule account locked notification
+            call_after_commit(session, account_locked_task.delay, user.id)
+        return LoginResult()
 
     @classmethod
+    @retry_transaction
     async def is_account_locked(cls, session: AsyncSession, email: str) -> bool:
         user = await cls.get_by_email(session, email)
         return user.is_locked if user else False
 
 
     @classmethod
+    @retry_transaction
     async def reset_password(cls, session: AsyncSession, user_id: UUID, new_password: str) -> bool:
-        hashed_password = hash_password(new_password)
-        user = await cls.get_by_id(session, user_id)
-        if user:
-            was_locked = user.is_locked
-            user.hashed_password = hashed_password
-            user.failed_login_attempts = 0  # Resetting failed login attempts
-            user.is_locked = False  # Unlocking the user account, if locked
-            session.add(user)
-            await session.commit()
-            # If the account was locked and is now unlocked, send notification
-            if was_locked:
-                account_unlocked_task.delay(user.id)
-            return True
-        return False
+        hashed_password = await hash_password_async(new_password)
+        # Resetting also clears the failed login attempts and unlocks the account
+        values = {"hashed_password": hashed_password, "failed_login_attempts": 0, "is_locked": False}
+        row = await cls._update_user(session, user_id, values, previous=(User.is_locked,))
+        if row is None:
+            return False
+        # If the account was locked and is now unlocked, send notification
+        if row[1]:
+            call_after_commit(session, account_unlocked_task.delay, user_id)
+        return True
 
     @classmethod
+    @retry_transaction
     async def verify_email_with_token(cls, session: AsyncSession, user_id: UUID, token: str) -> bool:
-        user = await cls.get_by_id(session, user_id)
-        if user and user.verification_token == token:
-            user.email_verified = True
-            user.verification_token = None  # Clear the token once used
-            old_role = user.role
-            user.role = UserRole.AUTHENTICATED
-            session.add(user)
-            await session.commit()
-            # If the role was upgraded, send notification
-            if old_role != UserRole.AUTHENTICATED:
-                role_upgrade_task.delay(user.id, UserRole.AUTHENTICATED.name)
-            return True
-        return False
+        # The token is cleared once used, so a second verification with it matches nothing
+        values = {"email_verified": True, "verification_token": None, "role": UserRole.AUTHENTICATED}
+        row = await cls._update_user(session, user_id, values, User.verification_token == token, previous=(User.role,))
+        if row is None:
+            return False
+        old_role = row[1]
+        # If the role was upgraded, send notification
+        if old_role != UserRole.AUTHENTICATED:
+            await UserCountService.record(session, {old_role: -1, UserRole.AUTHENTICATED: 1})
+            call_after_commit(session, role_upgrade_task.delay, user_id, UserRole.AUTHENTICATED.name)
+        return True
 
     @classmethod
+    @retry_transaction
     async def count(cls, session: AsyncSession) -> int:
         """
-        Count the number of users in the database.
+        Count the number of users in the database, by the configured count strategy
+        (maintained counters by default).
 
         :param session: The AsyncSession instance for database access.
         :return: The count of users.
         """
-        query = select(func.count()).select_from(User)
-        result = await session.execute(query)
-        count = result.scalar()
-        return count
+        return await UserCountService.count(session)
 
     @classmethod
+    @retry_transaction
     async def unlock_user_account(cls, session: AsyncSession, user_id: UUID) -> bool:
-        user = await cls.get_by_id(session, user_id)
-        if user and user.is_locked:
-            user.is_locked = False
-            user.failed_login_attempts = 0  # Optionally reset failed login attempts
-            session.add(user)
-            await session.commit()
-            # Schedule account unlocked notification
-            account_unlocked_task.delay(user.id)
-            return True
-        return False
+        # Only a locked account is unlocked, so concurrent unlocks notify the user once
+        values = {"is_locked": False, "failed_login_attempts": 0}
+        if await cls._update_user(session, user_id, values, User.is_locked.is_(True)) is None:
+            return False
+        # Schedule account unlocked notification
+        call_after_commit(session, account_unlocked_task.delay, user_id)
+        return True
 
     @classmethod
+    @retry_transaction
     async def upgrade_user_role(cls, session: AsyncSession, user_id: UUID, new_role: UserRole) -> bool:
         """
         Upgrade a user's role to a new role.
@@ -275,19 +490,18 @@ class UserService:
         :param new_role: The new role to assign to the user.
         :return: True if the role was upgraded successfully, False otherwise.
         """
-        user = await cls.get_by_id(session, user_id)
-        if user and user.role != new_role:
-            old_role = user.role
-            user.role = new_role
-            session.add(user)
-            await session.commit()
-            # Schedule role upgrade notification
-            role_upgrade_task.delay(user.id, new_role.name)
-            logger.info(f"User {user_id} role upgraded from {old_role.name} to {new_role.name}")
-            return True
-        return False
+        row = await cls._update_user(session, user_id, {"role": new_role}, User.role != new_role, previous=(User.role,))
+        if row is None:
+            return False
+        old_role = row[1]
+        await UserCountService.record(session, {old_role: -1, new_role: 1})
+        # Schedule role upgrade notification
+        call_after_commit(session, role_upgrade_task.delay, user_id, new_role.name)
+        logger.info(f"User {user_id} role upgraded from {old_role.name} to {new_role.name}")
+        return True
 
     @classmethod
+    @retry_transaction
     async def upgrade_professional_status(cls, session: AsyncSession, user_id: UUID) -> bool:
         """
         Upgrade a user's professional status.
@@ -296,13 +510,11 @@ class UserService:
         :param user_id: The ID of the user to upgrade.
         :return: True if the professional status was upgraded successfully, False otherwise.
         """
-        user = await cls.get_by_id(session, user_id)
-        if user and not user.is_professional:
-            user.update_professional_status(True)
-            session.add(user)
-            await session.commit()
-            # Schedule professional status upgrade notification
-            professional_status_upgrade_task.delay(user.id)
-            logger.info(f"User {user_id} professional status upgraded")
-            return True
-        return False
+        # Only a user who is not yet professional is upgraded, so concurrent upgrades notify once
+        values = {"is_professional": True, "professional_status_updated_at": func.now()}
+        if await cls._update_user(session, user_id, values, User.is_professional.isnot(True)) is None:
+            return False
+        # Schedule professional status upgrade notification
+        call_after_commit(session, professional_status_upgrade_task.delay, user_id)
+        logger.info(f"User {user_id} professional status upgraded")
+        return True
@@ -0,0 +1,45 @@
+"""
+Address of the client behind the reverse proxy.
+
+The service runs behind nginx, so the peer of every request is the proxy. When the peer
+is one of `trusted_proxies`, the client is the nearest address in `X-Forwarded-For` (read
+from the right) that is not a trusted proxy itself, or else `X-Real-IP`. Headers sent by
+any other peer are ignored, since a client could set them to anything.
+"""
+
+from builtins import ValueError, any, bool, reversed, str, tuple
+import ipaddress
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from settings.config import settings
+
+
+@lru_cache(maxsize=8)
+def _networks(proxies: Tuple[str, ...]):
+    return tuple(ipaddress.ip_network(proxy, strict=False) for proxy in proxies)
+
+
+def is_trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in _networks(tuple(settings.trusted_proxies)))
+
+
+def client_address(scope) -> Optional[str]:
+    """Address of the client of an ASGI HTTP `scope`, see the module docstring."""
+    peer = scope.get("client")
+    address = peer[0] if peer else None
+    if address is None or not is_trusted_proxy(address):
+        return address
+    headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope.get("headers", [])}
+    forwarded = [part.strip() for part in headers.get("x-forwarded-for", "").split(",") if part.strip()]
+    for hop in reversed(forwarded):
+        address = hop
+        if not is_trusted_proxy(hop):
+            return hop
+    if not forwarded and headers.get("x-real-ip"):
+        return headers["x-real-ip"].strip()
+    return address
@@ -0,0 +1,64 @@
+"""
+Keyset (cursor) pagination over `(created_at, id)`.
+
+A cursor is the sort key of the row a page ends at (or, going backwards, starts at),
+encoded as opaque URL-safe base64 so clients pass it back unchanged. Fetching the page
+after a cursor is an index range scan, whatever the depth of the page, unlike OFFSET.
+"""
+
+from builtins import KeyError, TypeError, UnicodeDecodeError, ValueError, bool, len, str
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import NamedTuple
+from uuid import UUID
+
+from sqlalchemy import DateTime
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+
+
+class Cursor(NamedTuple):
+    created_at: datetime
+    id: UUID
+    backwards: bool = False
+
+
+def encode_cursor(created_at: datetime, id: UUID, backwards: bool = False) -> str:
+    payload = {"t": created_at.isoformat(), "id": str(id)}
+    if backwards:
+        payload["b"] = 1
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    """Raises ValueError for anything that is not a cursor produced by `encode_cursor`."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return Cursor(datetime.fromisoformat(payload["t"]), UUID(payload["id"]), bool(payload.get("b")))
+    except (binascii.Error, UnicodeDecodeError, TypeError, KeyError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+class sortable_timestamp(FunctionElement):
+    """
+    A timestamp column or value in a form that compares correctly with others.
+
+    SQLite stores `CURRENT_TIMESTAMP` defaults as 'YYYY-MM-DD HH:MM:SS' text but binds
+    datetimes with microseconds, so both sides are normalized there; elsewhere this is the
+    expression itself.
+    """
+    type = DateTime(timezone=True)
+    name = "sortable_timestamp"
+    inherit_cache = True
+
+
+@compiles(sortable_timestamp)
+def _compile_sortable_timestamp(element, compiler, **kw):
+    return compiler.process(element.clauses, **kw)
+
+
+@compiles(sortable_timestamp, "sqlite")
+def _compile_sortable_timestamp_sqlite(element, compiler, **kw):
+    return "strftime('%Y-%m-%d %H:%M:%f', " + compiler.process(element.clauses, **kw) + ")"
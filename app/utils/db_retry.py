@@ -0,0 +1,177 @@
+"""
+Retrying of database work that failed for transient reasons.
+
+A retry always replays a whole unit of work after rolling the transaction back, never
+a single statement: PostgreSQL aborts the transaction on serialization failures and
+invalidated cached statements, so re-issuing only the failed statement cannot succeed.
+"""
+
+from builtins import BaseException, bool, dict, float, getattr, int, isinstance, min, str, sum
+import asyncio
+import functools
+import logging
+import random
+import threading
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+from asyncpg.exceptions import InvalidCachedStatementError
+from sqlalchemy.exc import DBAPIError
+
+from app.database import COMMIT_COUNT_KEY, TXN_HAS_WRITES_KEY
+from settings.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Session.info key holding the request's RetryBudget
+RETRY_BUDGET_KEY = "retry_budget"
+
+# serialization_failure, deadlock_detected
+RETRYABLE_SQLSTATES = frozenset({"40001", "40P01"})
+
+_in_retry_scope: ContextVar[bool] = ContextVar("in_retry_scope", default=False)
+
+
+def classify_error(exc: BaseException) -> Optional[str]:
+    """Return the reason `exc` is worth retrying, or None if it is not transient."""
+    if not isinstance(exc, DBAPIError):
+        return None
+    if exc.connection_invalidated:
+        return "connection_lost"
+    orig = exc.orig
+    if isinstance(orig, InvalidCachedStatementError) or isinstance(getattr(orig, "__cause__", None), InvalidCachedStatementError):
+        return "cached_statement_invalid"
+    sqlstate = getattr(orig, "sqlstate", None) or getattr(orig, "pgcode", None)
+    if sqlstate in RETRYABLE_SQLSTATES:
+        return "serialization_failure" if sqlstate == "40001" else "deadlock"
+    if "database is locked" in str(orig):
+        return "database_locked"
+    return None
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Exponential backoff with full jitter between attempts."""
+    max_attempts: int = 3
+    base_delay: float = 0.05
+    max_delay: float = 1.0
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    @classmethod
+    def from_settings(cls) -> "RetryPolicy":
+        return cls(
+            max_attempts=settings.db_retry_max_attempts,
+            base_delay=settings.db_retry_base_delay,
+            max_delay=settings.db_retry_max_delay,
+        )
+
+
+class RetryBudget:
+    """Caps the number of retries a single request may spend across all of its operations."""
+
+    def __init__(self, retries: int):
+        self.remaining = retries
+
+    def take(self) -> bool:
+        if self.remaining <= 0:
+            return False
+        self.remaining -= 1
+        return True
+
+
+class RetryStats:
+    """Process-wide counters of retries and give-ups, by reason."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._retries: Dict[str, int] = {}
+            self._give_ups: Dict[str, int] = {}
+
+    def record_retry(self, reason: str) -> None:
+        with self._lock:
+            self._retries[reason] = self._retries.get(reason, 0) + 1
+
+    def record_give_up(self, reason: str) -> None:
+        with self._lock:
+            self._give_ups[reason] = self._give_ups.get(reason, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "retries": dict(self._retries),
+                "give_ups": dict(self._give_ups),
+                "total_retries": sum(self._retries.values()),
+                "total_give_ups": sum(self._give_ups.values()),
+            }
+
+
+retry_stats = RetryStats()
+
+
+def _session_info(session) -> dict:
+    info = getattr(session, "info", None)
+    return info if isinstance(info, dict) else {}
+
+
+def _committed_since(session, commits_at_start: int) -> bool:
+    return _session_info(session).get(COMMIT_COUNT_KEY, 0) != commits_at_start
+
+
+async def run_with_retry(session, operation: Callable[[], Awaitable[T]], policy: Optional[RetryPolicy] = None) -> T:
+    """
+    Run `operation` (which uses `session`) and replay it after a rollback when it fails
+    with a transient error, sleeping asynchronously between attempts.
+
+    Nested calls run their operation directly; only the outermost call retries, so a
+    replay always covers the complete unit of work. Replaying is only safe if the rollback
+    loses nothing but the failed attempt, so the operation is not retried when the
+    transaction already held writes before it started or when the attempt committed.
+    """
+    if _in_retry_scope.get():
+        return await operation()
+
+    policy = policy or RetryPolicy.from_settings()
+    info = _session_info(session)
+    budget = info.get(RETRY_BUDGET_KEY) or RetryBudget(policy.max_attempts - 1)
+    clean_start = not info.get(TXN_HAS_WRITES_KEY)
+    token = _in_retry_scope.set(True)
+    try:
+        attempt = 0
+        while True:
+            commits_at_start = info.get(COMMIT_COUNT_KEY, 0)
+            try:
+                return await operation()
+            except DBAPIError as exc:
+                reason = classify_error(exc)
+                if reason is None:
+                    raise
+                if (attempt + 1 >= policy.max_attempts or not clean_start
+                        or _committed_since(session, commits_at_start) or not budget.take()):
+                    retry_stats.record_give_up(reason)
+                    logger.warning("Giving up on database operation after %d attempt(s): %s", attempt + 1, reason)
+                    raise
+                retry_stats.record_retry(reason)
+                await session.rollback()
+                delay = policy.delay(attempt)
+                logger.info("Retrying database operation in %.3fs (%s)", delay, reason)
+                await asyncio.sleep(delay)
+                attempt += 1
+    finally:
+        _in_retry_scope.reset(token)
+
+
+def retry_transaction(method: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    """Decorator for service coroutines called as `method(cls, session, ...)`; see `run_with_retry`."""
+    @functools.wraps(method)
+    async def wrapper(cls, session, *args, **kwargs):
+        return await run_with_retry(session, lambda: method(cls, session, *args, **kwargs))
+    return wrapper
@@ -0,0 +1,159 @@
+"""
+Admission control for the password hashing pool.
+
+Every `hash_password_async`/`verify_password_async` call is admitted here before it may
+queue for the pool. At most `password_hash_max_queue` calls are admitted at once
+(running or waiting) and one client may hold at most `password_hash_client_limit` of
+them, so a credential-stuffing burst from one address cannot take the capacity of
+everyone else; the client is the address the proxy forwarded (see `client_address`).
+An admitted call that does not get a worker within `password_hash_max_wait` seconds
+gives up. Each rejection raises `HashingOverloaded`, answered with 503 (429 for a client
+over its share) and a `Retry-After` estimated from the current backlog, instead of
+letting logins queue for tens of seconds.
+
+Background work such as the bulk import is admitted with `background=True`: it waits
+for a worker as long as it takes and is never shed, but it queues at the same semaphore
+as logins, one hash at a time, so a login waits behind at most one hash per worker.
+"""
+
+from builtins import Exception, dict, int, len, max, round, str, super
+import asyncio
+import math
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Dict, Optional
+
+from app.utils.client_address import client_address
+from app.utils.pool_metrics import PoolMetrics
+from settings.config import settings
+
+# Client of the current request, set by `HashingClientMiddleware`
+hashing_client: ContextVar[Optional[str]] = ContextVar("hashing_client", default=None)
+
+# Weight of the latest hash in the moving average of hash durations
+DURATION_SMOOTHING = 0.2
+
+
+class HashingOverloaded(Exception):
+    """The hashing pool cannot take the call; `reason` is queue_full, client_limit or wait_timeout."""
+
+    STATUS_CODES = {"queue_full": 503, "wait_timeout": 503, "client_limit": 429}
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Password hashing overloaded ({reason}), retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def status_code(self) -> int:
+        return self.STATUS_CODES[self.reason]
+
+
+class HashingAdmission:
+    """Bounded, per-client fair admission to the hashing pool, with queue and wait metrics."""
+
+    def __init__(self):
+        self.wait_metrics = PoolMetrics("password_hashing")
+        self.reset()
+
+    def reset(self) -> None:
+        self._loop = None
+        self._workers: Optional[asyncio.Semaphore] = None
+        self.admitted = 0
+        self.running = 0
+        self._per_client: Counter = Counter()
+        self.rejected: Counter = Counter()
+        self.mean_seconds = 0.25  # bcrypt at cost 12, until measured
+        self.wait_metrics.reset()
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # A semaphore belongs to one event loop; a new loop (e.g. per test) starts afresh
+        loop = asyncio.get_running_loop()
+        if self._workers is None or self._loop is not loop:
+            self._loop = loop
+            self._workers = asyncio.Semaphore(settings.password_hash_workers)
+        return self._workers
+
+    def retry_after(self) -> int:
+        """Seconds until the admitted calls are likely done, at least 1."""
+        return max(1, math.ceil(self.admitted * self.mean_seconds / settings.password_hash_workers))
+
+    def _reject(self, reason: str) -> HashingOverloaded:
+        self.rejected[reason] += 1
+        return HashingOverloaded(reason, self.retry_after())
+
+    @asynccontextmanager
+    async def admit(self, client: Optional[str] = None, background: bool = False) -> AsyncIterator[None]:
+        """
+        Hold a hashing worker for the block, or raise `HashingOverloaded`. A `background`
+        caller is not limited, shed or counted against a client; it waits for its turn.
+        """
+        client = None if background else client if client is not None else hashing_client.get()
+        if not background and self.admitted >= settings.password_hash_max_queue:
+            raise self._reject("queue_full")
+        if client is not None and self._per_client[client] >= settings.password_hash_client_limit:
+            raise self._reject("client_limit")
+        workers = self._semaphore()
+        self.admitted += 1
+        if client is not None:
+            self._per_client[client] += 1
+        try:
+            queued = time.perf_counter()
+            try:
+                # Not wait_for: on Python 3.11 it can drop a permit acquired as the timeout fires
+                async with asyncio.timeout(None if background else settings.password_hash_max_wait):
+                    await workers.acquire()
+            except TimeoutError:
+                self.wait_metrics.record_timeout()
+                raise self._reject("wait_timeout")
+            started = time.perf_counter()
+            self.wait_metrics.observe_wait(started - queued)
+            self.running += 1
+            try:
+                yield
+            finally:
+                self.running -= 1
+                workers.release()
+                self.mean_seconds += DURATION_SMOOTHING * (time.perf_counter() - started - self.mean_seconds)
+        finally:
+            self.admitted -= 1
+            if client is not None:
+                self._per_client[client] -= 1
+                if self._per_client[client] <= 0:
+                    del self._per_client[client]
+
+    def snapshot(self) -> Dict:
+        """Queue depth, wait-time histogram and rejections, for the admin endpoint."""
+        data = self.wait_metrics.snapshot()
+        data.update(
+            running=self.running,
+            waiting=self.admitted - self.running,
+            max_queue=settings.password_hash_max_queue,
+            workers=settings.password_hash_workers,
+            clients=len(self._per_client),
+            mean_hash_seconds=round(self.mean_seconds, 4),
+            rejected=dict(self.rejected),
+        )
+        return data
+
+
+hashing_admission = HashingAdmission()
+
+
+class HashingClientMiddleware:
+    """ASGI middleware recording the client address (see `client_address`) of each HTTP request for `HashingAdmission`."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = hashing_client.set(client_address(scope))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            hashing_client.reset(token)
@@ -1,5 +1,5 @@
 from builtins import dict, int, max, str
-from typing import List, Callable
+from typing import List, Callable, Optional
 from urllib.parse import urlencode
 from uuid import UUID
 
@@ -16,6 +16,10 @@ def create_pagination_link(rel: str, base_url: str, params: dict) -> PaginationL
     query_string = f"skip={params['skip']}&limit={params['limit']}"
     return PaginationLink(rel=rel, href=f"{base_url}?{query_string}")
 
+def create_cursor_link(rel: str, base_url: str, cursor: Optional[str], limit: int) -> PaginationLink:
+    query_string = urlencode({'cursor': cursor, 'limit': limit}) if cursor else f"skip=0&limit={limit}"
+    return PaginationLink(rel=rel, href=f"{base_url}?{query_string}")
+
 def create_user_links(user_id: UUID, request: Request) -> List[Link]:
     """
     Generate navigation links for user actions.
@@ -30,19 +34,42 @@ def create_user_links(user_id: UUID, request: Request) -> List[Link]:
         for rel, action, method, action_desc in actions
     ]
 
-def generate_pagination_links(request: Request, skip: int, limit: int, total_items: int) -> List[PaginationLink]:
-    base_url = str(request.url)
-    total_pages = (total_items + limit - 1) // limit
+def generate_pagination_links(request: Request, skip: int, limit: int, total_items: Optional[int], cursor: Optional[str] = None,
+                              next_cursor: Optional[str] = None, prev_cursor: Optional[str] = None) -> List[PaginationLink]:
+    """
+    Offset links (self, first, last, next, prev) for a page fetched with `skip`, plus a
+    `next_cursor` link to continue with keyset pagination. When the page itself was
+    fetched with `cursor`, self, next and prev are cursor links and there is no last link.
+    Without `total_items` there is no last link either, and next follows `next_cursor`.
+    """
+    # Page links carry their own query string
+    base_url = str(request.url).split("?")[0]
+    if cursor is not None:
+        links = [
+            create_cursor_link("self", base_url, cursor, limit),
+            create_cursor_link("first", base_url, None, limit),
+        ]
+        if next_cursor:
+            links.append(create_cursor_link("next", base_url, next_cursor, limit))
+        if prev_cursor:
+            links.append(create_cursor_link("prev", base_url, prev_cursor, limit))
+        return links
+
     links = [
         create_pagination_link("self", base_url, {'skip': skip, 'limit': limit}),
         create_pagination_link("first", base_url, {'skip': 0, 'limit': limit}),
-        create_pagination_link("last", base_url, {'skip': max(0, (total_pages - 1) * limit), 'limit': limit})
     ]
+    if total_items is not None:
+        total_pages = (total_items + limit - 1) // limit
+        links.append(create_pagination_link("last", base_url, {'skip': max(0, (total_pages - 1) * limit), 'limit': limit}))
 
-    if skip + limit < total_items:
+    if skip + limit < total_items if total_items is not None else next_cursor:
         links.append(create_pagination_link("next", base_url, {'skip': skip + limit, 'limit': limit}))
 
     if skip > 0:
         links.append(create_pagination_link("prev", base_url, {'skip': max(skip - limit, 0), 'limit': limit}))
 
+    if next_cursor:
+        links.append(create_cursor_link("next_cursor", base_url, next_cursor, limit))
+
     return links
@@ -1,10 +1,68 @@
-from builtins import str
+from builtins import len, list, range, set, str
 import random
+from typing import List, Optional
+
+from app.utils.bloom_filter import BloomFilter
+from settings.config import settings
+
+# 128 adjectives x 128 animals x 10,000 numbers: about 164 million nicknames by default
+ADJECTIVES = [
+    "clever", "jolly", "brave", "sly", "gentle", "agile", "amber", "ancient", "azure", "bold",
+    "bouncy", "breezy", "bright", "brisk", "bubbly", "calm", "candid", "cheerful", "chill", "cosmic",
+    "cozy", "crafty", "crimson", "crisp", "curious", "daring", "dapper", "dashing", "dazzling", "deft",
+    "eager", "earnest", "electric", "elegant", "epic", "fancy", "fearless", "feisty", "fierce", "fluffy",
+    "frosty", "funky", "fuzzy", "giddy", "gleaming", "glossy", "golden", "graceful", "grand", "happy",
+    "hardy", "hasty", "hearty", "heroic", "humble", "icy", "jazzy", "jovial", "keen", "kind",
+    "lively", "loyal", "lucky", "lunar", "magic", "majestic", "mellow", "merry", "mighty", "misty",
+    "modest", "mystic", "nimble", "noble", "nifty", "odd", "olive", "opal", "patient", "peppy",
+    "perky", "placid", "plucky", "polite", "proud", "quick", "quiet", "quirky", "radiant", "rapid",
+    "regal", "rosy", "rowdy", "rustic", "sassy", "scarlet", "serene", "shiny", "silent", "silver",
+    "sleek", "sleepy", "smart", "snappy", "snowy", "solar", "spicy", "spry", "stellar", "stormy",
+    "sturdy", "sunny", "swift", "tidy", "tiny", "tranquil", "trusty", "vivid", "wandering", "warm",
+    "whimsical", "wild", "wise", "witty", "zany", "zealous", "zesty", "zippy",
+]
+ANIMALS = [
+    "panda", "fox", "raccoon", "koala", "lion", "alpaca", "antelope", "armadillo", "badger", "bat",
+    "beaver", "bison", "boar", "bobcat", "buffalo", "camel", "capybara", "caribou", "cat", "cheetah",
+    "chinchilla", "cobra", "cougar", "coyote", "crab", "crane", "crow", "deer", "dingo", "dolphin",
+    "donkey", "dove", "dragonfly", "duck", "eagle", "eel", "elephant", "elk", "emu", "falcon",
+    "ferret", "finch", "flamingo", "frog", "gazelle", "gecko", "gerbil", "giraffe", "goat", "goose",
+    "gorilla", "hamster", "hare", "hawk", "hedgehog", "heron", "hippo", "hornet", "horse", "hyena",
+    "ibex", "iguana", "impala", "jackal", "jaguar", "jellyfish", "kangaroo", "kestrel", "kingfisher", "kiwi",
+    "lemur", "leopard", "llama", "lobster", "lynx", "macaw", "magpie", "manatee", "marmot", "meerkat",
+    "mink", "mole", "mongoose", "moose", "narwhal", "newt", "ocelot", "octopus", "okapi", "orca",
+    "osprey", "ostrich", "otter", "owl", "ox", "panther", "parrot", "pelican", "penguin", "pheasant",
+    "pigeon", "platypus", "puffin", "puma", "quail", "quokka", "rabbit", "raven", "reindeer", "rhino",
+    "robin", "salmon", "seal", "shark", "sloth", "sparrow", "squid", "squirrel", "stork", "swan",
+    "tapir", "tiger", "toucan", "turtle", "walrus", "weasel", "wolf", "wombat",
+]
+
+# Nicknames known to be taken, filled as users are created and collisions are seen
+taken_nicknames = BloomFilter(settings.nickname_bloom_capacity, settings.nickname_bloom_error_rate)
 
 
 def generate_nickname() -> str:
     """Generate a URL-safe nickname using adjectives and animal names."""
-    adjectives = ["clever", "jolly", "brave", "sly", "gentle"]
-    animals = ["panda", "fox", "raccoon", "koala", "lion"]
-    number = random.randint(0, 999)
+    adjectives = settings.nickname_adjectives or ADJECTIVES
+    animals = settings.nickname_animals or ANIMALS
+    number = random.randint(0, settings.nickname_max_number)
     return f"{random.choice(adjectives)}_{random.choice(animals)}_{number}"
+
+
+def nickname_candidates(count: int, taken: Optional[BloomFilter] = None) -> List[str]:
+    """
+    Up to `count` distinct nicknames, skipping the ones the Bloom filter of taken
+    nicknames already knows about. A false positive only costs a candidate.
+    """
+    taken = taken_nicknames if taken is None else taken
+    candidates: List[str] = []
+    seen = set()
+    for _ in range(count * 4):
+        nickname = generate_nickname()
+        if nickname in seen or nickname in taken:
+            continue
+        seen.add(nickname)
+        candidates.append(nickname)
+        if len(candidates) == count:
+            break
+    return candidates
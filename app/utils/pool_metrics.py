@@ -0,0 +1,105 @@
+from builtins import dict, float, int, isinstance, len, max, str, zip
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+
+# Upper bounds (seconds) of the checkout wait-time histogram buckets
+WAIT_BUCKETS: Tuple[float, ...] = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class PoolMetrics:
+    """Collects checkout wait times and timeouts for one connection pool."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._bucket_counts = [0] * (len(WAIT_BUCKETS) + 1)
+            self._wait_count = 0
+            self._wait_sum = 0.0
+            self._wait_max = 0.0
+            self._timeouts = 0
+
+    def observe_wait(self, seconds: float) -> None:
+        with self._lock:
+            self._bucket_counts[bisect_left(WAIT_BUCKETS, seconds)] += 1
+            self._wait_count += 1
+            self._wait_sum += seconds
+            self._wait_max = max(self._wait_max, seconds)
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self._timeouts += 1
+
+    def snapshot(self, pool: Optional[Pool] = None) -> Dict:
+        """Return the wait histogram (cumulative, Prometheus style) plus live pool gauges."""
+        with self._lock:
+            cumulative, buckets = 0, {}
+            for bound, count in zip(WAIT_BUCKETS, self._bucket_counts):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            buckets["+Inf"] = self._wait_count
+            data = {
+                "name": self.name,
+                "wait_seconds": {
+                    "buckets": buckets,
+                    "count": self._wait_count,
+                    "sum": self._wait_sum,
+                    "max": self._wait_max,
+                },
+                "timeouts": self._timeouts,
+            }
+        if pool is not None:
+            data.update(pool_gauges(pool))
+        return data
+
+
+def pool_gauges(pool: Pool) -> Dict:
+    """Live occupancy of a pool; queue-based pools report size/overflow, others only their status line."""
+    gauges = {"pool_class": type(pool).__name__, "status": pool.status()}
+    if isinstance(pool, QueuePool):
+        gauges.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=max(pool.overflow(), 0),
+        )
+    return gauges
+
+
+class _WaitTimingMixin:
+    """Times how long `_do_get` blocks before handing out a connection."""
+    metrics: Optional[PoolMetrics] = None
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            if self.metrics is not None:
+                self.metrics.record_timeout()
+            raise
+        finally:
+            if self.metrics is not None:
+                self.metrics.observe_wait(time.perf_counter() - started)
+
+    def recreate(self):
+        # engine.dispose() swaps in a fresh pool; keep reporting into the same metrics
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+class InstrumentedQueuePool(_WaitTimingMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_WaitTimingMixin, AsyncAdaptedQueuePool):
+    pass
@@ -0,0 +1,150 @@
+"""
+Request-scoped query counting and per-route query budgets.
+
+Every statement executed on any engine is counted against the `QueryCounter` of the
+current request (or of a `count_queries()` block in tests), together with its database
+time. Routes declare how many statements they may issue with `@query_budget(n)` (and,
+if it differs, with users sharded); going over the budget logs a warning, or fails the
+request in strict mode. Statements repeated
+many times within one request are reported as likely N+1 patterns.
+"""
+
+from builtins import Exception, dict, enumerate, getattr, int, len, list, setattr, sorted, str
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.database import Database
+from app.utils.statement_stats import normalize_statement
+from settings.config import settings
+
+logger = logging.getLogger(__name__)
+
+_BUDGET_ATTR = "__query_budget__"
+_START_ATTR = "_query_budget_start"
+
+_current_counter: ContextVar[Optional["QueryCounter"]] = ContextVar("query_counter", default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised in strict mode when a request issues more statements than its route allows."""
+
+
+class QueryCounter:
+    """Statements and database time of one request."""
+
+    def __init__(self):
+        self.statements: List[str] = []
+        self.db_time = 0.0
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def record(self, statement: str, elapsed: float) -> None:
+        self.statements.append(statement)
+        self.db_time += elapsed
+
+    def repeated(self, threshold: Optional[int] = None) -> List[Tuple[str, int]]:
+        """Normalized statements executed at least `threshold` times: likely N+1 loops."""
+        threshold = threshold or settings.db_n_plus_one_threshold
+        counts = Counter(normalize_statement(statement) for statement in self.statements)
+        return sorted(((sql, n) for sql, n in counts.items() if n >= threshold), key=lambda item: -item[1])
+
+    def describe(self) -> str:
+        lines = [f"{self.count} statement(s) in {self.db_time * 1000:.1f} ms:"]
+        lines += [f"  {index + 1}. {statement}" for index, statement in enumerate(self.statements)]
+        return "\n".join(lines)
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryCounter]:
+    """Count the statements executed (on any engine) within the block."""
+    counter = QueryCounter()
+    token = _current_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _current_counter.reset(token)
+
+
+def query_budget(max_queries: int, sharded: Optional[int] = None) -> Callable:
+    """
+    Declare the maximum number of statements a route may execute per request; `sharded`
+    is the maximum when users are sharded, e.g. for routes that look up a user's shard
+    in the directory first.
+    """
+    def decorator(endpoint):
+        setattr(endpoint, _BUDGET_ATTR, (max_queries, sharded))
+        return endpoint
+    return decorator
+
+
+def budget_of(endpoint) -> Optional[int]:
+    """The query budget `endpoint` declared for the current (sharded or not) database, if any."""
+    budget = getattr(endpoint, _BUDGET_ATTR, None)
+    if budget is None:
+        return None
+    max_queries, sharded = budget
+    return sharded if sharded is not None and Database.is_sharded() else max_queries
+
+
+def check_budget(counter: QueryCounter, budget: Optional[int], route: str) -> None:
+    """Warn about (or, in strict mode, raise on) an exceeded budget and repeated statements."""
+    for statement, times in counter.repeated():
+        logger.warning(f"Possible N+1 in {route}: executed {times} times: {statement}")
+    if budget is None or counter.count <= budget:
+        return
+    message = f"{route} exceeded its query budget of {budget}: {counter.describe()}"
+    if settings.db_query_budget_strict:
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _current_counter.get() is not None:
+        setattr(context, _START_ATTR, time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    counter = _current_counter.get()
+    if counter is not None:
+        started = getattr(context, _START_ATTR, None)
+        counter.record(statement, time.perf_counter() - started if started is not None else 0.0)
+
+
+class QueryBudgetMiddleware:
+    """
+    ASGI middleware giving each HTTP request its own `QueryCounter`.
+
+    The budget is checked when the response starts, after the endpoint and its
+    dependencies (including the unit-of-work commit) have run; the statement count
+    and database time are reported in a `Server-Timing` header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with count_queries() as counter:
+            async def send_with_budget(message):
+                if message["type"] == "http.response.start":
+                    endpoint = scope.get("endpoint")
+                    check_budget(counter, budget_of(endpoint), getattr(endpoint, "__name__", scope["path"]))
+                    timing = f'db;dur={counter.db_time * 1000:.1f};desc="{counter.count} queries"'
+                    message = dict(message, headers=list(message.get("headers", [])) + [(b"server-timing", timing.encode())])
+                await send(message)
+
+            await self.app(scope, receive, send_with_budget)
@@ -1,19 +1,176 @@
 # app/security.py
-from builtins import Exception, ValueError, bool, int, str
+from builtins import Exception, NotImplementedError, ValueError, bool, dict, float, int, len, max, range, sorted, str
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
 import secrets
+import time
 import bcrypt
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from logging import getLogger
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import argon2
+    from argon2.exceptions import VerifyMismatchError
+except ImportError:  # optional, `pip install argon2-cffi` to hash with argon2id
+    argon2 = None
+
+from app.utils.hashing_admission import hashing_admission
+from settings.config import settings
 
 # Set up logging
 logger = getLogger(__name__)
 
-def hash_password(password: str, rounds: int = 12) -> str:
+
+class PasswordHasher:
+    """A password hashing scheme, recognized by the prefixes of the hashes it makes."""
+
+    name: str
+    prefixes: Tuple[str, ...]
+
+    def hash(self, password: str) -> str:
+        raise NotImplementedError
+
+    def verify(self, password: str, hashed_password: str) -> bool:
+        raise NotImplementedError
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """Whether the hash was made with other parameters than new hashes get."""
+        raise NotImplementedError
+
+
+class BcryptHasher(PasswordHasher):
+    """bcrypt at `rounds`, or at `target_rounds()` (see `calibrate_rounds`)."""
+
+    name = "bcrypt"
+    prefixes = ("$2a$", "$2b$", "$2y$")
+
+    def __init__(self, rounds: Optional[int] = None):
+        self.rounds = rounds
+
+    def hash(self, password: str) -> str:
+        rounds = self.rounds if self.rounds is not None else target_rounds()
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+    def verify(self, password: str, hashed_password: str) -> bool:
+        return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        return hash_rounds(hashed_password) != (self.rounds if self.rounds is not None else target_rounds())
+
+
+class ScryptHasher(PasswordHasher):
+    """
+    scrypt from the standard library, stored as `$scrypt$ln=15,r=8,p=1$<salt>$<key>`.
+    Needs 128 * r * 2**ln bytes of memory per hash (32 MiB by default).
+    """
+
+    name = "scrypt"
+    prefixes = ("$scrypt$",)
+    SALT_BYTES = 16
+    KEY_BYTES = 32
+
+    def __init__(self, cost: Optional[int] = None, block_size: Optional[int] = None, parallelism: Optional[int] = None):
+        self.cost = cost or settings.password_hash_scrypt_cost
+        self.block_size = block_size or settings.password_hash_scrypt_block_size
+        self.parallelism = parallelism or settings.password_hash_scrypt_parallelism
+
+    @property
+    def parameters(self) -> str:
+        return f"ln={self.cost},r={self.block_size},p={self.parallelism}"
+
+    @staticmethod
+    def _derive(password: str, salt: bytes, cost: int, block_size: int, parallelism: int) -> bytes:
+        return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=2 ** cost, r=block_size, p=parallelism,
+                              maxmem=129 * block_size * (2 ** cost + parallelism) + 2 ** 20, dklen=ScryptHasher.KEY_BYTES)
+
+    @staticmethod
+    def _encode(data: bytes) -> str:
+        return base64.urlsafe_b64encode(data).decode('ascii').rstrip("=")
+
+    @staticmethod
+    def _decode(text: str) -> bytes:
+        return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+    def hash(self, password: str) -> str:
+        salt = os.urandom(self.SALT_BYTES)
+        key = self._derive(password, salt, self.cost, self.block_size, self.parallelism)
+        return f"$scrypt${self.parameters}${self._encode(salt)}${self._encode(key)}"
+
+    def verify(self, password: str, hashed_password: str) -> bool:
+        _, _, parameters, salt, key = hashed_password.split("$")
+        values = dict(item.split("=") for item in parameters.split(","))
+        derived = self._derive(password, self._decode(salt), int(values["ln"]), int(values["r"]), int(values["p"]))
+        return hmac.compare_digest(derived, self._decode(key))
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        return hashed_password.split("$")[2] != self.parameters
+
+
+class Argon2Hasher(PasswordHasher):
+    """argon2id through argon2-cffi, with its time cost, memory (KiB) and lanes."""
+
+    name = "argon2id"
+    prefixes = ("$argon2id$", "$argon2i$", "$argon2d$")
+
+    def __init__(self, time_cost: Optional[int] = None, memory_cost: Optional[int] = None, parallelism: Optional[int] = None):
+        self._hasher = argon2.PasswordHasher(
+            time_cost=time_cost or settings.password_hash_argon2_time_cost,
+            memory_cost=memory_cost or settings.password_hash_argon2_memory_kib,
+            parallelism=parallelism or settings.password_hash_argon2_parallelism,
+        )
+
+    def hash(self, password: str) -> str:
+        return self._hasher.hash(password)
+
+    def verify(self, password: str, hashed_password: str) -> bool:
+        try:
+            return self._hasher.verify(hashed_password, password)
+        except VerifyMismatchError:
+            return False
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        return self._hasher.check_needs_rehash(hashed_password)
+
+
+# Hashers by name; stored hashes of any of them verify, new ones use `password_hash_algorithm`
+HASHERS: Dict[str, PasswordHasher] = {}
+
+def register_hasher(hasher: PasswordHasher) -> None:
+    HASHERS[hasher.name] = hasher
+
+register_hasher(BcryptHasher())
+register_hasher(ScryptHasher())
+if argon2 is not None:
+    register_hasher(Argon2Hasher())
+
+def default_hasher() -> PasswordHasher:
+    """The hasher of new passwords, `password_hash_algorithm`."""
+    hasher = HASHERS.get(settings.password_hash_algorithm)
+    if hasher is None:
+        hint = " (install argon2-cffi)" if settings.password_hash_algorithm == "argon2id" else ""
+        raise ValueError(f"Unknown password hash algorithm {settings.password_hash_algorithm!r}{hint}")
+    return hasher
+
+def hasher_for(hashed_password: str) -> Optional[PasswordHasher]:
+    """The registered hasher that made `hashed_password`, by its prefix."""
+    for hasher in HASHERS.values():
+        if hashed_password.startswith(hasher.prefixes):
+            return hasher
+    return None
+
+def hash_password(password: str, rounds: Optional[int] = None) -> str:
     """
-    Hashes a password using bcrypt with a specified cost factor.
+    Hashes a password with the default hasher (`password_hash_algorithm`).
     
     Args:
         password (str): The plain text password to hash.
-        rounds (int): The cost factor that determines the computational cost of hashing.
+        rounds (int): A bcrypt cost factor; when given, the password is hashed with bcrypt
+            at that cost whatever the default hasher.
 
     Returns:
         str: The hashed password.
@@ -22,20 +179,23 @@ def hash_password(password: str, rounds: int = 12) -> str:
         ValueError: If hashing the password fails.
     """
     try:
-        salt = bcrypt.gensalt(rounds=rounds)
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), salt)
-        return hashed_password.decode('utf-8')
+        hasher = BcryptHasher(rounds) if rounds is not None else default_hasher()
+        return hasher.hash(password)
     except Exception as e:
         logger.error("Failed to hash password: %s", e)
         raise ValueError("Failed to hash password") from e
 
+def hash_passwords(passwords: List[str], rounds: Optional[int] = None) -> List[str]:
+    """Hashes several passwords in one call, so a process pool gets them in one message."""
+    return [hash_password(password, rounds) for password in passwords]
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
-    Verifies a plain text password against a hashed password.
+    Verifies a plain text password against a hash made by any registered hasher.
     
     Args:
         plain_password (str): The plain text password to verify.
-        hashed_password (str): The bcrypt hashed password.
+        hashed_password (str): The stored hash.
 
     Returns:
         bool: True if the password is correct, False otherwise.
@@ -44,10 +204,128 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         ValueError: If the hashed password format is incorrect or the function fails to verify.
     """
     try:
-        return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+        hasher = hasher_for(hashed_password)
+        if hasher is None:
+            raise ValueError("Unrecognized password hash format")
+        return hasher.verify(plain_password, hashed_password)
     except Exception as e:
         logger.error("Error verifying password: %s", e)
         raise ValueError("Authentication process encountered an unexpected error") from e
 
 def generate_verification_token():
-    return secrets.token_urlsafe(16)  # Generates a secure 16-byte URL-safe token
\ No newline at end of file
+    return secrets.token_urlsafe(16)  # Generates a secure 16-byte URL-safe token
+
+
+# Cost of new hashes: `password_hash_rounds`, or the calibrated cost once set
+_target_rounds: Optional[int] = None
+
+def target_rounds() -> int:
+    return _target_rounds if _target_rounds is not None else settings.password_hash_rounds
+
+def set_target_rounds(rounds: Optional[int]) -> None:
+    """Use `rounds` for new hashes (None returns to `password_hash_rounds`)."""
+    global _target_rounds
+    _target_rounds = rounds
+
+def hash_rounds(hashed_password: str) -> Optional[int]:
+    """The cost stored in a bcrypt hash (`$2b$12$...`), or None if it is not a bcrypt hash."""
+    parts = hashed_password.split("$")
+    if len(parts) != 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+def needs_rehash(hashed_password: str) -> bool:
+    """
+    Whether a stored hash should be replaced on the next login: it was made by another
+    hasher than the default one, or with other parameters. Unrecognized hashes are left alone.
+    """
+    hasher = hasher_for(hashed_password)
+    if hasher is None:
+        return False
+    default = default_hasher()
+    return hasher is not default or default.needs_rehash(hashed_password)
+
+def _time_hash(rounds: int, samples: int) -> float:
+    """Median milliseconds of hashing at `rounds`."""
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        bcrypt.hashpw(b"calibration", bcrypt.gensalt(rounds=rounds))
+        timings.append((time.perf_counter() - started) * 1000)
+    return sorted(timings)[samples // 2]
+
+def calibrate_rounds(target_ms: float, min_rounds: int = 10, max_rounds: int = 16, samples: int = 3) -> int:
+    """
+    The highest bcrypt cost between `min_rounds` and `max_rounds` whose hash takes at most
+    `target_ms` on this host. Each cost step doubles the work, so the cost is extrapolated
+    from timing `min_rounds` and then checked with one hash at the chosen cost.
+    """
+    base_ms = max(_time_hash(min_rounds, samples), 0.001)
+    rounds = min_rounds
+    while rounds < max_rounds and base_ms * 2 ** (rounds + 1 - min_rounds) <= target_ms:
+        rounds += 1
+    if rounds > min_rounds and _time_hash(rounds, 1) > target_ms:
+        rounds -= 1
+    if base_ms > target_ms:
+        logger.warning("bcrypt cost %s takes %.0f ms, above the %.0f ms target", min_rounds, base_ms, target_ms)
+    return rounds
+
+async def calibrate_hashing() -> int:
+    """Calibrate the cost of new hashes to `password_hash_target_ms` on the hashing pool."""
+    rounds = await run_hashing(calibrate_rounds, settings.password_hash_target_ms,
+                               settings.password_hash_min_rounds, settings.password_hash_max_rounds)
+    set_target_rounds(rounds)
+    # Worker processes got the cost of when they started; the next call starts new ones
+    if settings.password_hash_executor == "process":
+        shutdown_hashing_executor()
+    logger.info("bcrypt cost calibrated to %s for a %.0f ms target", rounds, settings.password_hash_target_ms)
+    return rounds
+
+
+# bcrypt takes ~250 ms at cost 12; async code hashes in this pool instead of on the event loop
+_hashing_executor: Optional[Executor] = None
+
+def hashing_executor() -> Executor:
+    """
+    The pool password hashing runs in: `password_hash_workers` threads (bcrypt releases
+    the GIL while hashing) or, with `password_hash_executor = "process"`, processes.
+    Created on first use, so that each forked server worker gets its own.
+    """
+    global _hashing_executor
+    if _hashing_executor is None:
+        if settings.password_hash_executor == "process":
+            _hashing_executor = ProcessPoolExecutor(max_workers=settings.password_hash_workers,
+                                                    initializer=set_target_rounds, initargs=(_target_rounds,))
+        else:
+            _hashing_executor = ThreadPoolExecutor(max_workers=settings.password_hash_workers, thread_name_prefix="password-hash")
+    return _hashing_executor
+
+def shutdown_hashing_executor() -> None:
+    global _hashing_executor
+    if _hashing_executor is not None:
+        _hashing_executor.shutdown(wait=False, cancel_futures=True)
+        _hashing_executor = None
+
+async def run_hashing(function: Callable, *args: Any) -> Any:
+    """Run `function(*args)` (a module-level function, for process pools) in the hashing pool."""
+    return await asyncio.get_running_loop().run_in_executor(hashing_executor(), function, *args)
+
+async def hash_password_async(password: str, rounds: Optional[int] = None) -> str:
+    """`hash_password` without blocking the event loop; raises `HashingOverloaded` when the pool is saturated."""
+    async with hashing_admission.admit():
+        return await run_hashing(hash_password, password, rounds)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """`verify_password` without blocking the event loop; raises `HashingOverloaded` when the pool is saturated."""
+    async with hashing_admission.admit():
+        return await run_hashing(verify_password, plain_password, hashed_password)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find the bcrypt cost whose hash fits a latency budget on this host.")
+    parser.add_argument("--target-ms", type=float, default=settings.password_hash_target_ms or 250.0)
+    parser.add_argument("--min-rounds", type=int, default=settings.password_hash_min_rounds)
+    parser.add_argument("--max-rounds", type=int, default=settings.password_hash_max_rounds)
+    args = parser.parse_args()
+    chosen = calibrate_rounds(args.target_ms, args.min_rounds, args.max_rounds)
+    print(f"bcrypt cost {chosen}: {_time_hash(chosen, 3):.0f} ms per hash (target {args.target_ms:.0f} ms)")
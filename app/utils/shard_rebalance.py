@@ -0,0 +1,116 @@
+"""
+Moves users to the shard their id hashes to after shards were added, and lists every
+user in the directory.
+
+Run it once the new shard URL has been appended to `DATABASE_SHARD_URLS` and the
+application restarted with it, and once when sharding is first enabled:
+
+    python -m app.utils.shard_rebalance [--batch-size 500] [--dry-run]
+
+Each batch is first copied to its target shard, then the directory is pointed at the
+target, then the rows are deleted from the source. Directory entries of all scanned
+users, moved or not, are upserted, so users missing from the directory (e.g. created
+before sharding was enabled) are listed as well. An interrupted run leaves at worst
+rows present on both shards with the directory already pointing at one of them, so it
+is safe to simply run the tool again.
+"""
+
+from builtins import dict, len, print, set
+import argparse
+import asyncio
+import logging
+from typing import Any, Dict, List
+
+from sqlalchemy import select
+
+from app.database import Database
+from app.models.user_model import User, UserDirectory
+from settings.config import settings
+
+logger = logging.getLogger(__name__)
+
+users = User.__table__
+directory = UserDirectory.__table__
+
+
+async def _list(rows: List[Dict[str, Any]], shard_id: str) -> None:
+    """Upsert the directory entries of `rows`, pointing them at `shard_id`."""
+    entries = [{"email": row["email"], "nickname": row["nickname"], "user_id": row["id"], "shard_id": shard_id} for row in rows]
+    async with Database._async_engine.begin() as connection:
+        query = Database.insert(connection, directory)
+        query = query.on_conflict_do_update(
+            index_elements=[directory.c.email],
+            set_={"nickname": query.excluded.nickname, "user_id": query.excluded.user_id, "shard_id": query.excluded.shard_id},
+        )
+        await connection.execute(query, entries)
+
+
+async def _move(rows: List[Dict[str, Any]], source, target, target_shard: str) -> None:
+    ids = [row["id"] for row in rows]
+    async with target.begin() as connection:
+        present = set((await connection.execute(select(users.c.id).where(users.c.id.in_(ids)))).scalars())
+        missing = [row for row in rows if row["id"] not in present]
+        if missing:
+            await connection.execute(users.insert(), missing)
+    await _list(rows, target_shard)
+    async with source.begin() as connection:
+        await connection.execute(users.delete().where(users.c.id.in_(ids)))
+
+
+async def rebalance(batch_size: int = 500, dry_run: bool = False) -> Dict[str, int]:
+    """Move every misplaced user to its shard and list every user in the directory.
+
+    Returns the number of users scanned and moved.
+    """
+    if not Database.is_sharded():
+        raise RuntimeError("Sharding is not configured.")
+    engines = Database.shard_engines()
+    stats = {"scanned": 0, "moved": 0}
+    for source_shard, source in engines.items():
+        last_id = None
+        while True:
+            query = select(users).order_by(users.c.id).limit(batch_size)
+            if last_id is not None:
+                query = query.where(users.c.id > last_id)
+            async with source.connect() as connection:
+                rows = [dict(row) for row in (await connection.execute(query)).mappings()]
+            if not rows:
+                break
+            last_id = rows[-1]["id"]
+            stats["scanned"] += len(rows)
+
+            placed: List[Dict[str, Any]] = []
+            misplaced: Dict[str, List[Dict[str, Any]]] = {}
+            for row in rows:
+                target_shard = Database.shard_for(row["id"])
+                if target_shard != source_shard:
+                    misplaced.setdefault(target_shard, []).append(row)
+                else:
+                    placed.append(row)
+            if placed and not dry_run:
+                await _list(placed, source_shard)
+            for target_shard, batch in misplaced.items():
+                stats["moved"] += len(batch)
+                logger.info(f"Moving {len(batch)} user(s) from {source_shard} to {target_shard}")
+                if not dry_run:
+                    await _move(batch, source, engines[target_shard], target_shard)
+    return stats
+
+
+async def _main(batch_size: int, dry_run: bool) -> None:
+    Database.initialize(settings.database_url, None, settings.debug, shard_urls=settings.database_shard_urls)
+    try:
+        stats = await rebalance(batch_size, dry_run)
+    finally:
+        for engine in Database.async_engines():
+            await engine.dispose()
+    print(f"{'Would move' if dry_run else 'Moved'} {stats['moved']} of {stats['scanned']} user(s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move users to the shard their id hashes to.")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="Only report how many users would move")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(args.batch_size, args.dry_run))
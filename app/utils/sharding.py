@@ -0,0 +1,134 @@
+"""
+Hash sharding of user rows across several databases.
+
+Users are placed by a jump consistent hash of their UUID, so growing the cluster from
+N to N+1 shards moves only about 1/(N+1) of the rows (see `shard_rebalance`). Tables
+that are not sharded, such as the email directory used to find the shard of a user by
+email, live on a separate "directory" database.
+
+`ShardRouter` provides the three callables SQLAlchemy's `ShardedSession` needs to pick
+the database of an instance, of a primary key and of a statement.
+"""
+
+from builtins import getattr, hasattr, int, isinstance, len, list, set, setattr, str
+import uuid
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.elements import BinaryExpression, BindParameter, BooleanClauseList
+
+DIRECTORY_SHARD = "directory"
+
+_MASK_64 = (1 << 64) - 1
+
+
+def sync_url(url: str) -> str:
+    """The default synchronous driver's URL for an async database URL (asyncpg -> psycopg2, aiosqlite -> sqlite3)."""
+    parsed = make_url(url)
+    return parsed.set(drivername=parsed.get_backend_name()).render_as_string(hide_password=False)
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """Jump consistent hash (Lamping & Veach): maps `key` to a bucket in [0, buckets)."""
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & _MASK_64
+        j = int((b + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return b
+
+
+def _hash_key(value: Any) -> int:
+    if isinstance(value, str):
+        value = uuid.UUID(value)
+    # Fold the 128-bit UUID into the 64 bits the hash works on
+    return (value.int >> 64) ^ (value.int & _MASK_64)
+
+
+class ShardRouter:
+    """
+    Routes rows of `sharded_tables` (table name -> key column) to one of `shard_ids` by a
+    jump hash of the key; everything else goes to the directory shard.
+    """
+
+    def __init__(self, shard_ids: List[str], sharded_tables: Optional[Dict[str, str]] = None):
+        self.shard_ids = list(shard_ids)
+        self.sharded_tables = sharded_tables or {"users": "id"}
+
+    def shard_for(self, key: Any) -> str:
+        return self.shard_ids[jump_hash(_hash_key(key), len(self.shard_ids))]
+
+    def shard_chooser(self, mapper, instance, clause=None) -> str:
+        table = mapper.local_table.name if mapper is not None else None
+        if table not in self.sharded_tables or instance is None:
+            return DIRECTORY_SHARD
+        key_attr = self.sharded_tables[table]
+        key = getattr(instance, key_attr)
+        if key is None:
+            # The column default would only run at INSERT time, after the shard is chosen
+            key = uuid.uuid4()
+            setattr(instance, key_attr, key)
+        return self.shard_for(key)
+
+    def identity_chooser(self, mapper, primary_key, **kwargs) -> List[str]:
+        if mapper.local_table.name in self.sharded_tables:
+            return [self.shard_for(primary_key[0])]
+        return [DIRECTORY_SHARD]
+
+    def execute_chooser(self, orm_context) -> List[str]:
+        """Shards a statement must run on: the key's shard when the criteria pin it, else all of them."""
+        table = _target_table(orm_context)
+        if table not in self.sharded_tables:
+            return [DIRECTORY_SHARD]
+        whereclause = getattr(orm_context.statement, "whereclause", None)
+        keys = _keys_in_criteria(whereclause, table, self.sharded_tables[table])
+        if keys is None:
+            return list(self.shard_ids)
+        shards = []
+        for key in keys:
+            shard = self.shard_for(key)
+            if shard not in shards:
+                shards.append(shard)
+        return shards
+
+
+def _target_table(orm_context) -> Optional[str]:
+    mapper = orm_context.bind_mapper
+    if mapper is not None:
+        return mapper.local_table.name
+    statement = orm_context.statement
+    if hasattr(statement, "table"):  # insert / update / delete
+        return getattr(statement.table, "name", None)
+    if hasattr(statement, "get_final_froms"):
+        names = {getattr(from_, "name", None) for from_ in statement.get_final_froms()}
+        if len(names) == 1:
+            return names.pop()
+    return None
+
+
+def _keys_in_criteria(clause, table: str, column: str) -> Optional[Iterable[Any]]:
+    """
+    Key values a WHERE clause restricts `table.column` to, found in a top-level
+    `column = value` or `column IN (...)` (possibly ANDed with other criteria); None if
+    the criteria do not pin the key.
+    """
+    if clause is None:
+        return None
+    if isinstance(clause, BooleanClauseList) and clause.operator is operators.and_:
+        for criterion in clause.clauses:
+            keys = _keys_in_criteria(criterion, table, column)
+            if keys is not None:
+                return keys
+        return None
+    if not isinstance(clause, BinaryExpression) or not isinstance(clause.right, BindParameter):
+        return None
+    left = clause.left
+    if getattr(left, "key", None) != column or getattr(getattr(left, "table", None), "name", None) != table:
+        return None
+    value = clause.right.effective_value
+    if clause.operator is operators.eq and value is not None:
+        return [value]
+    if clause.operator is operators.in_op and value:
+        return list(set(value))
+    return None
@@ -0,0 +1,152 @@
+"""
+Slow-query log with automatic plan capture.
+
+Statements slower than `db_slow_query_threshold_ms` are recorded, together with the
+shapes (types, not values) of their bind parameters, the service method that issued
+them and their query plan, in a bounded ring buffer and on the `app.slow_query` logger.
+The plan is taken right after the slow execution on the same connection, so it reflects
+the data and statistics the query actually ran against.
+"""
+
+from builtins import Exception, classmethod, dict, getattr, isinstance, len, list, reversed, round, setattr, str, tuple, type, vars
+import functools
+import inspect
+import logging
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from settings.config import settings
+
+logger = logging.getLogger("app.slow_query")
+
+_START_ATTR = "_slow_query_start"
+_EXPLAINABLE = ("SELECT", "WITH")
+
+_current_caller: ContextVar[Optional[str]] = ContextVar("current_caller", default=None)
+
+
+def record_caller(cls):
+    """
+    Class decorator tagging every statement issued from one of the class's coroutine
+    classmethods with `ClassName.method`, so slow queries can be traced to their caller.
+    """
+    for name, attr in list(vars(cls).items()):
+        if isinstance(attr, classmethod) and inspect.iscoroutinefunction(attr.__func__):
+            setattr(cls, name, classmethod(_tagged(attr.__func__, f"{cls.__name__}.{name}")))
+    return cls
+
+
+def _tagged(method, caller: str):
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        token = _current_caller.set(caller)
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            _current_caller.reset(token)
+    return wrapper
+
+
+def parameter_shapes(parameters, executemany: bool = False) -> Any:
+    """Type names of the bind parameters; values are never recorded."""
+    if executemany:
+        rows = list(parameters or [])
+        return {"rows": len(rows), "first": parameter_shapes(rows[0]) if rows else None}
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return None
+
+
+class SlowQueryLog:
+    """Thread-safe ring buffer of the most recent slow statements."""
+
+    def __init__(self, size: Optional[int] = None):
+        self._lock = threading.Lock()
+        self._entries: Deque[Dict[str, Any]] = deque(maxlen=size or settings.db_slow_query_log_size)
+
+    def add(self, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries.append(entry)
+
+    def entries(self) -> List[Dict[str, Any]]:
+        """Slow statements, most recent first."""
+        with self._lock:
+            return list(reversed(self._entries))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+slow_query_log = SlowQueryLog()
+
+
+def explain(conn, statement: str, parameters) -> Optional[str]:
+    """
+    Plan of `statement` obtained on a separate raw cursor of the same connection; None for
+    statements that are not plain reads. On PostgreSQL the EXPLAIN runs inside a savepoint
+    so that a failure cannot abort the caller's transaction.
+    """
+    if not statement.lstrip().upper().startswith(_EXPLAINABLE):
+        return None
+    sqlite = conn.dialect.name == "sqlite"
+    cursor = conn.connection.cursor()
+    try:
+        if not sqlite:
+            cursor.execute("SAVEPOINT slow_query_explain")
+        try:
+            cursor.execute(("EXPLAIN QUERY PLAN " if sqlite else "EXPLAIN ") + statement, parameters)
+            rows = cursor.fetchall()
+        except Exception as e:
+            if not sqlite:
+                cursor.execute("ROLLBACK TO SAVEPOINT slow_query_explain")
+            return f"EXPLAIN failed: {e}"
+        if not sqlite:
+            cursor.execute("RELEASE SAVEPOINT slow_query_explain")
+        return "\n".join(str(row[-1]) for row in rows)
+    finally:
+        cursor.close()
+
+
+def instrument_slow_query_log(engine, log: Optional[SlowQueryLog] = None) -> None:
+    """Capture statements of `engine` (sync `Engine` or `AsyncEngine`) slower than the configured threshold."""
+    log = log or slow_query_log
+    sync_engine: Engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _start_timer(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            setattr(context, _START_ATTR, time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _capture(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, _START_ATTR, None)
+        threshold = settings.db_slow_query_threshold_ms
+        if started is None or threshold <= 0:
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if elapsed_ms < threshold:
+            return
+        entry = {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "duration_ms": round(elapsed_ms, 3),
+            "statement": statement,
+            "parameters": parameter_shapes(parameters, executemany),
+            "caller": _current_caller.get(),
+            "engine": sync_engine.url.render_as_string(hide_password=True),
+            "plan": explain(conn, statement, parameters) if settings.db_slow_query_explain and not executemany else None,
+        }
+        log.add(entry)
+        logger.warning(
+            "Slow query (%.1f ms) from %s: %s\nPlan:\n%s",
+            elapsed_ms, entry["caller"] or "unknown caller", statement, entry["plan"],
+        )
@@ -0,0 +1,155 @@
+"""
+Prepared-statement cache management for the asyncpg engine.
+
+SQLAlchemy's asyncpg adapter keeps an LRU of prepared statements per connection and
+drops them all when its dialect-wide invalidation timestamp moves forward. This module
+
+* builds the connect arguments for the cache (size, and unique statement names for
+  transaction-pooling proxies such as PgBouncer, where a client does not keep the
+  same server connection),
+* moves that timestamp forward when the Alembic revision of the database changes, so
+  statements prepared against the old schema are re-prepared instead of failing with
+  `InvalidCachedStatementError`,
+* counts cache hits and misses by mirroring the adapter's per-connection LRU.
+"""
+
+from builtins import bool, dict, getattr, int, len, list, sorted, str
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+from uuid import uuid4
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from settings.config import settings
+
+logger = logging.getLogger(__name__)
+
+_MIRROR_KEY = "statement_cache_mirror"
+
+
+def _unique_statement_name() -> str:
+    return f"__asyncpg_{uuid4()}__"
+
+
+def is_asyncpg_url(url: str) -> bool:
+    return make_url(url).get_driver_name() == "asyncpg"
+
+
+def asyncpg_connect_args() -> Dict[str, Any]:
+    """Connect arguments configuring the adapter's prepared-statement cache from settings."""
+    connect_args: Dict[str, Any] = {"prepared_statement_cache_size": settings.db_statement_cache_size}
+    if settings.db_pgbouncer_transaction_mode:
+        # Statement names must not collide between clients sharing a server connection,
+        # and asyncpg's own (unnamed) statement cache cannot follow connection switches.
+        connect_args["prepared_statement_name_func"] = _unique_statement_name
+        connect_args["statement_cache_size"] = 0
+    return connect_args
+
+
+class StatementCacheMetrics:
+    """Hit/miss counters of the prepared-statement cache, plus schema-driven invalidations."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.invalidations = 0
+
+    def record(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def record_invalidation(self) -> None:
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else None,
+                "schema_invalidations": self.invalidations,
+                "cache_size": settings.db_statement_cache_size,
+                "pgbouncer_transaction_mode": settings.db_pgbouncer_transaction_mode,
+            }
+
+
+statement_cache_metrics = StatementCacheMetrics()
+
+
+def instrument_engine(engine: AsyncEngine, cache_size: Optional[int] = None) -> None:
+    """Count cache hits/misses of `engine` by replaying each statement against a per-connection LRU mirror."""
+    capacity = settings.db_statement_cache_size if cache_size is None else cache_size
+    sync_engine: Engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _mirror_lookup(conn, cursor, statement, parameters, context, executemany):
+        if not capacity:
+            statement_cache_metrics.record(False)
+            return
+        mirror: OrderedDict = conn.connection.info.setdefault(_MIRROR_KEY, OrderedDict())
+        invalidated_at = getattr(conn.dialect, "_invalidate_schema_cache_asof", 0)
+        cached_at = mirror.get(statement)
+        hit = cached_at is not None and cached_at > invalidated_at
+        statement_cache_metrics.record(hit)
+        if hit:
+            mirror.move_to_end(statement)
+            return
+        mirror[statement] = time.time()
+        mirror.move_to_end(statement)
+        while len(mirror) > capacity:
+            mirror.popitem(last=False)
+
+
+class SchemaRevisionWatcher:
+    """Invalidates prepared statements of the given engines whenever the Alembic revision changes."""
+
+    def __init__(self, engines: Iterable[AsyncEngine]):
+        self.engines = list(engines)
+        self.revision: Optional[str] = None
+
+    async def current_revision(self) -> Optional[str]:
+        try:
+            async with self.engines[0].connect() as connection:
+                result = await connection.execute(text("SELECT version_num FROM alembic_version"))
+                return ",".join(sorted(row[0] for row in result))
+        except SQLAlchemyError as e:
+            logger.debug(f"Could not read the alembic revision: {e}")
+            return None
+
+    async def check(self) -> bool:
+        """Return True if the revision changed since the previous check and caches were invalidated."""
+        revision = await self.current_revision()
+        if revision is None:
+            return False
+        previous, self.revision = self.revision, revision
+        if previous is None or previous == revision:
+            return False
+        logger.info(f"Schema revision changed from {previous} to {revision}; invalidating prepared statements")
+        for engine in self.engines:
+            invalidate = getattr(engine.sync_engine.dialect, "_invalidate_schema_cache", None)
+            if invalidate is not None:
+                invalidate()
+        statement_cache_metrics.record_invalidation()
+        return True
+
+    async def run(self, interval: float) -> None:
+        while True:
+            await self.check()
+            await asyncio.sleep(interval)
@@ -0,0 +1,146 @@
+"""
+In-process statement statistics, in the spirit of PostgreSQL's `pg_stat_statements`.
+
+Every statement executed through an instrumented engine is normalized into a
+fingerprint (literals, placeholders and IN-lists collapsed), and per fingerprint the
+collector keeps call counts, total/mean/max latency, a p99 estimated from recent
+samples, and the number of rows returned or affected. The number of fingerprints is
+bounded; when full, the least-called entry is evicted, as `pg_stat_statements` does.
+"""
+
+from builtins import float, getattr, hasattr, int, len, max, min, round, setattr, sorted, str
+import hashlib
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from settings.config import settings
+
+_START_ATTR = "_statement_stats_start"
+_SAMPLES_PER_STATEMENT = 512
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"\$\d+|%\(\w+\)s|%s|(?<![:\w]):\w+|\?|__\[POSTCOMPILE_\w+\]")
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*\?\s*,?)+\)", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_statement(statement: str) -> str:
+    """Collapse the parts of `statement` that vary between executions of the same query."""
+    normalized = _STRING_LITERAL.sub("?", statement)
+    normalized = _PLACEHOLDER.sub("?", normalized)
+    normalized = _NUMBER.sub("?", normalized)
+    normalized = _IN_LIST.sub("IN (...)", normalized)
+    return _WHITESPACE.sub(" ", normalized).strip()
+
+
+def fingerprint(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+
+class _StatementEntry:
+    __slots__ = ("query", "calls", "total_time", "max_time", "rows", "samples")
+
+    def __init__(self, query: str):
+        self.query = query
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.rows = 0
+        self.samples: Deque[float] = deque(maxlen=_SAMPLES_PER_STATEMENT)
+
+    def p99(self) -> float:
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] if ordered else 0.0
+
+    def as_dict(self, key: str) -> Dict[str, Any]:
+        return {
+            "fingerprint": key,
+            "query": self.query,
+            "calls": self.calls,
+            "total_ms": round(self.total_time * 1000, 3),
+            "mean_ms": round(self.total_time * 1000 / self.calls, 3) if self.calls else 0.0,
+            "p99_ms": round(self.p99() * 1000, 3),
+            "max_ms": round(self.max_time * 1000, 3),
+            "rows": self.rows,
+        }
+
+
+class StatementStats:
+    """Bounded, thread-safe per-fingerprint statement statistics."""
+
+    ORDERINGS = ("total_ms", "mean_ms", "p99_ms", "calls", "rows")
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._entries: Dict[str, _StatementEntry] = {}
+            self.evictions = 0
+
+    def record(self, statement: str, elapsed: float, rows: int) -> None:
+        normalized = normalize_statement(statement)
+        key = fingerprint(normalized)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                limit = self.max_entries or settings.db_statement_stats_max_entries
+                if len(self._entries) >= limit:
+                    least_called = min(self._entries, key=lambda k: self._entries[k].calls)
+                    del self._entries[least_called]
+                    self.evictions += 1
+                entry = self._entries[key] = _StatementEntry(normalized)
+            entry.calls += 1
+            entry.total_time += elapsed
+            entry.max_time = max(entry.max_time, elapsed)
+            entry.rows += rows
+            entry.samples.append(elapsed)
+
+    def snapshot(self, order_by: str = "total_ms", limit: Optional[int] = None) -> Dict[str, Any]:
+        with self._lock:
+            statements: List[Dict[str, Any]] = [entry.as_dict(key) for key, entry in self._entries.items()]
+            evictions = self.evictions
+        statements.sort(key=lambda item: item[order_by], reverse=True)
+        return {
+            "statements": statements[:limit] if limit else statements,
+            "tracked": len(statements),
+            "evictions": evictions,
+        }
+
+
+statement_stats = StatementStats()
+
+
+def _rows_of(cursor, context) -> int:
+    # DML reports affected rows; for SELECT the async adapters buffer the result in `_rows`
+    # and psycopg2 reports the number of rows fetched as its rowcount.
+    if cursor.description is not None and hasattr(cursor, "_rows"):
+        return len(cursor._rows)
+    rowcount = getattr(cursor, "rowcount", -1)
+    return rowcount if rowcount and rowcount > 0 else 0
+
+
+def instrument_statement_stats(engine, stats: Optional[StatementStats] = None) -> None:
+    """Record every statement executed by `engine` (sync `Engine` or `AsyncEngine`) into `stats`."""
+    stats = stats or statement_stats
+    sync_engine: Engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _start_timer(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            setattr(context, _START_ATTR, time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, _START_ATTR, None)
+        if started is not None:
+            stats.record(statement, time.perf_counter() - started, _rows_of(cursor, context))
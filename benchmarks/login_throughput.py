@@ -0,0 +1,74 @@
+"""
+Concurrent login throughput with bcrypt on the event loop versus in the hashing pool.
+
+    python -m benchmarks.login_throughput [--logins 40] [--concurrency 20] [--rounds 12]
+
+Each simulated login awaits a (fake, 1 ms) database round trip and then verifies a
+password, like `UserService.login_user`. "blocking" calls `verify_password` inline, as
+the service used to; "executor" awaits `verify_password_async`, which runs bcrypt in
+`hashing_executor()`. Next to logins per second it reports the worst event loop stall
+seen by a 10 ms ticker, i.e. how long every other request on the worker was frozen.
+"""
+
+from builtins import max, print, range
+import argparse
+import asyncio
+import time
+
+from app.utils.security import hash_password, shutdown_hashing_executor, verify_password, verify_password_async
+from settings.config import settings
+
+PASSWORD = "MySuperPassword$1234"
+
+
+async def _login_blocking(hashed: str) -> None:
+    await asyncio.sleep(0.001)
+    verify_password(PASSWORD, hashed)
+
+
+async def _login_executor(hashed: str) -> None:
+    await asyncio.sleep(0.001)
+    await verify_password_async(PASSWORD, hashed)
+
+
+async def _ticker(stalls, stop: asyncio.Event, interval: float = 0.01) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        stalls.append(time.perf_counter() - started - interval)
+
+
+async def run(login, hashed: str, logins: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    stalls, stop = [], asyncio.Event()
+
+    async def one():
+        async with semaphore:
+            await login(hashed)
+
+    ticker = asyncio.create_task(_ticker(stalls, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker
+    return logins / elapsed, max(stalls, default=0.0)
+
+
+async def main(logins: int, concurrency: int, rounds: int) -> None:
+    hashed = hash_password(PASSWORD, rounds)
+    print(f"{logins} logins, {concurrency} at a time, bcrypt cost {rounds}, "
+          f"{settings.password_hash_workers} {settings.password_hash_executor} worker(s)")
+    for name, login in (("blocking", _login_blocking), ("executor", _login_executor)):
+        throughput, stall = await run(login, hashed, logins, concurrency)
+        print(f"  {name:>8}: {throughput:6.1f} logins/s, worst event loop stall {stall * 1000:7.1f} ms")
+    shutdown_hashing_executor()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent login throughput.")
+    parser.add_argument("--logins", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=12)
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.concurrency, args.rounds))
@@ -0,0 +1,73 @@
+"""
+Collision rate of generated nicknames as the user base grows.
+
+    python -m benchmarks.nickname_collisions [--users 1000000 10000000] [--sample 100000]
+
+For each vocabulary (the original 5 x 5 x 1,000 one and the current one) the nickname
+space is filled with the given number of distinct users, then `--sample` fresh
+candidates are drawn and the share that is already taken is reported, next to the
+analytic rate (users / space). It also shows the chance that a whole batch of
+`NICKNAME_BATCH_SIZE` candidates is taken, i.e. that registration needs more than one
+extra round trip, and the memory the Bloom filter of taken nicknames needs.
+"""
+
+from builtins import bool, bytearray, len, max, print, range
+import argparse
+import math
+import random
+import time
+
+from app.utils.nickname_gen import ADJECTIVES, ANIMALS
+from settings.config import settings
+
+VOCABULARIES = {
+    "original (5 x 5 x 1,000)": 5 * 5 * 1000,
+    f"current ({len(ADJECTIVES)} x {len(ANIMALS)} x {settings.nickname_max_number + 1:,})": len(ADJECTIVES) * len(ANIMALS) * (settings.nickname_max_number + 1),
+}
+
+
+def simulate(space: int, users: int, sample: int) -> float:
+    """Share of `sample` random nicknames already taken once `users` distinct ones are."""
+    taken = bytearray((space + 7) // 8)
+    filled = 0
+    while filled < users:
+        index = random.randrange(space)
+        if not taken[index >> 3] & (1 << (index & 7)):
+            taken[index >> 3] |= 1 << (index & 7)
+            filled += 1
+    hits = 0
+    for _ in range(sample):
+        index = random.randrange(space)
+        hits += bool(taken[index >> 3] & (1 << (index & 7)))
+    return hits / sample
+
+
+def bloom_megabytes(capacity: int, error_rate: float) -> float:
+    return -capacity * math.log(error_rate) / math.log(2) ** 2 / 8 / 2 ** 20
+
+
+def main(user_counts, sample: int) -> None:
+    batch = settings.nickname_batch_size
+    for name, space in VOCABULARIES.items():
+        print(f"{name}: {space:,} nicknames")
+        for users in user_counts:
+            if users >= space:
+                print(f"  {users:>12,} users: space exhausted, registration cannot find a free nickname")
+                continue
+            started = time.perf_counter()
+            rate = simulate(space, users, sample)
+            print(
+                f"  {users:>12,} users: {rate:.4%} of candidates taken (analytic {users / space:.4%}), "
+                f"whole batch of {batch} taken {rate ** batch:.2e}, simulated in {time.perf_counter() - started:.1f}s"
+            )
+    for users in user_counts:
+        print(f"Bloom filter for {users:,} taken nicknames at {settings.nickname_bloom_error_rate:.0%} false positives: "
+              f"{bloom_megabytes(users, settings.nickname_bloom_error_rate):.1f} MiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collision rate of generated nicknames.")
+    parser.add_argument("--users", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--sample", type=int, default=100_000)
+    args = parser.parse_args()
+    main([max(0, users) for users in args.users], args.sample)
@@ -0,0 +1,70 @@
+"""
+Latency and throughput of the password hashers per parameter set.
+
+    python -m benchmarks.password_hashers [--verifies 16] [--workers 4]
+
+For each hasher and parameter set it reports the median and worst latency of one verify
+(what a login waits for), the verifies per second `--workers` threads sustain together
+(what a login node sustains with `password_hash_workers` set to that), and the memory one
+hash needs, i.e. what an attacker must spend per guess. argon2id is skipped unless
+argon2-cffi is installed.
+"""
+
+from builtins import len, list, max, print, range, sorted
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.utils.security import Argon2Hasher, BcryptHasher, ScryptHasher, argon2
+
+PASSWORD = "MySuperPassword$1234"
+
+
+def parameter_sets():
+    """(label, hasher, memory per hash in KiB) to compare."""
+    sets = [
+        ("bcrypt cost 10", BcryptHasher(10), 4),
+        ("bcrypt cost 12", BcryptHasher(12), 4),
+        ("scrypt ln=14 r=8 p=1", ScryptHasher(14, 8, 1), 128 * 8 * 2 ** 14 // 1024),
+        ("scrypt ln=15 r=8 p=1", ScryptHasher(15, 8, 1), 128 * 8 * 2 ** 15 // 1024),
+    ]
+    if argon2 is not None:
+        sets += [
+            ("argon2id t=2 m=19MiB p=1", Argon2Hasher(2, 19 * 1024, 1), 19 * 1024),
+            ("argon2id t=3 m=64MiB p=4", Argon2Hasher(3, 64 * 1024, 4), 64 * 1024),
+        ]
+    return sets
+
+
+def measure(hasher, verifies: int, workers: int):
+    """(median ms, worst ms) of single verifies, and verifies per second across `workers` threads."""
+    hashed = hasher.hash(PASSWORD)
+    timings = []
+    for _ in range(verifies):
+        started = time.perf_counter()
+        hasher.verify(PASSWORD, hashed)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings = sorted(timings)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        started = time.perf_counter()
+        list(executor.map(lambda _: hasher.verify(PASSWORD, hashed), range(verifies * workers)))
+        throughput = verifies * workers / (time.perf_counter() - started)
+    return timings[len(timings) // 2], max(timings), throughput
+
+
+def main(verifies: int, workers: int) -> None:
+    print(f"{verifies} verifies per parameter set, throughput with {workers} thread(s)")
+    if argon2 is None:
+        print("  (argon2id skipped, argon2-cffi is not installed)")
+    for label, hasher, memory_kib in parameter_sets():
+        median, worst, throughput = measure(hasher, verifies, workers)
+        print(f"  {label:<26} median {median:7.1f} ms, worst {worst:7.1f} ms, "
+              f"{throughput:7.1f} verifies/s, {memory_kib:>7,} KiB per hash")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Password hasher latency and throughput.")
+    parser.add_argument("--verifies", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    main(args.verifies, args.workers)
@@ -5,12 +5,37 @@ This file is minimal since tests are now divided into:
 - unit_tests/ - For tests that don't require external dependencies
 - integration_tests/ - For tests that require a database and other external services
 
-Each directory has its own conftest.py with appropriate fixtures.
+Each directory has its own conftest.py with appropriate fixtures; only fixtures both
+need live here.
 """
 
 import os
 os.environ["PYTEST_DISABLE_PLUGIN_AUTOLOAD"] = "1"      # block all entry-points
 
+import copy
+from collections import OrderedDict
+
+import pytest
+
+from app.database import Database
+
+# Class attributes of `Database` that `initialize` sets, with their uninitialized values
+DATABASE_STATE = {
+    "_async_engine": None,
+    "_async_session_factory": None,
+    "_async_pool_metrics": None,
+    "_sync_engine": None,
+    "_sync_session_factory": None,
+    "_sync_pool_metrics": None,
+    "_replica_engines": [],
+    "_replica_session_factories": [],
+    "_replica_cursor": 0,
+    "_recent_writers": OrderedDict(),
+    "_shard_router": None,
+    "_shard_engines": {},
+    "_sync_shard_engines": {},
+}
+
 
 # This hook helps pytest understand how to collect and run tests
 def pytest_configure(config):
@@ -24,7 +49,35 @@ def pytest_configure(config):
     config.addinivalue_line("markers", "unit: mark a test as a unit test")
     config.addinivalue_line("markers", "integration: mark a test that requires database or external services")
 
-    # Nothing else is needed here - fixtures are defined in their respective conftest.py files:
+    # Other fixtures are defined in their respective conftest.py files:
     # - tests/unit_tests/conftest.py - For unit test fixtures
     # - tests/integration_tests/conftest.py - For integration test fixtures
 
+
+@pytest.fixture
+async def isolated_database():
+    """
+    Run a test against an uninitialized `Database`, so it can call `Database.initialize`
+    with its own URLs. The class state is snapshotted and cleared before the test; after
+    it, every engine the test created is disposed and the snapshot is restored.
+
+    Yields a coroutine function that disposes the engines and clears the state again, for
+    tests that initialize `Database` a second time.
+    """
+    async def reset():
+        for engine in Database.async_engines():
+            await engine.dispose()
+        Database.dispose_sync()
+        for name, value in DATABASE_STATE.items():
+            setattr(Database, name, copy.copy(value))
+
+    saved = {name: getattr(Database, name) for name in DATABASE_STATE}
+    for name, value in DATABASE_STATE.items():
+        setattr(Database, name, copy.copy(value))
+    try:
+        yield reset
+    finally:
+        await reset()
+        for name, value in saved.items():
+            setattr(Database, name, value)
+
@@ -6,6 +6,10 @@ This Python test file utilizes pytest to manage database states and HTTP clients
 built with FastAPI and SQLAlchemy. It includes detailed fixtures to mock the testing environment, 
 ensuring each test is run in isolation with a consistent setup.
 """
+# Standard library imports
+from contextlib import contextmanager
+from uuid import uuid4
+
 # Third-party imports
 import pytest
 import pytest_asyncio
@@ -17,7 +21,11 @@ from faker import Faker
 # Application-specific imports
 from app.main import app
 from app.database import Base, Database
+from app.models.user_model import User, UserRole
+from app.services.user_service import UserService
 from app.dependencies import get_db, get_settings
+from app.utils import query_budget
+from app.utils.query_budget import count_queries
 
 
 fake = Faker()
@@ -78,6 +86,8 @@ async def refresh_schema(shared_memory_engine):
     async with shared_memory_engine.begin() as connection:
         await connection.run_sync(Base.metadata.drop_all)
         await connection.run_sync(Base.metadata.create_all)
+    # The fresh database has no first admin yet
+    UserService._first_admin_claimed = False
     yield
 
 @pytest.fixture(scope="function")
@@ -93,3 +103,40 @@ async def db_session(shared_memory_engine, refresh_schema):
     async with AsyncSessionFactory() as session:
         yield session
         await session.close()
+
+
+@pytest.fixture(autouse=True)
+def strict_query_budgets(monkeypatch):
+    """Fail any request that exceeds its route's `@query_budget` instead of only logging it."""
+    monkeypatch.setattr(query_budget.settings, "db_query_budget_strict", True)
+
+
+@pytest.fixture
+def assert_max_queries():
+    """
+    Assert how many statements a block executes, e.g.
+
+        with assert_max_queries(2):
+            await UserService.list_users(db_session)
+    """
+    @contextmanager
+    def _assert_max_queries(max_queries: int):
+        with count_queries() as counter:
+            yield counter
+        assert counter.count <= max_queries, f"Expected at most {max_queries} queries, got {counter.describe()}"
+    return _assert_max_queries
+
+
+@pytest.fixture
+def make_user():
+    """Build an unsaved, verified `User` whose nickname is the local part of `email`."""
+    def _make_user(email: str) -> User:
+        return User(
+            id=uuid4(),
+            nickname=email.split("@")[0],
+            email=email,
+            hashed_password="hashed",
+            role=UserRole.AUTHENTICATED,
+            email_verified=True,
+        )
+    return _make_user
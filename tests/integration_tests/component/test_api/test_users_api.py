@@ -52,6 +52,16 @@ async def test_update_user_email_access_allowed(async_client, admin_user, admin_
     assert response.json()["email"] == updated_data["email"]
 
 
+@pytest.mark.asyncio
+async def test_create_user_access_allowed(async_client, admin_token, email_service):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    user_data = {"email": "created@example.com", "password": "sS#fdasrongPassword123!", "role": UserRole.AUTHENTICATED.name}
+    response = await async_client.post("/users/", json=user_data, headers=headers)
+    assert response.status_code == 201, response.text
+    assert response.json()["email"] == user_data["email"]
+    assert 'desc="3 queries"' in response.headers["server-timing"]  # first-admin claim, insert, counter
+
+
 @pytest.mark.asyncio
 async def test_delete_user(async_client, admin_user, admin_token):
     headers = {"Authorization": f"Bearer {admin_token}"}
@@ -175,6 +185,34 @@ async def test_list_users_as_admin(async_client, admin_token):
     assert response.status_code == 200
     assert 'items' in response.json()
 
+@pytest.mark.asyncio
+async def test_list_users_follows_cursor_links(async_client, admin_token, users_with_same_role_50_users):
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    first = (await async_client.get("/users/?limit=20", headers=headers)).json()
+    links = {link["rel"]: link["href"] for link in first["links"]}
+
+    second = (await async_client.get(links["next_cursor"], headers=headers)).json()
+    cursor_links = {link["rel"]: link["href"] for link in second["links"]}
+    offset_page = (await async_client.get("/users/?skip=20&limit=20", headers=headers)).json()
+    assert [user["id"] for user in second["items"]] == [user["id"] for user in offset_page["items"]]
+    assert second["page"] is None and "last" not in cursor_links
+
+    back = (await async_client.get(cursor_links["prev"], headers=headers)).json()
+    assert [user["id"] for user in back["items"]] == [user["id"] for user in first["items"]]
+
+@pytest.mark.asyncio
+async def test_list_users_without_total(async_client, admin_token, users_with_same_role_50_users):
+    response = await async_client.get("/users/?limit=10&include_total=false", headers={"Authorization": f"Bearer {admin_token}"})
+    body = response.json()
+    assert body["total"] is None and len(body["items"]) == 10
+    assert "last" not in {link["rel"] for link in body["links"]}
+    assert 'desc="1 queries"' in response.headers["server-timing"]
+
+@pytest.mark.asyncio
+async def test_list_users_with_invalid_cursor(async_client, admin_token):
+    response = await async_client.get("/users/?cursor=not-a-cursor", headers={"Authorization": f"Bearer {admin_token}"})
+    assert response.status_code == 400
+
 @pytest.mark.asyncio
 async def test_list_users_as_manager(async_client, manager_token):
     response = await async_client.get(
@@ -190,3 +228,120 @@ async def test_list_users_unauthorized(async_client, user_token):
         headers={"Authorization": f"Bearer {user_token}"}
     )
     assert response.status_code == 403  # Forbidden, as expected for regular user
+
+@pytest.mark.asyncio
+async def test_db_pool_stats_requires_admin(async_client, manager_token):
+    response = await async_client.get("/admin/db/pool", headers={"Authorization": f"Bearer {manager_token}"})
+    assert response.status_code == 403
+
+@pytest.mark.asyncio
+async def test_db_pool_stats_as_admin(async_client, admin_token):
+    response = await async_client.get("/admin/db/pool", headers={"Authorization": f"Bearer {admin_token}"})
+    assert response.status_code == 200
+    assert isinstance(response.json(), dict)
+
+@pytest.mark.asyncio
+async def test_db_statement_stats_list_and_reset(async_client, admin_token):
+    from app.utils.statement_stats import statement_stats
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    statement_stats.record("SELECT * FROM users WHERE id = $1", 0.002, 1)
+
+    response = await async_client.get("/admin/db/statements?order_by=calls", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["tracked"] >= 1
+
+    assert (await async_client.get("/admin/db/statements?order_by=bogus", headers=headers)).status_code == 400
+    assert (await async_client.delete("/admin/db/statements", headers=headers)).status_code == 204
+    assert statement_stats.snapshot()["tracked"] == 0
+
+@pytest.mark.asyncio
+async def test_get_user_stays_within_query_budget(async_client, admin_user, admin_token):
+    response = await async_client.get(f"/users/{admin_user.id}", headers={"Authorization": f"Bearer {admin_token}"})
+    assert response.status_code == 200
+    assert 'desc="1 queries"' in response.headers["server-timing"]
+
+
+@pytest.mark.asyncio
+async def test_import_users_from_csv(async_client, admin_token, monkeypatch):
+    from app.services.user_import_service import UserImportService
+    monkeypatch.setattr(UserImportService, "_enqueue_verification", staticmethod(lambda user_ids: None))
+    headers = {"Authorization": f"Bearer {admin_token}", "Content-Type": "text/csv"}
+    body = "email,password\nimported@example.com,ValidPassword123!\nadmin@example.com,ValidPassword123!\n"
+    response = await async_client.post("/users/import", content=body, headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {"imported": 1, "failed": 1, "errors": [{"row": 3, "email": "admin@example.com", "error": "Email already exists"}]}
+
+
+@pytest.mark.asyncio
+async def test_import_users_requires_admin_and_a_known_format(async_client, admin_token, manager_token):
+    response = await async_client.post("/users/import", content="email\n", headers={"Authorization": f"Bearer {manager_token}", "Content-Type": "text/csv"})
+    assert response.status_code == 403
+    response = await async_client.post("/users/import", content="<users/>", headers={"Authorization": f"Bearer {admin_token}", "Content-Type": "application/xml"})
+    assert response.status_code == 415
+
+
+@pytest.mark.asyncio
+async def test_export_users(async_client, admin_user, admin_token, shared_memory_engine, monkeypatch):
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from sqlalchemy.orm import sessionmaker
+    from app.database import Database
+    monkeypatch.setattr(Database, "get_read_factory", classmethod(lambda cls: sessionmaker(shared_memory_engine, class_=AsyncSession)))
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    response = await async_client.get("/users/export", params={"format": "csv", "columns": "email,role"}, headers=headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.text.splitlines() == ["email,role", f"{admin_user.email},ADMIN"]
+
+    response = await async_client.get("/users/export", params={"columns": "hashed_password"}, headers=headers)
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_bulk_user_action(async_client, admin_user, admin_token, verified_user, monkeypatch):
+    from app.services.user_bulk_action_service import UserBulkActionService
+    monkeypatch.setattr(UserBulkActionService, "_notify", staticmethod(lambda action, role, user_ids: None))
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    body = {"action": "grant_professional", "filter": {"role": verified_user.role.name}}
+    response = await async_client.post("/users/actions", json=body, headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {"action": "grant_professional", "affected": 1}
+
+    response = await async_client.post("/users/actions", json={"action": "change_role"}, headers=headers)
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_login_is_shed_when_the_hashing_pool_is_saturated(async_client, verified_user, monkeypatch):
+    from app.utils.hashing_admission import hashing_admission
+    monkeypatch.setattr(hashing_admission, "admitted", 64)
+    form_data = {"username": verified_user.email, "password": "MySuperPassword$1234"}
+    response = await async_client.post("/login/", data=urlencode(form_data), headers={"Content-Type": "application/x-www-form-urlencoded"})
+    assert response.status_code == 503
+    assert int(response.headers["retry-after"]) >= 1
+
+
+@pytest.mark.asyncio
+async def test_login_share_is_per_forwarded_client(async_client, verified_user, monkeypatch):
+    """Behind the proxy (the test client's 127.0.0.1 is trusted) each forwarded client has its own share."""
+    from app.utils.hashing_admission import hashing_admission, settings as admission_settings
+    monkeypatch.setitem(hashing_admission._per_client, "203.0.113.5", admission_settings.password_hash_client_limit)
+    form_data = urlencode({"username": verified_user.email, "password": "MySuperPassword$1234"})
+    headers = {"Content-Type": "application/x-www-form-urlencoded"}
+
+    busy = await async_client.post("/login/", data=form_data, headers={**headers, "X-Forwarded-For": "203.0.113.5"})
+    other = await async_client.post("/login/", data=form_data, headers={**headers, "X-Forwarded-For": "198.51.100.7"})
+
+    assert busy.status_code == 429
+    assert other.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_create_user_without_a_free_nickname_is_not_reported_as_a_taken_email(async_client, admin_token, monkeypatch):
+    from unittest.mock import AsyncMock
+    from app.services.user_service import UserService
+    monkeypatch.setattr(UserService, "_insert_user", AsyncMock(return_value=None))
+    monkeypatch.setattr(UserService, "_conflicts", AsyncMock(return_value=(False, set())))
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    response = await async_client.post("/users/", json={"email": "new@example.com", "password": "ValidPassword123!", "role": "AUTHENTICATED"}, headers=headers)
+    assert response.status_code == 503
+    assert "nickname" in response.json()["detail"]
@@ -0,0 +1,76 @@
+"""
+Primary/replica routing of `UserService` reads.
+
+The primary and the replica are two separate SQLite files, so a row that only
+exists in the replica file proves which database answered a query.
+"""
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.database import Base, Database, READ_YOUR_WRITES_KEY
+from app.models.user_model import User, UserCounter
+from app.services.user_service import UserService
+
+
+async def _create_database(url: str, *users: User) -> None:
+    engine = create_async_engine(url)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    if users:
+        async with engine.begin() as connection:
+            await connection.execute(User.__table__.insert(), [
+                {column.name: getattr(user, column.key) for column in User.__table__.columns
+                 if getattr(user, column.key) is not None}
+                for user in users
+            ])
+            await connection.execute(UserCounter.__table__.insert(), [{"role": "AUTHENTICATED", "slot": 0, "count": len(users)}])
+    await engine.dispose()
+
+
+@pytest.fixture
+async def primary_and_replica(tmp_path, isolated_database, make_user):
+    primary_url = f"sqlite+aiosqlite:///{tmp_path / 'primary.db'}"
+    replica_url = f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}"
+    await _create_database(primary_url, make_user("primary_only@example.com"))
+    await _create_database(replica_url, make_user("replica_only@example.com"))
+    Database.initialize(primary_url, None, replica_urls=[replica_url])
+
+
+async def test_reads_are_served_by_replica(primary_and_replica):
+    async with Database.get_async_factory()() as session:
+        assert await UserService.get_by_email(session, "replica_only@example.com") is not None
+        assert await UserService.get_by_email(session, "primary_only@example.com") is None
+        assert await UserService.count(session) == 1
+        assert [user.email for user in await UserService.list_users(session)] == ["replica_only@example.com"]
+
+
+async def test_reads_stick_to_primary_after_a_write(primary_and_replica, make_user):
+    async with Database.get_async_factory()() as session:
+        session.add(make_user("new_user@example.com"))
+        await session.flush()
+        assert await UserService.get_by_email(session, "new_user@example.com") is not None
+        assert await UserService.get_by_email(session, "replica_only@example.com") is None
+
+
+async def test_read_your_writes_window_spans_sessions(primary_and_replica, make_user):
+    async with Database.get_async_factory()() as session:
+        session.info[READ_YOUR_WRITES_KEY] = "client-a"
+        session.add(make_user("written@example.com"))
+        await session.commit()
+
+    async with Database.get_async_factory()() as session:
+        session.info[READ_YOUR_WRITES_KEY] = "client-a"
+        assert await UserService.get_by_email(session, "written@example.com") is not None
+
+    async with Database.get_async_factory()() as session:
+        session.info[READ_YOUR_WRITES_KEY] = "client-b"
+        assert await UserService.get_by_email(session, "written@example.com") is None
+
+
+async def test_reads_use_primary_without_replicas(tmp_path, isolated_database, make_user):
+    primary_url = f"sqlite+aiosqlite:///{tmp_path / 'primary.db'}"
+    await _create_database(primary_url, make_user("primary_only@example.com"))
+    Database.initialize(primary_url, None)
+    async with Database.get_async_factory()() as session:
+        assert await UserService.get_by_email(session, "primary_only@example.com") is not None
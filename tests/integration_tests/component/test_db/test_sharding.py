@@ -0,0 +1,188 @@
+"""
+Hash-sharded user storage, with one SQLite file per shard plus one for the directory.
+"""
+
+from uuid import uuid4
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.database import Base, Database
+from app.main import app
+from app.models.user_model import User, UserDirectory, UserRole
+from app.services.jwt_service import create_access_token
+from app.services.user_service import EmailAlreadyExists, UserService
+from app.utils.cursor_pagination import Cursor
+from app.utils.security import hash_password
+from app.utils.shard_rebalance import rebalance
+
+
+async def _create_schema(url: str) -> None:
+    engine = create_async_engine(url)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    await engine.dispose()
+
+
+def _user_data(index: int) -> dict:
+    return {"email": f"user{index}@example.com", "password": "MySuperPassword$1234", "role": "AUTHENTICATED"}
+
+
+async def _users_per_shard():
+    counts = {}
+    for shard_id, engine in Database.shard_engines().items():
+        async with engine.connect() as connection:
+            counts[shard_id] = (await connection.execute(select(func.count()).select_from(User))).scalar()
+    return counts
+
+
+@pytest.fixture
+async def urls(tmp_path):
+    urls = [f"sqlite+aiosqlite:///{tmp_path / name}.db" for name in ("primary", "shard_0", "shard_1", "shard_2")]
+    for url in urls:
+        await _create_schema(url)
+    return urls
+
+
+@pytest.fixture
+async def sharded(urls, isolated_database):
+    Database.initialize(urls[0], None, shard_urls=urls[1:3])
+
+
+async def _create_users(count: int):
+    created = []
+    async with Database.unit_of_work() as session:
+        for index in range(count):
+            created.append(await UserService.create(session, _user_data(index)))
+    return created
+
+
+async def test_users_are_spread_by_id_and_listed_in_directory(sharded):
+    users = await _create_users(12)
+
+    counts = await _users_per_shard()
+    assert sum(counts.values()) == 12 and all(counts.values())
+    async with Database.get_async_factory()() as session:
+        entries = (await session.execute(select(UserDirectory))).scalars().all()
+        assert {entry.user_id: entry.shard_id for entry in entries} == {user.id: Database.shard_for(user.id) for user in users}
+
+
+async def test_lookups_and_fan_out(sharded):
+    users = await _create_users(12)
+
+    async with Database.get_async_factory()() as session:
+        assert (await UserService.get_by_id(session, users[5].id)).email == "user5@example.com"
+        assert (await UserService.get_by_email(session, "user7@example.com")).id == users[7].id
+        assert await UserService.get_by_email(session, "nobody@example.com") is None
+        assert await UserService.count(session) == 12
+
+        first_page = await UserService.list_users(session, skip=0, limit=5)
+        second_page = await UserService.list_users(session, skip=5, limit=5)
+        listed = first_page + second_page + await UserService.list_users(session, skip=10, limit=5)
+        assert len(first_page) == len(second_page) == 5
+        assert sorted(user.id for user in listed) == sorted(user.id for user in users)
+
+
+async def test_cursor_pages_merge_shards(sharded):
+    users = await _create_users(12)
+
+    async with Database.get_async_factory()() as session:
+        walked, cursor, has_more = [], None, True
+        while has_more:
+            page, has_more = await UserService.list_users_by_cursor(session, limit=5, cursor=cursor)
+            walked += page
+            cursor = Cursor(page[-1].created_at, page[-1].id)
+    assert [user.id for user in walked] == [user.id for user in sorted(users, key=lambda user: (user.created_at, user.id))]
+
+
+async def test_delete_removes_directory_entry(sharded):
+    users = await _create_users(2)
+    async with Database.unit_of_work() as session:
+        assert await UserService.delete(session, users[1].id)
+    async with Database.get_async_factory()() as session:
+        assert await UserService.get_by_email(session, users[1].email) is None
+        assert await UserService.count(session) == 1
+
+
+async def test_rebalance_after_adding_a_shard(urls, isolated_database):
+    Database.initialize(urls[0], None, shard_urls=urls[1:3])
+    users = await _create_users(20)
+    await isolated_database()  # forget the two-shard setup
+
+    Database.initialize(urls[0], None, shard_urls=urls[1:4])
+    planned = await rebalance(batch_size=3, dry_run=True)
+    assert planned["scanned"] == 20 and planned["moved"] > 0
+
+    assert (await rebalance(batch_size=3))["moved"] == planned["moved"]
+    assert (await rebalance(batch_size=3))["moved"] == 0
+    assert (await _users_per_shard())["shard_2"] == planned["moved"]  # jump hash only moves users to the new shard
+
+    async with Database.get_async_factory()() as session:
+        for user in users:
+            assert (await UserService.get_by_id(session, user.id)).email == user.email
+            assert (await UserService.get_by_email(session, user.email)).id == user.id
+
+
+async def test_rebalance_lists_users_missing_from_the_directory(sharded):
+    # A user from before sharding: on the first shard, whatever its id hashes to, and not in the directory
+    user_id = next(candidate for candidate in iter(uuid4, None) if Database.shard_for(candidate) == "shard_1")
+    async with Database.shard_engines()["shard_0"].begin() as connection:
+        await connection.execute(User.__table__.insert(), [{
+            "id": user_id, "email": "early@example.com", "nickname": "early_bird", "role": UserRole.AUTHENTICATED,
+            "hashed_password": hash_password("MySuperPassword$1234", 4), "email_verified": True,
+            "is_locked": False, "failed_login_attempts": 0,
+        }])
+
+    assert (await rebalance())["moved"] == 1
+
+    async with Database.get_async_factory()() as session:
+        entry = (await session.execute(select(UserDirectory).where(UserDirectory.user_id == user_id))).scalar_one()
+        assert (entry.email, entry.nickname, entry.shard_id) == ("early@example.com", "early_bird", "shard_1")
+        assert (await UserService.login_user(session, "early@example.com", "MySuperPassword$1234")).user is not None
+
+
+async def test_rebalance_lists_users_already_on_their_shard(sharded):
+    # Registered before sharding was enabled, with an id that happens to hash to the first shard
+    user_id = next(candidate for candidate in iter(uuid4, None) if Database.shard_for(candidate) == "shard_0")
+    async with Database.shard_engines()["shard_0"].begin() as connection:
+        await connection.execute(User.__table__.insert(), [{
+            "id": user_id, "email": "early@example.com", "nickname": "early_bird", "role": UserRole.AUTHENTICATED,
+            "hashed_password": hash_password("MySuperPassword$1234", 4), "email_verified": True,
+            "is_locked": False, "failed_login_attempts": 0,
+        }])
+
+    assert (await rebalance())["moved"] == 0
+
+    async with Database.get_async_factory()() as session:
+        entry = (await session.execute(select(UserDirectory).where(UserDirectory.user_id == user_id))).scalar_one()
+        assert entry.shard_id == "shard_0"
+        assert (await UserService.login_user(session, "early@example.com", "MySuperPassword$1234")).user is not None
+
+
+async def test_duplicate_email_is_rejected_across_shards(sharded):
+    await _create_users(3)
+    with pytest.raises(EmailAlreadyExists):
+        async with Database.unit_of_work() as session:
+            await UserService.create(session, _user_data(1))
+    async with Database.get_async_factory()() as session:
+        assert await UserService.count(session) == 3
+
+
+async def test_sharded_login_stays_within_its_query_budget(sharded):
+    admin = (await _create_users(1))[0]  # the first user is a verified admin, who can log in
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://testserver") as client:
+        response = await client.post("/login/", data={"username": admin.email, "password": "MySuperPassword$1234"})
+    assert response.status_code == 200
+    assert '"3 queries"' in response.headers["server-timing"]  # directory lookup, user SELECT, login UPDATE
+
+
+async def test_sharded_create_user_stays_within_its_query_budget(sharded, monkeypatch):
+    admin = (await _create_users(1))[0]
+    monkeypatch.setattr(UserService, "_first_admin_claimed", False)  # as after a restart: the claim is tried again
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': str(admin.id), 'role': 'ADMIN'})}"}
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://testserver") as client:
+        response = await client.post("/users/", json=_user_data(1), headers=headers)
+    assert response.status_code == 201
+    assert '"4 queries"' in response.headers["server-timing"]  # first-admin claim, directory entry, insert, counter
@@ -0,0 +1,66 @@
+"""
+Request-scoped unit of work: a single commit per block, and side effects (Celery
+dispatch) deferred until that commit has happened.
+"""
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from app.database import Base, Database, call_after_commit
+from app.models.user_model import User
+
+
+@pytest.fixture
+async def database(tmp_path, isolated_database):
+    Database.initialize(f"sqlite+aiosqlite:///{tmp_path / 'uow.db'}", None)
+    async with Database._async_engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+
+
+async def _emails():
+    async with Database.get_async_factory()() as session:
+        return (await session.execute(select(User.email))).scalars().all()
+
+
+async def test_commits_once_and_then_runs_callbacks(database, make_user):
+    dispatched = []
+    async with Database.unit_of_work() as session:
+        session.add(make_user("a@example.com"))
+        await session.flush()
+        call_after_commit(session, lambda: dispatched.append(list(session.info)))
+        session.add(make_user("b@example.com"))
+        assert dispatched == []
+    assert dispatched and sorted(await _emails()) == ["a@example.com", "b@example.com"]
+
+
+async def test_error_rolls_back_and_drops_callbacks(database, make_user):
+    dispatched = []
+    with pytest.raises(RuntimeError):
+        async with Database.unit_of_work() as session:
+            session.add(make_user("a@example.com"))
+            call_after_commit(session, dispatched.append, "sent")
+            raise RuntimeError("boom")
+    assert dispatched == []
+    assert await _emails() == []
+
+
+async def test_expected_exceptions_still_commit(database, make_user):
+    dispatched = []
+    with pytest.raises(HTTPException):
+        async with Database.unit_of_work(commit_on=(HTTPException,)) as session:
+            session.add(make_user("a@example.com"))
+            call_after_commit(session, dispatched.append, "sent")
+            raise HTTPException(status_code=401)
+    assert dispatched == ["sent"]
+    assert await _emails() == ["a@example.com"]
+
+
+async def test_failing_callback_does_not_undo_the_commit(database, make_user):
+    def broken():
+        raise ConnectionError("broker down")
+
+    async with Database.unit_of_work() as session:
+        session.add(make_user("a@example.com"))
+        call_after_commit(session, broken)
+    assert await _emails() == ["a@example.com"]
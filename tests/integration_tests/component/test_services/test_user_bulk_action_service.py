@@ -0,0 +1,77 @@
+import pytest
+from sqlalchemy import select
+
+from app.models.user_model import User, UserRole
+from app.schemas.user_schemas import BulkUserAction, UserFilter
+from app.services.user_bulk_action_service import UserBulkActionService
+from app.services.user_count_service import UserCountService
+from app.utils.query_budget import count_queries
+
+
+@pytest.fixture
+def notified(monkeypatch):
+    calls = []
+    monkeypatch.setattr(UserBulkActionService, "_notify", staticmethod(lambda action, role, user_ids: calls.append((action, list(user_ids)))))
+    return calls
+
+
+@pytest.fixture
+async def members(db_session):
+    users = [
+        User(nickname=f"member_{index}", email=f"member_{index}@example.com", hashed_password="x",
+             role=UserRole.AUTHENTICATED if index % 2 else UserRole.ANONYMOUS, email_verified=bool(index % 2))
+        for index in range(7)
+    ]
+    db_session.add_all(users)
+    await db_session.commit()
+    return users
+
+
+async def _column(session, column):
+    return dict((await session.execute(select(User.email, column))).all())
+
+
+async def test_lock_in_chunks_and_notify_per_chunk(db_session, members, notified):
+    with count_queries() as counter:
+        report = await UserBulkActionService.apply(db_session, BulkUserAction.LOCK, UserFilter(email_verified=True), chunk_size=2)
+
+    assert report.affected == 3
+    assert counter.count == 2  # a full chunk of 2, then the last user
+    assert sorted(len(user_ids) for _, user_ids in notified) == [1, 2]
+    locked = await _column(db_session, User.is_locked)
+    assert {email for email, is_locked in locked.items() if is_locked} == {m.email for m in members if m.email_verified}
+
+    # Locked users no longer match, so a repeat changes nothing and notifies nobody
+    repeat = await UserBulkActionService.apply(db_session, BulkUserAction.LOCK, UserFilter(email_verified=True))
+    assert repeat.affected == 0 and len(notified) == 2
+
+
+async def test_change_role_moves_the_counters(db_session, members, notified):
+    report = await UserBulkActionService.apply(db_session, BulkUserAction.CHANGE_ROLE, UserFilter(), UserRole.MANAGER, chunk_size=3)
+
+    assert report.affected == 7
+    assert set((await _column(db_session, User.role)).values()) == {UserRole.MANAGER}
+    assert await UserCountService.count(db_session, UserRole.MANAGER) == 7
+    assert await UserCountService.count(db_session, UserRole.ANONYMOUS) == 0
+    assert await UserCountService.count(db_session, UserRole.AUTHENTICATED) == 0
+
+
+async def test_unlock_only_touches_locked_users_in_the_filter(db_session, members, locked_user, notified):
+    report = await UserBulkActionService.apply(db_session, BulkUserAction.UNLOCK, UserFilter(role=UserRole.AUTHENTICATED))
+    assert report.affected == 1
+    assert notified == [(BulkUserAction.UNLOCK, [locked_user.id])]
+    row = (await db_session.execute(select(User.is_locked, User.failed_login_attempts).where(User.id == locked_user.id))).one()
+    assert tuple(row) == (False, 0)
+
+
+def test_notifications_are_sent_in_batches(monkeypatch):
+    from unittest.mock import MagicMock
+    import app.services.user_bulk_action_service as bulk_action_service
+
+    chunks = MagicMock()
+    monkeypatch.setattr(bulk_action_service.role_upgrade_task, "chunks", chunks)
+    monkeypatch.setattr(bulk_action_service.settings, "bulk_action_notification_batch_size", 50)
+    UserBulkActionService._notify(BulkUserAction.CHANGE_ROLE, UserRole.MANAGER, ["a", "b"])
+
+    chunks.assert_called_once_with([("a", "MANAGER"), ("b", "MANAGER")], 50)
+    chunks.return_value.apply_async.assert_called_once_with(queue="account_notifications")
@@ -0,0 +1,35 @@
+import pytest
+
+from app.models.user_model import UserRole
+from app.services.user_count_service import UserCountService
+from app.services.user_service import UserService
+
+pytestmark = pytest.mark.asyncio
+
+
+async def _counts(session):
+    return {
+        strategy: (await UserCountService.count(session, strategy=strategy),
+                   await UserCountService.count(session, UserRole.AUTHENTICATED, strategy=strategy))
+        for strategy in ("counter", "exact")
+    }
+
+
+# Counters follow inserts, role changes and deletes, whether made through the unit of work or by statements
+async def test_counters_match_exact_counts(db_session, user, admin_user):
+    assert (await _counts(db_session))["counter"] == (2, 1)
+
+    created = await UserService.create(db_session, {"email": "counted@example.com", "password": "ValidPassword123!", "role": "ADMIN"})
+    await UserService.upgrade_user_role(db_session, created.id, UserRole.AUTHENTICATED)
+    await db_session.flush()
+    await UserService.update(db_session, user.id, {"role": UserRole.MANAGER.name})
+    await UserService.delete(db_session, admin_user.id)
+
+    counts = await _counts(db_session)
+    assert counts["counter"] == counts["exact"] == (2, 1)
+
+
+async def test_rebuild_and_estimate_fallback(db_session, users_with_same_role_50_users):
+    assert await UserCountService.rebuild(db_session) == {"AUTHENTICATED": 50}
+    # Planner estimates are PostgreSQL-only; other databases use the counters
+    assert await UserCountService.count(db_session, strategy="estimate") == 50
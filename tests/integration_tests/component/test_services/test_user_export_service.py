@@ -0,0 +1,58 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from app.models.user_model import UserRole
+from app.services.user_export_service import EXPORT_COLUMNS, UserExportService
+from app.utils.query_budget import count_queries
+from settings.config import settings
+
+
+@pytest.fixture
+def session_factory(shared_memory_engine):
+    return sessionmaker(shared_memory_engine, class_=AsyncSession, expire_on_commit=False)
+
+
+async def _export(session_factory, format, columns, **filters):
+    return [chunk async for chunk in UserExportService.stream(session_factory, format, columns, **filters)]
+
+
+async def test_export_ndjson_streams_chunks_from_one_query(session_factory, admin_user, manager_user, user, monkeypatch):
+    monkeypatch.setattr(settings, "export_chunk_size", 2)
+    with count_queries() as counter:
+        chunks = await _export(session_factory, "ndjson", list(EXPORT_COLUMNS))
+
+    assert counter.count == 1
+    assert len(chunks) == 2
+    rows = [json.loads(line) for line in b"".join(chunks).decode().splitlines()]
+    assert {row["email"] for row in rows} == {admin_user.email, manager_user.email, user.email}
+    assert all("hashed_password" not in row and "verification_token" not in row for row in rows)
+    assert {row["role"] for row in rows} == {"ADMIN", "MANAGER", user.role.name}
+
+
+async def test_export_csv_with_columns_and_filters(session_factory, admin_user, manager_user):
+    columns = UserExportService.columns("email, role")
+    data = b"".join(await _export(session_factory, "csv", columns, role=UserRole.MANAGER))
+    assert list(csv.reader(io.StringIO(data.decode()))) == [["email", "role"], [manager_user.email, "MANAGER"]]
+
+    future = datetime.now(timezone.utc) + timedelta(days=1)
+    assert b"".join(await _export(session_factory, "csv", columns, created_after=future)) == b"email,role\n"
+    data = b"".join(await _export(session_factory, "csv", columns, created_before=future))
+    assert len(data.decode().splitlines()) == 3
+
+
+async def test_export_gzip(session_factory, admin_user):
+    data = b"".join(await _export(session_factory, "ndjson", ["id", "email"], gzip=True))
+    assert json.loads(gzip.decompress(data)) == {"id": str(admin_user.id), "email": admin_user.email}
+
+
+def test_export_columns_rejects_unknown_ones():
+    assert UserExportService.columns(None) == list(EXPORT_COLUMNS)
+    with pytest.raises(ValueError):
+        UserExportService.columns("email,hashed_password")
@@ -0,0 +1,109 @@
+import json
+
+import pytest
+from sqlalchemy import func, select
+
+from app.models.user_model import User, UserRole
+from app.services.user_count_service import UserCountService
+from app.services.user_import_service import UserImportService, _read_file, iter_lines, iter_rows
+from app.utils.query_budget import count_queries
+from settings.config import settings
+
+
+async def _chunks(data: bytes, size: int = 7):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+async def _import(session, data: bytes, format: str, batch_size=None, roles=(UserRole.ANONYMOUS,)):
+    return await UserImportService.import_users(session, iter_rows(iter_lines(_chunks(data)), format), batch_size, roles)
+
+
+@pytest.fixture(autouse=True)
+def enqueued(monkeypatch):
+    calls = []
+    monkeypatch.setattr(UserImportService, "_enqueue_verification", staticmethod(calls.append))
+    return calls
+
+
+async def test_import_csv_reports_failed_rows(db_session, user, enqueued):
+    data = (
+        "email,password,first_name,role\r\n"
+        "new_one@example.com,ValidPassword123!,Ada,MANAGER\r\n"
+        f"{user.email},ValidPassword123!,Taken,\r\n"
+        "not-an-email,ValidPassword123!,Bad,\r\n"
+        "new_two@example.com,ValidPassword123!,Two,\r\n"
+        "\r\n"
+        "new_two@example.com,ValidPassword123!,Again,\r\n"
+        "short@example.com,ValidPassword123!\r\n"
+        "new_three@example.com,ValidPassword123!,,\r\n"
+    ).encode()
+
+    report = await _import(db_session, data, "csv", batch_size=3, roles=(UserRole.ANONYMOUS, UserRole.MANAGER))
+
+    assert (report.imported, report.failed) == (3, 4)
+    assert {(error.row, error.error.split(":")[0]) for error in report.errors} == {
+        (3, "Email already exists"), (4, "email"), (7, "Email already exists"), (8, "Expected 4 fields, got 2"),
+    }
+    imported = (await db_session.execute(select(User).where(User.email.like("new_%")).order_by(User.email))).scalars().all()
+    assert [(u.email, u.role, u.email_verified) for u in imported] == [
+        ("new_one@example.com", UserRole.MANAGER, False),
+        ("new_three@example.com", UserRole.ANONYMOUS, False),
+        ("new_two@example.com", UserRole.ANONYMOUS, False),
+    ]
+    assert all(u.nickname and u.verification_token and u.hashed_password for u in imported)
+    assert sorted(user_id for batch in enqueued for user_id in batch) == sorted(u.id for u in imported)
+    assert await UserCountService.count(db_session, UserRole.MANAGER) == 1
+
+
+async def test_rows_cannot_set_roles_the_caller_does_not_allow(db_session):
+    rows = [{"email": "admin@example.com", "password": "ValidPassword123!", "role": "ADMIN"},
+            {"email": "plain@example.com", "password": "ValidPassword123!", "role": "ANONYMOUS"}]
+    report = await _import(db_session, "\n".join(map(json.dumps, rows)).encode(), "ndjson")
+
+    assert (report.imported, report.failed) == (1, 1)
+    assert (report.errors[0].row, report.errors[0].error) == (1, "Role ADMIN may not be imported")
+    assert (await db_session.execute(select(func.count()).select_from(User).where(User.role == UserRole.ADMIN))).scalar() == 0
+
+
+async def test_import_ndjson_inserts_a_batch_in_one_statement(db_session, enqueued):
+    rows = [{"email": f"bulk_{index}@example.com", "password": "ValidPassword123!"} for index in range(5)]
+    data = "\n".join([*map(json.dumps, rows), "[1, 2]", "{broken"]).encode()
+
+    with count_queries() as counter:
+        report = await _import(db_session, data, "ndjson")
+
+    assert (report.imported, report.failed) == (5, 2)
+    assert [error.error for error in report.errors][0] == "Expected a JSON object"
+    assert report.errors[1].error.startswith("Invalid JSON")
+    assert counter.count == 2  # the insert and the role counter upsert
+    assert (await db_session.execute(select(func.count()).select_from(User))).scalar() == 5
+    assert len(enqueued) == 1
+
+
+async def test_import_hashes_through_admission_one_password_at_a_time(db_session, monkeypatch):
+    from app.utils.hashing_admission import hashing_admission
+    hashing_admission.reset()
+    rows = [{"email": f"admitted_{index}@example.com", "password": "ValidPassword123!"} for index in range(5)]
+
+    report = await _import(db_session, "\n".join(map(json.dumps, rows)).encode(), "ndjson")
+
+    assert report.imported == 5
+    assert hashing_admission.snapshot()["wait_seconds"]["count"] == 5
+
+
+async def test_import_caps_reported_errors(db_session, monkeypatch):
+    monkeypatch.setattr(settings, "import_max_reported_errors", 2)
+    report = await _import(db_session, b"email\nnope\nnope\nnope\n", "csv")
+    assert (report.imported, report.failed, len(report.errors)) == (0, 3, 2)
+
+
+async def test_import_reads_a_file_larger_than_one_chunk(tmp_path):
+    path = tmp_path / "users.ndjson"
+    padding = "x" * (1 << 16)
+    rows = [{"email": f"file_{index}@example.com", "password": "ValidPassword123!", "padding": padding} for index in range(2)]
+    path.write_text("\n".join(map(json.dumps, rows)))
+
+    parsed = [row async for row in iter_rows(iter_lines(_read_file(str(path))), "ndjson")]
+
+    assert [row["email"] for _, row in parsed] == ["file_0@example.com", "file_1@example.com"]
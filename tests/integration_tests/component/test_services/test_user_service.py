@@ -4,6 +4,7 @@ from sqlalchemy import select
 from app.dependencies import get_settings
 from app.models.user_model import User, UserRole
 from app.services.user_service import UserService
+from app.utils.cursor_pagination import Cursor
 from app.utils.nickname_gen import generate_nickname
 
 pytestmark = pytest.mark.asyncio
@@ -92,6 +93,27 @@ async def test_list_users_with_pagination(db_session, users_with_same_role_50_us
     assert len(users_page_2) == 10
     assert users_page_1[0].id != users_page_2[0].id
 
+# A page of users and the total are one round trip each
+async def test_list_users_round_trips(db_session, users_with_same_role_50_users, assert_max_queries):
+    with assert_max_queries(2):
+        await UserService.count(db_session)
+        await UserService.list_users(db_session, skip=0, limit=10)
+
+# Cursor pages walk the same (created_at, id) order as offset pages, in both directions
+async def test_list_users_by_cursor(db_session, users_with_same_role_50_users):
+    expected = [user.id for user in await UserService.list_users(db_session, skip=0, limit=50)]
+
+    walked, cursor, has_more = [], None, True
+    while has_more:
+        page, has_more = await UserService.list_users_by_cursor(db_session, limit=15, cursor=cursor)
+        walked += [user.id for user in page]
+        cursor = Cursor(page[-1].created_at, page[-1].id)
+    assert walked == expected
+
+    last = await UserService.get_by_id(db_session, expected[-1])
+    page, has_more = await UserService.list_users_by_cursor(db_session, limit=15, cursor=Cursor(last.created_at, last.id, backwards=True))
+    assert [user.id for user in page] == expected[-16:-1] and has_more
+
 # Test registering a user with valid data
 async def test_register_user_with_valid_data(db_session):
     user_data = {
@@ -119,18 +141,56 @@ async def test_login_user_successful(db_session, verified_user):
         "email": verified_user.email,
         "password": "MySuperPassword$1234",
     }
-    logged_in_user = await UserService.login_user(db_session, user_data["email"], user_data["password"])
-    assert logged_in_user is not None
+    result = await UserService.login_user(db_session, user_data["email"], user_data["password"])
+    assert result.user is not None
+    assert result.user.email == verified_user.email
+
+# A correct password does not log in to an account locked while it was being verified
+async def test_login_is_refused_when_the_account_is_locked_meanwhile(db_session, verified_user, monkeypatch):
+    import app.services.user_service as user_service
+    from sqlalchemy import update
+
+    async def verify_while_another_guess_locks(password, hashed_password):
+        await db_session.execute(update(User).where(User.id == verified_user.id).values(is_locked=True, failed_login_attempts=3))
+        return True
+
+    monkeypatch.setattr(user_service, "verify_password_async", verify_while_another_guess_locks)
+    result = await UserService.login_user(db_session, verified_user.email, "MySuperPassword$1234")
+    assert (result.user, result.locked) == (None, True)
+    row = (await db_session.execute(select(User.is_locked, User.failed_login_attempts).where(User.id == verified_user.id))).one()
+    assert tuple(row) == (True, 3)
+
+# A successful login moves a hash of another bcrypt cost to the current one
+async def test_login_rehashes_to_the_target_cost(db_session, verified_user, monkeypatch):
+    import app.utils.security as security
+    monkeypatch.setattr(security, "_target_rounds", 4)
+    result = await UserService.login_user(db_session, verified_user.email, "MySuperPassword$1234")
+    assert result.user is not None
+    await db_session.commit()
+    stored = (await db_session.execute(select(User.hashed_password).where(User.id == verified_user.id))).scalar_one()
+    assert security.hash_rounds(stored) == 4
+    assert (await UserService.login_user(db_session, verified_user.email, "MySuperPassword$1234")).user is not None
+
+# Switching the default hasher migrates each bcrypt hash on its user's next login
+async def test_login_migrates_the_hash_to_the_default_hasher(db_session, verified_user, monkeypatch):
+    import app.utils.security as security
+    monkeypatch.setattr(security.settings, "password_hash_algorithm", "scrypt")
+    monkeypatch.setitem(security.HASHERS, "scrypt", security.ScryptHasher(cost=10))
+    assert (await UserService.login_user(db_session, verified_user.email, "MySuperPassword$1234")).user is not None
+    await db_session.commit()
+    stored = (await db_session.execute(select(User.hashed_password).where(User.id == verified_user.id))).scalar_one()
+    assert stored.startswith("$scrypt$ln=10,")
+    assert (await UserService.login_user(db_session, verified_user.email, "MySuperPassword$1234")).user is not None
 
 # Test user login with incorrect email
 async def test_login_user_incorrect_email(db_session):
-    user = await UserService.login_user(db_session, "nonexistentuser@noway.com", "Password123!")
-    assert user is None
+    result = await UserService.login_user(db_session, "nonexistentuser@noway.com", "Password123!")
+    assert result.user is None
 
 # Test user login with incorrect password
 async def test_login_user_incorrect_password(db_session, user):
-    user = await UserService.login_user(db_session, user.email, "IncorrectPassword!")
-    assert user is None
+    result = await UserService.login_user(db_session, user.email, "IncorrectPassword!")
+    assert result.user is None
 
 # Test account lock after maximum failed login attempts
 async def test_account_lock_after_failed_logins(db_session, verified_user):
@@ -161,3 +221,10 @@ async def test_unlock_user_account(db_session, locked_user):
     assert unlocked, "The account should be unlocked"
     refreshed_user = await UserService.get_by_id(db_session, locked_user.id)
     assert not refreshed_user.is_locked, "The user should no longer be locked"
+
+# Test upgrading a user's professional status, which only happens once
+async def test_upgrade_professional_status(db_session, verified_user):
+    assert await UserService.upgrade_professional_status(db_session, verified_user.id) is True
+    assert await UserService.upgrade_professional_status(db_session, verified_user.id) is False
+    refreshed_user = await UserService.get_by_id(db_session, verified_user.id)
+    assert refreshed_user.is_professional and refreshed_user.professional_status_updated_at is not None
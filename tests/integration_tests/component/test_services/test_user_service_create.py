@@ -1,7 +1,12 @@
 from uuid import UUID
 
-from app.models.user_model import UserRole
-from app.services.user_service import UserService
+import pytest
+from sqlalchemy import select
+
+import app.services.user_service as user_service
+from app.models.user_model import BootstrapState, UserRole
+from app.services.user_service import NicknameUnavailable, UserService
+from app.utils.query_budget import count_queries
 from app.utils.nickname_gen import generate_nickname
 
 
@@ -19,3 +24,55 @@ async def test_create_user_with_valid_data(db_session):
     assert user is not None
     assert user.email == user_data["email"]
     assert isinstance(user.id, UUID)
+
+
+async def test_create_user_is_a_single_insert_and_counter_update(db_session):
+    with count_queries() as first:
+        admin = await UserService._create_user_in_db(db_session, {"email": "first@example.com", "password": "ValidPassword123!", "role": "ADMIN"}, "token-1")
+    await db_session.commit()
+    with count_queries() as second:
+        user = await UserService._create_user_in_db(db_session, {"email": "second@example.com", "password": "ValidPassword123!", "role": "ADMIN"}, "token-2")
+
+    assert first.count == 3  # the first-admin claim, the insert and the role counter upsert
+    assert second.count == 2  # the claim is known to be taken from now on
+    assert (admin.role, admin.email_verified, admin.verification_token) == (UserRole.ADMIN, True, None)
+    assert (user.role, user.email_verified, user.verification_token) == (UserRole.ANONYMOUS, False, "token-2")
+    assert user.created_at is not None
+
+
+async def test_first_admin_claim_is_given_back_when_registration_fails(db_session, user):
+    with pytest.raises(ValueError):
+        await UserService._create_user_in_db(db_session, {"email": user.email, "password": "ValidPassword123!", "role": "ADMIN"})
+    assert (await db_session.execute(select(BootstrapState))).first() is None
+    assert not UserService._first_admin_claimed
+
+    admin = await UserService._create_user_in_db(db_session, {"email": "admin@example.org", "password": "ValidPassword123!", "role": "ADMIN"})
+    assert admin.role == UserRole.ADMIN
+
+
+async def test_first_admin_claim_is_given_back_when_nicknames_run_out(db_session, user, monkeypatch):
+    monkeypatch.setattr(user_service, "nickname_candidates", lambda count: [user.nickname])
+    monkeypatch.setattr(user_service, "generate_nickname", lambda: user.nickname)
+    with pytest.raises(NicknameUnavailable):
+        await UserService._create_user_in_db(db_session, {"email": "admin@example.org", "password": "ValidPassword123!", "role": "ADMIN"})
+    await db_session.commit()
+    assert (await db_session.execute(select(BootstrapState))).first() is None
+    assert not UserService._first_admin_claimed
+
+
+async def test_create_user_retries_only_the_nickname(db_session, user, monkeypatch):
+    monkeypatch.setattr(UserService, "_first_admin_claimed", True)
+    batches = iter([[user.nickname], [user.nickname, "fresh_nickname_42"]])
+    monkeypatch.setattr(user_service, "nickname_candidates", lambda count: next(batches))
+
+    with count_queries() as counter:
+        created = await UserService._create_user_in_db(db_session, {"email": "other@example.com", "password": "ValidPassword123!", "role": "ADMIN"})
+
+    assert created.nickname == "fresh_nickname_42"
+    assert counter.count == 4  # insert, one lookup of the email and the whole batch, insert, counter
+    assert user.nickname in user_service.taken_nicknames
+
+
+async def test_create_user_with_taken_email(db_session, user):
+    with pytest.raises(ValueError, match="email already exists"):
+        await UserService._create_user_in_db(db_session, {"email": user.email, "password": "ValidPassword123!", "role": "ADMIN"})
@@ -0,0 +1,119 @@
+from uuid import uuid4
+from unittest.mock import AsyncMock
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+import app.services.user_service as user_service
+from app.models.user_model import User, UserRole
+from app.services.user_count_service import UserCountService
+from app.services.user_service import UserService
+from app.utils.query_budget import count_queries
+
+
+async def test_update_role_moves_counters_and_refreshes_loaded_user(db_session, user):
+    old_role = user.role
+    with count_queries() as counter:
+        updated = await UserService.update(db_session, user.id, {"role": "MANAGER", "first_name": "Renamed"})
+
+    assert counter.count == 3  # the old role, the conditional update and the counter upsert
+    assert updated is user  # the loaded instance is refreshed from RETURNING
+    assert (user.role, user.first_name) == (UserRole.MANAGER, "Renamed")
+    assert await UserCountService.count(db_session, UserRole.MANAGER) == 1
+    assert await UserCountService.count(db_session, old_role) == 0
+
+
+async def test_update_missing_user(db_session):
+    assert await UserService.update(db_session, uuid4(), {"first_name": "Nobody"}) is None
+
+
+async def test_unlock_is_a_single_conditional_update(db_session, locked_user, monkeypatch):
+    delay = AsyncMock()
+    monkeypatch.setattr(user_service.account_unlocked_task, "delay", delay)
+    with count_queries() as counter:
+        assert await UserService.unlock_user_account(db_session, locked_user.id) is True
+    assert counter.count == 1
+    assert (locked_user.is_locked, locked_user.failed_login_attempts) == (False, 0)
+    # Already unlocked: nothing matches, so no second notification
+    assert await UserService.unlock_user_account(db_session, locked_user.id) is False
+    await db_session.commit()
+    delay.assert_called_once_with(locked_user.id)
+
+
+async def test_verify_email_token_is_single_use(db_session, unverified_user):
+    unverified_user.verification_token = "single-use"
+    unverified_user.role = UserRole.ANONYMOUS
+    await db_session.commit()
+
+    assert await UserService.verify_email_with_token(db_session, unverified_user.id, "single-use") is True
+    assert await UserService.verify_email_with_token(db_session, unverified_user.id, "single-use") is False
+    assert (unverified_user.email_verified, unverified_user.verification_token, unverified_user.role) == (True, None, UserRole.AUTHENTICATED)
+    assert await UserCountService.count(db_session, UserRole.ANONYMOUS) == 0
+    assert await UserCountService.count(db_session, UserRole.AUTHENTICATED) == 1
+
+
+async def test_upgrade_user_role_only_changes_a_different_role(db_session, user):
+    assert await UserService.upgrade_user_role(db_session, user.id, UserRole.MANAGER) is True
+    assert await UserService.upgrade_user_role(db_session, user.id, UserRole.MANAGER) is False
+    assert await UserCountService.count(db_session, UserRole.MANAGER) == 1
+
+
+async def test_reset_password_reports_the_previous_lock(db_session, locked_user, monkeypatch):
+    delay = AsyncMock()
+    monkeypatch.setattr(user_service.account_unlocked_task, "delay", delay)
+    assert await UserService.reset_password(db_session, locked_user.id, "NewPassword123!") is True
+    await db_session.commit()
+    assert not locked_user.is_locked
+    delay.assert_called_once_with(locked_user.id)
+
+
+async def test_delete_returns_the_role_for_the_counters(db_session, user):
+    role = user.role
+    with count_queries() as counter:
+        assert await UserService.delete(db_session, user.id) is True
+    assert counter.count == 2  # DELETE ... RETURNING and the counter upsert
+    assert (await db_session.execute(select(User).where(User.id == user.id))).first() is None
+    assert await UserCountService.count(db_session, role) == 0
+
+
+async def test_update_on_postgresql_reads_the_old_values_in_the_same_statement(db_session, user, monkeypatch):
+    statements = []
+
+    async def capture(session, query):
+        statements.append(query)
+
+    monkeypatch.setattr(user_service.Database, "dialect_name", classmethod(lambda cls, session: "postgresql"))
+    monkeypatch.setattr(UserService, "_execute_query", classmethod(lambda cls, session, query: capture(session, query)))
+    await UserService._update_user(db_session, user.id, {"role": UserRole.MANAGER}, previous=(User.role,))
+
+    assert len(statements) == 1
+    sql = str(statements[0].compile(dialect=postgresql.dialect()))
+    assert sql.startswith("UPDATE users SET role=")
+    assert "FROM (SELECT users.id AS id, users.role AS role" in sql and "FOR UPDATE) AS previous" in sql
+    assert "previous.role" in sql.split("RETURNING")[1]
+
+
+async def test_failed_logins_lock_the_account_once(db_session, verified_user, monkeypatch):
+    delay = AsyncMock()
+    monkeypatch.setattr(user_service.account_locked_task, "delay", delay)
+    monkeypatch.setattr(user_service.settings, "max_login_attempts", 2)
+
+    with count_queries() as counter:
+        assert (await UserService.login_user(db_session, verified_user.email, "wrong")).locked is False
+    assert counter.count == 2  # the login columns and the atomic increment
+    assert verified_user.failed_login_attempts == 1
+    await UserService.login_user(db_session, verified_user.email, "wrong")
+    assert (await UserService.login_user(db_session, verified_user.email, "MySuperPassword$1234")).locked is True
+    await db_session.commit()
+
+    assert (verified_user.failed_login_attempts, verified_user.is_locked) == (2, True)
+    delay.assert_called_once_with(verified_user.id)
+
+
+async def test_successful_login_resets_the_failed_attempts(db_session, verified_user):
+    await UserService.login_user(db_session, verified_user.email, "wrong")
+    with count_queries() as counter:
+        result = await UserService.login_user(db_session, verified_user.email, "MySuperPassword$1234")
+    assert counter.count == 2
+    assert (result.user.id, result.user.role) == (verified_user.id, verified_user.role)
+    assert verified_user.failed_login_attempts == 0 and verified_user.last_login_at is not None
@@ -6,6 +6,7 @@ from datetime import datetime, timezone
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.database import run_after_commit_callbacks
 from app.services.user_service import UserService
 from app.models.user_model import User, UserRole
 from app.utils.security import hash_password
@@ -39,21 +40,23 @@ def mock_db_session():
     session.refresh = AsyncMock()
     session.execute = AsyncMock()
     session.rollback = AsyncMock()
+    session.info = {}
     return session
 
 @pytest.mark.asyncio
 async def test_create_enqueues_verify_task_if_not_verified(monkeypatch, mock_db_session, mock_user):
     """
     When email_verified=False, create() should:
-      - generate a verification token,
-      - commit the session,
-      - enqueue the Celery task via verify_email_task.delay(user_id).
+      - generate a verification token and insert it with the user,
+      - leave the commit to the caller's unit of work,
+      - enqueue the Celery task via verify_email_task.delay(user_id) once it commits.
     """
     # Arrange: stub out user creation and token generation
-    monkeypatch.setattr(
-        UserService, "_create_user_in_db",
-        AsyncMock(return_value=mock_user)
-    )
+    async def insert_user(session, user_data, verification_token):
+        mock_user.verification_token = verification_token
+        return mock_user
+
+    monkeypatch.setattr(UserService, "_create_user_in_db", insert_user)
     monkeypatch.setattr(
         us_module, "generate_verification_token",
         lambda: "static-token"
@@ -71,8 +74,11 @@ async def test_create_enqueues_verify_task_if_not_verified(monkeypatch, mock_db_
 
     assert user is mock_user
     assert user.verification_token == "static-token"
+    mock_db_session.commit.assert_not_awaited()
+    assert calls == []
+
+    run_after_commit_callbacks(mock_db_session)
     assert calls == [user.id]
-    mock_db_session.commit.assert_awaited_once()
 
 
 @pytest.mark.asyncio
@@ -99,5 +105,6 @@ async def test_create_skips_verify_task_if_already_verified(monkeypatch, mock_db
 
     assert user is mock_user
     assert user.verification_token is None
+    run_after_commit_callbacks(mock_db_session)
     assert calls == []
     mock_db_session.commit.assert_not_awaited()
@@ -0,0 +1,62 @@
+from datetime import timedelta
+
+import jwt
+import pytest
+
+from app.services import jwt_service
+from app.services.jwt_service import TokenCache, create_access_token, decode_token, token_cache
+
+
+@pytest.fixture(autouse=True)
+def reset_token_cache():
+    token_cache.reset()
+    yield
+    token_cache.reset()
+
+
+def test_repeated_token_is_verified_once(monkeypatch):
+    token = create_access_token(data={"sub": "user-id", "role": "admin"})
+    verify = jwt_service.jwt.decode
+    calls = []
+    monkeypatch.setattr(jwt_service.jwt, "decode", lambda *args, **kwargs: calls.append(1) or verify(*args, **kwargs))
+
+    first = decode_token(token)
+    second = decode_token(token)
+
+    assert first == second and second["role"] == "ADMIN"
+    assert len(calls) == 1
+    assert token_cache.snapshot()["hits"] == 1 and token_cache.snapshot()["misses"] == 1
+
+
+def test_invalid_and_expired_tokens_are_not_cached():
+    assert decode_token("not-a-token") is None
+    expired = create_access_token(data={"sub": "user-id", "role": "admin"}, expires_delta=timedelta(seconds=-1))
+    assert decode_token(expired) is None
+    assert token_cache.snapshot()["size"] == 0
+
+
+def test_cached_token_expires_with_its_exp(monkeypatch):
+    token = create_access_token(data={"sub": "user-id", "role": "admin"})
+    assert decode_token(token) is not None
+    exp = jwt.decode(token, options={"verify_signature": False})["exp"]
+    monkeypatch.setattr(jwt_service.time, "time", lambda: exp + 1)
+    assert token_cache.get(token) is None
+    assert token_cache.snapshot()["expired"] == 1
+
+
+def test_cache_evicts_the_least_recently_used_token():
+    cache = TokenCache(max_size=2)
+    payload = {"sub": "user-id", "exp": 4_000_000_000}
+    cache.put("a", payload)
+    cache.put("b", payload)
+    cache.get("a")
+    cache.put("c", payload)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.snapshot()["evicted"] == 1
+
+
+def test_zero_size_disables_the_cache():
+    cache = TokenCache(max_size=0)
+    cache.put("a", {"sub": "user-id", "exp": 4_000_000_000})
+    assert cache.get("a") is None
@@ -1,10 +1,12 @@
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
+from app.database import AFTER_COMMIT_KEY
 from app.services.user_service import UserService
 from app.models.user_model import User, UserRole
 from uuid import UUID, uuid4
 from app.utils.security import hash_password
 from datetime import datetime, timezone
+from types import SimpleNamespace
 
 
 @pytest.fixture
@@ -33,6 +35,7 @@ def mock_db_session():
     session.refresh = AsyncMock()
     session.execute = AsyncMock()
     session.rollback = AsyncMock()
+    session.info = {}
     return session
 
 
@@ -70,22 +73,34 @@ async def test_get_by_id_not_found(mock_db_session):
         assert user is None
 
 
+def _login_row(user):
+    """The columns `login_user` selects, as the query result would return them."""
+    result = MagicMock()
+    result.first.return_value = SimpleNamespace(
+        id=user.id, email=user.email, role=user.role, hashed_password=user.hashed_password,
+        email_verified=user.email_verified, is_locked=user.is_locked,
+    )
+    return result
+
+
 @pytest.mark.asyncio
 async def test_login_user_success(mock_db_session, mock_user):
     """Test successful user login."""
     # Arrange
     password = "password123"
-    
-    with patch.object(UserService, 'get_by_email', return_value=mock_user), \
-         patch('app.utils.security.verify_password', return_value=True):
-        
+    update_user = AsyncMock()
+
+    with patch.object(UserService, '_execute_query', AsyncMock(return_value=_login_row(mock_user))), \
+         patch.object(UserService, '_update_user', update_user):
+
         # Act
         result = await UserService.login_user(mock_db_session, mock_user.email, password)
-        
+
         # Assert
-        assert result is not None
-        assert result.id == mock_user.id
-        assert mock_db_session.commit.called
+        assert result.user is not None
+        assert result.user.id == mock_user.id
+        assert update_user.call_args.args[2]["failed_login_attempts"] == 0
+        mock_db_session.commit.assert_not_called()  # Committed by the request's unit of work
 
 
 @pytest.mark.asyncio
@@ -93,16 +108,32 @@ async def test_login_user_incorrect_password(mock_db_session, mock_user):
     """Test login with incorrect password."""
     # Arrange
     password = "wrong_password"
-    
-    with patch.object(UserService, 'get_by_email', return_value=mock_user), \
-         patch('app.utils.security.verify_password', return_value=False):
-        
+    mock_user.is_locked = True
+    update_user = AsyncMock(return_value=(mock_user,))
+    mock_user_row = _login_row(mock_user)
+    mock_user_row.first.return_value.is_locked = False
+
+    with patch.object(UserService, '_execute_query', AsyncMock(return_value=mock_user_row)), \
+         patch.object(UserService, '_update_user', update_user):
+
         # Act
         result = await UserService.login_user(mock_db_session, mock_user.email, password)
-        
+
         # Assert
-        assert result is None
-        assert mock_db_session.commit.called  # Failed login increments counter
+        assert (result.user, result.locked) == (None, False)
+        # The increment happens in SQL, skipping accounts that are locked already
+        assert str(update_user.call_args.args[2]["failed_login_attempts"]).startswith("coalesce(users.failed_login_attempts")
+        assert len(mock_db_session.info[AFTER_COMMIT_KEY]) == 1  # This attempt locked the account: notify once
+
+
+@pytest.mark.asyncio
+async def test_login_user_locked_skips_the_password_check(mock_db_session, mock_user):
+    mock_user.is_locked = True
+    with patch.object(UserService, '_execute_query', AsyncMock(return_value=_login_row(mock_user))), \
+         patch('app.services.user_service.verify_password_async') as verify:
+        result = await UserService.login_user(mock_db_session, mock_user.email, "password123")
+    assert (result.user, result.locked) == (None, True)
+    verify.assert_not_called()
 
 
 @pytest.mark.asyncio
@@ -110,29 +141,28 @@ async def test_verify_email_with_token_success(mock_db_session, mock_user):
     """Test successful email verification with token."""
     # Arrange
     token = "valid_token"
-    mock_user.verification_token = token
-    
-    with patch.object(UserService, 'get_by_id', return_value=mock_user):
+    update_user = AsyncMock(return_value=(mock_user, UserRole.AUTHENTICATED))
+
+    with patch.object(UserService, '_update_user', update_user):
         # Act
         result = await UserService.verify_email_with_token(mock_db_session, mock_user.id, token)
-        
+
         # Assert
         assert result is True
-        assert mock_user.email_verified is True
-        assert mock_user.verification_token is None
-        assert mock_user.role == UserRole.AUTHENTICATED
-        assert mock_db_session.commit.called
+        _, user_id, values, criterion = update_user.call_args.args
+        assert user_id == mock_user.id
+        assert values == {"email_verified": True, "verification_token": None, "role": UserRole.AUTHENTICATED}
+        assert criterion.right.value == token  # Only the user's current token matches
+        assert AFTER_COMMIT_KEY not in mock_db_session.info  # Already AUTHENTICATED: no role notification
 
 
 @pytest.mark.asyncio
 async def test_verify_email_with_token_invalid(mock_db_session, mock_user):
     """Test failed email verification with invalid token."""
-    token = "valid_token"
     invalid_token = "invalid_token"
-    mock_user.verification_token = token
-    
-    with patch.object(UserService, 'get_by_id', return_value=mock_user):
+
+    with patch.object(UserService, '_update_user', AsyncMock(return_value=None)):
         result = await UserService.verify_email_with_token(mock_db_session, mock_user.id, invalid_token)
-        
+
         assert result is False
-        assert mock_user.email_verified is True  # Unchanged
+        assert AFTER_COMMIT_KEY not in mock_db_session.info
@@ -0,0 +1,18 @@
+from app.utils.bloom_filter import BloomFilter
+
+
+def test_added_keys_are_always_found():
+    bloom = BloomFilter(capacity=1000)
+    keys = [f"brave_otter_{number}" for number in range(1000)]
+    bloom.update(keys)
+
+    assert all(key in bloom for key in keys)
+    assert len(bloom) == 1000
+
+
+def test_false_positive_rate_stays_near_target():
+    bloom = BloomFilter(capacity=5000, error_rate=0.01)
+    bloom.update(f"taken_{number}" for number in range(5000))
+
+    false_positives = sum(f"free_{number}" in bloom for number in range(20000))
+    assert false_positives / 20000 < 0.02
@@ -0,0 +1,35 @@
+import pytest
+from starlette.requests import Request
+
+from app.dependencies import _read_your_writes_key
+from app.utils import client_address as client_address_module
+from app.utils.client_address import client_address
+
+
+def _scope(peer, **headers):
+    return {"client": (peer, 50000), "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()]}
+
+
+@pytest.fixture(autouse=True)
+def trusted_proxies(monkeypatch):
+    monkeypatch.setattr(client_address_module.settings, "trusted_proxies", ["127.0.0.1", "172.16.0.0/12"])
+
+
+def test_forwarded_client_of_a_trusted_proxy():
+    assert client_address(_scope("172.18.0.5", x_forwarded_for="203.0.113.5")) == "203.0.113.5"
+    # Addresses the client put in front of the proxy's own entry are not trusted
+    assert client_address(_scope("172.18.0.5", x_forwarded_for="10.9.9.9, 203.0.113.5")) == "203.0.113.5"
+    # Chained trusted proxies are skipped
+    assert client_address(_scope("127.0.0.1", x_forwarded_for="203.0.113.5, 172.18.0.5")) == "203.0.113.5"
+    assert client_address(_scope("172.18.0.5", x_real_ip="198.51.100.7")) == "198.51.100.7"
+    assert client_address(_scope("172.18.0.5")) == "172.18.0.5"
+
+
+def test_headers_of_other_peers_are_ignored():
+    assert client_address(_scope("198.51.100.7", x_forwarded_for="203.0.113.5", x_real_ip="203.0.113.5")) == "198.51.100.7"
+    assert client_address({"headers": []}) is None
+
+
+def test_read_your_writes_key_is_the_forwarded_client():
+    scope = {"type": "http", **_scope("172.18.0.5", x_forwarded_for="203.0.113.5")}
+    assert _read_your_writes_key(Request(scope)) == "203.0.113.5"
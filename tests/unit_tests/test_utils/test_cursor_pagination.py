@@ -0,0 +1,19 @@
+from datetime import datetime, timezone
+from uuid import uuid4
+
+import pytest
+
+from app.utils.cursor_pagination import Cursor, decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+    created_at, user_id = datetime(2026, 10, 17, 9, 30, 15, 120000, tzinfo=timezone.utc), uuid4()
+
+    assert decode_cursor(encode_cursor(created_at, user_id)) == Cursor(created_at, user_id, False)
+    assert decode_cursor(encode_cursor(created_at, user_id, backwards=True)).backwards
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "", "eyJ0IjoxfQ", encode_cursor(datetime.now(), uuid4())[:-4]])
+def test_invalid_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
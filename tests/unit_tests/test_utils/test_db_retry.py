@@ -0,0 +1,104 @@
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from asyncpg.exceptions import InvalidCachedStatementError
+from sqlalchemy.exc import DBAPIError, NotSupportedError
+
+from app.database import TXN_HAS_WRITES_KEY
+from app.utils import db_retry
+from app.utils.db_retry import (
+    RETRY_BUDGET_KEY, RetryBudget, RetryPolicy, classify_error, retry_stats, run_with_retry,
+)
+
+POLICY = RetryPolicy(max_attempts=3, base_delay=0, max_delay=0)
+
+
+class _PgError(Exception):
+    def __init__(self, sqlstate):
+        super().__init__(f"sqlstate {sqlstate}")
+        self.sqlstate = sqlstate
+
+
+def _dbapi_error(sqlstate="40001"):
+    return DBAPIError("SELECT 1", {}, _PgError(sqlstate))
+
+
+@pytest.fixture
+def session():
+    session = MagicMock()
+    session.info = {}
+    session.rollback = AsyncMock()
+    return session
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(db_retry.asyncio, "sleep", AsyncMock())
+    retry_stats.reset()
+
+
+def test_classify_error():
+    assert classify_error(_dbapi_error("40001")) == "serialization_failure"
+    assert classify_error(_dbapi_error("40P01")) == "deadlock"
+    assert classify_error(_dbapi_error("23505")) is None
+    assert classify_error(ValueError()) is None
+
+    cached = InvalidCachedStatementError("cached statement plan is invalid")
+    wrapper = Exception("wrapped")
+    wrapper.__cause__ = cached
+    assert classify_error(NotSupportedError("SELECT 1", {}, wrapper)) == "cached_statement_invalid"
+
+    dropped = DBAPIError("SELECT 1", {}, Exception("gone"), connection_invalidated=True)
+    assert classify_error(dropped) == "connection_lost"
+
+
+async def test_retries_until_success(session):
+    operation = AsyncMock(side_effect=[_dbapi_error(), "ok"])
+    assert await run_with_retry(session, operation, POLICY) == "ok"
+    assert operation.await_count == 2
+    session.rollback.assert_awaited_once()
+    assert retry_stats.snapshot()["retries"] == {"serialization_failure": 1}
+
+
+async def test_gives_up_after_max_attempts(session):
+    operation = AsyncMock(side_effect=_dbapi_error())
+    with pytest.raises(DBAPIError):
+        await run_with_retry(session, operation, POLICY)
+    assert operation.await_count == 3
+    assert retry_stats.snapshot()["give_ups"] == {"serialization_failure": 1}
+
+
+async def test_non_transient_errors_are_not_retried(session):
+    operation = AsyncMock(side_effect=_dbapi_error("23505"))
+    with pytest.raises(DBAPIError):
+        await run_with_retry(session, operation, POLICY)
+    assert operation.await_count == 1
+    session.rollback.assert_not_awaited()
+
+
+async def test_transaction_with_earlier_writes_is_not_replayed(session):
+    session.info[TXN_HAS_WRITES_KEY] = True
+    operation = AsyncMock(side_effect=_dbapi_error())
+    with pytest.raises(DBAPIError):
+        await run_with_retry(session, operation, POLICY)
+    assert operation.await_count == 1
+
+
+async def test_request_budget_limits_retries(session):
+    session.info[RETRY_BUDGET_KEY] = RetryBudget(1)
+    operation = AsyncMock(side_effect=_dbapi_error())
+    with pytest.raises(DBAPIError):
+        await run_with_retry(session, operation, POLICY)
+    assert operation.await_count == 2
+    assert session.info[RETRY_BUDGET_KEY].remaining == 0
+
+
+async def test_only_outermost_operation_retries(session):
+    inner = AsyncMock(side_effect=[_dbapi_error(), "inner"])
+
+    async def outer():
+        return await run_with_retry(session, inner, POLICY)
+
+    assert await run_with_retry(session, outer, POLICY) == "inner"
+    assert inner.await_count == 2
+    session.rollback.assert_awaited_once()
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from app.utils import hashing_admission as admission_module
+from app.utils.hashing_admission import HashingAdmission, HashingOverloaded
+
+
+@pytest.fixture
+def admission(monkeypatch):
+    monkeypatch.setattr(admission_module.settings, "password_hash_workers", 1)
+    monkeypatch.setattr(admission_module.settings, "password_hash_max_queue", 3)
+    monkeypatch.setattr(admission_module.settings, "password_hash_client_limit", 2)
+    monkeypatch.setattr(admission_module.settings, "password_hash_max_wait", 0.05)
+    return HashingAdmission()
+
+
+async def _hold(admission, client, release: asyncio.Event):
+    async with admission.admit(client):
+        await release.wait()
+
+
+async def test_rejects_a_client_over_its_share_and_a_full_queue(admission, monkeypatch):
+    monkeypatch.setattr(admission_module.settings, "password_hash_max_wait", 5)
+    release = asyncio.Event()
+    holders = [asyncio.create_task(_hold(admission, "10.0.0.1", release)) for _ in range(2)]
+    await asyncio.sleep(0.01)
+
+    with pytest.raises(HashingOverloaded) as client_limit:
+        async with admission.admit("10.0.0.1"):
+            pass
+    assert (client_limit.value.reason, client_limit.value.status_code) == ("client_limit", 429)
+
+    # Another client still gets in, until the queue is full
+    holders.append(asyncio.create_task(_hold(admission, "10.0.0.2", release)))
+    await asyncio.sleep(0.01)
+    with pytest.raises(HashingOverloaded) as queue_full:
+        async with admission.admit("10.0.0.3"):
+            pass
+    assert (queue_full.value.reason, queue_full.value.status_code) == ("queue_full", 503)
+    assert queue_full.value.retry_after >= 1
+
+    snapshot = admission.snapshot()
+    assert (snapshot["running"], snapshot["waiting"], snapshot["clients"]) == (1, 2, 2)
+    release.set()
+    await asyncio.gather(*holders, return_exceptions=True)
+    assert admission.snapshot()["rejected"] == {"client_limit": 1, "queue_full": 1}
+
+
+async def test_gives_up_after_the_max_wait(admission):
+    release = asyncio.Event()
+    holder = asyncio.create_task(_hold(admission, "10.0.0.1", release))
+    await asyncio.sleep(0.01)
+
+    with pytest.raises(HashingOverloaded) as timeout:
+        async with admission.admit("10.0.0.2"):
+            pass
+    assert timeout.value.reason == "wait_timeout"
+    assert admission.snapshot()["timeouts"] == 1
+    release.set()
+    await holder
+
+    # The slot of the timed-out call is free again
+    async with admission.admit("10.0.0.2"):
+        assert admission.running == 1
+    assert (admission.admitted, admission.snapshot()["wait_seconds"]["count"]) == (0, 2)
+
+
+async def test_client_defaults_to_the_request_client(admission):
+    token = admission_module.hashing_client.set("10.0.0.9")
+    try:
+        async with admission.admit():
+            assert admission.snapshot()["clients"] == 1
+    finally:
+        admission_module.hashing_client.reset(token)
+
+
+async def test_timeouts_racing_releases_keep_every_worker(admission, monkeypatch):
+    """Waits that time out just as a worker frees up must not keep (and leak) its permit."""
+    monkeypatch.setattr(admission_module.settings, "password_hash_max_queue", 100)
+    monkeypatch.setattr(admission_module.settings, "password_hash_client_limit", 100)
+    monkeypatch.setattr(admission_module.settings, "password_hash_max_wait", 0.005)
+
+    async def hash_once():
+        async with admission.admit("10.0.0.1"):
+            await asyncio.sleep(0.005)
+
+    await asyncio.gather(*(hash_once() for _ in range(50)), return_exceptions=True)
+    assert admission.snapshot()["timeouts"] > 0
+    assert (admission.admitted, admission.running) == (0, 0)
+    assert admission._semaphore()._value == admission_module.settings.password_hash_workers
+
+
+async def test_background_work_waits_for_its_turn_instead_of_being_shed(admission, monkeypatch):
+    monkeypatch.setattr(admission_module.settings, "password_hash_max_queue", 1)
+    release = asyncio.Event()
+    holder = asyncio.create_task(_hold(admission, "10.0.0.1", release))
+    await asyncio.sleep(0.01)
+
+    background = asyncio.create_task(_hold_background(admission))
+    await asyncio.sleep(0.1)  # longer than max_wait, with the queue full
+    assert not background.done()
+    release.set()
+    await asyncio.gather(holder, background)
+    assert admission.snapshot()["rejected"] == {}
+
+
+async def _hold_background(admission):
+    async with admission.admit(background=True):
+        pass
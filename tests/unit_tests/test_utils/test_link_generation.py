@@ -49,3 +49,19 @@ def test_generate_pagination_links(mock_request):
     assert len(links) >= 4
     expected_self_url = "http://testserver/users?limit=5&skip=10"
     assert normalize_url(str(links[0].href)) == normalize_url(expected_self_url), "Self link should match expected URL"
+
+def test_generate_pagination_links_for_cursor_page(mock_request):
+    mock_request.url = "http://testserver/users?cursor=abc&limit=5"
+    links = generate_pagination_links(mock_request, 0, 5, 50, cursor="abc", next_cursor="def", prev_cursor="xyz")
+    hrefs = {link.rel: normalize_url(str(link.href)) for link in links}
+    assert hrefs == {
+        "self": normalize_url("http://testserver/users?cursor=abc&limit=5"),
+        "first": normalize_url("http://testserver/users?skip=0&limit=5"),
+        "next": normalize_url("http://testserver/users?cursor=def&limit=5"),
+        "prev": normalize_url("http://testserver/users?cursor=xyz&limit=5"),
+    }
+
+def test_generate_pagination_links_without_total(mock_request):
+    links = generate_pagination_links(mock_request, 10, 5, None, next_cursor="def")
+    rels = [link.rel for link in links]
+    assert rels == ["self", "first", "next", "prev", "next_cursor"]
@@ -1,6 +1,8 @@
 import re
 from unittest.mock import patch
-from app.utils.nickname_gen import generate_nickname
+from app.utils import nickname_gen
+from app.utils.bloom_filter import BloomFilter
+from app.utils.nickname_gen import generate_nickname, nickname_candidates
 
 
 def test_generate_nickname_format():
@@ -36,4 +38,18 @@ def test_generate_nickname_deterministic(mock_randint, mock_choice):
     result = generate_nickname()
     
     # Assert the result matches expected
-    assert result == expected, f"Expected '{expected}' but got '{result}'" 
\ No newline at end of file
+    assert result == expected, f"Expected '{expected}' but got '{result}'" 
+
+def test_nickname_candidates_skip_taken_nicknames():
+    taken = BloomFilter(capacity=100)
+    with patch('app.utils.nickname_gen.generate_nickname', side_effect=["a_b_1", "a_b_1", "a_b_2", "a_b_3", "a_b_4"]):
+        taken.add("a_b_2")
+        assert nickname_candidates(2, taken) == ["a_b_1", "a_b_3"]
+
+
+def test_vocabulary_is_configurable(monkeypatch):
+    monkeypatch.setattr(nickname_gen.settings, "nickname_adjectives", ["tiny"])
+    monkeypatch.setattr(nickname_gen.settings, "nickname_animals", ["newt"])
+    monkeypatch.setattr(nickname_gen.settings, "nickname_max_number", 0)
+
+    assert generate_nickname() == "tiny_newt_0"
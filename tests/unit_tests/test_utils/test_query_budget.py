@@ -0,0 +1,76 @@
+import pytest
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.utils import query_budget as query_budget_module
+from app.utils.query_budget import (
+    QueryBudgetExceeded, QueryBudgetMiddleware, QueryCounter, check_budget, count_queries, query_budget,
+)
+
+
+@pytest.fixture
+async def engine():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+def app(engine):
+    app = FastAPI()
+    app.add_middleware(QueryBudgetMiddleware)
+
+    @app.get("/two")
+    @query_budget(1)
+    async def two_queries():
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+            await connection.execute(text("SELECT 2"))
+        return {}
+
+    return app
+
+
+async def test_count_queries_counts_statements_of_any_engine(engine):
+    with count_queries() as counter:
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+    async with engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))  # outside the block
+    assert counter.count == 1
+    assert counter.db_time > 0
+
+
+def test_repeated_statements_are_reported_as_n_plus_one():
+    counter = QueryCounter()
+    for user_id in range(5):
+        counter.record(f"SELECT * FROM users WHERE id = {user_id}", 0.001)
+    counter.record("SELECT count(*) FROM users", 0.001)
+    assert counter.repeated(threshold=5) == [("SELECT * FROM users WHERE id = ?", 5)]
+
+
+def test_strict_mode_raises(monkeypatch):
+    counter = QueryCounter()
+    counter.record("SELECT 1", 0.0)
+    counter.record("SELECT 2", 0.0)
+    check_budget(counter, 2, "route")
+    monkeypatch.setattr(query_budget_module.settings, "db_query_budget_strict", False)
+    check_budget(counter, 1, "route")  # only logs
+    monkeypatch.setattr(query_budget_module.settings, "db_query_budget_strict", True)
+    with pytest.raises(QueryBudgetExceeded, match="budget of 1"):
+        check_budget(counter, 1, "route")
+
+
+async def test_middleware_reports_and_enforces_route_budget(app, monkeypatch):
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://testserver") as client:
+        monkeypatch.setattr(query_budget_module.settings, "db_query_budget_strict", False)
+        response = await client.get("/two")
+        assert response.status_code == 200
+        assert 'desc="2 queries"' in response.headers["server-timing"]
+
+        monkeypatch.setattr(query_budget_module.settings, "db_query_budget_strict", True)
+        with pytest.raises(QueryBudgetExceeded):
+            await client.get("/two")
@@ -1,7 +1,16 @@
-from builtins import RuntimeError, ValueError, isinstance, str
+from builtins import RuntimeError, ValueError, isinstance, str, zip
 import pytest
 from app.utils.security import (
+    ScryptHasher,
+    hasher_for,
     hash_password,
+    hash_passwords,
+    hash_password_async,
+    hash_rounds,
+    hashing_executor,
+    needs_rehash,
+    shutdown_hashing_executor,
+    verify_password_async,
     verify_password,
     generate_verification_token,
 )
@@ -24,6 +33,12 @@ def test_hash_password_with_different_rounds():
     assert hashed_10 != hashed_12, "Hashes should differ with different cost factors"
 
 
+def test_hash_passwords_keeps_order():
+    hashed = hash_passwords(["first", "second"], 4)
+    assert [verify_password(p, h) for p, h in zip(["first", "second"], hashed)] == [True, True]
+    assert not verify_password("first", hashed[1])
+
+
 @pytest.mark.parametrize("password", [
     "",
     " ",
@@ -81,3 +96,83 @@ def test_generate_verification_token():
 
     token2 = generate_verification_token()
     assert token1 != token2, "Tokens should be unique"
+
+
+@pytest.mark.asyncio
+async def test_async_hashing_runs_in_the_hashing_pool(monkeypatch):
+    """The async variants run bcrypt on the pool's threads, not on the event loop's."""
+    import threading
+    import app.utils.security as security
+
+    threads = []
+    hash_in_thread = security.hash_password
+    monkeypatch.setattr(security, "hash_password", lambda *args: threads.append(threading.current_thread().name) or hash_in_thread(*args))
+    hashed = await hash_password_async("secure_password", 4)
+
+    assert threads[0].startswith("password-hash")
+    assert await verify_password_async("secure_password", hashed) is True
+    assert await verify_password_async("other", hashed) is False
+
+
+def test_hashing_executor_is_created_once_and_can_be_shut_down(monkeypatch):
+    import app.utils.security as security
+    monkeypatch.setattr(security, "_hashing_executor", None)
+    executor = hashing_executor()
+    assert hashing_executor() is executor
+    shutdown_hashing_executor()
+    assert security._hashing_executor is None
+
+
+def test_hash_rounds_and_needs_rehash(monkeypatch):
+    import app.utils.security as security
+    monkeypatch.setattr(security, "_target_rounds", 5)
+    assert hash_rounds(hash_password("secure_password")) == 5
+    assert needs_rehash(hash_password("secure_password", 4)) is True
+    assert needs_rehash(hash_password("secure_password")) is False
+    assert hash_rounds("not-a-bcrypt-hash") is None
+    assert needs_rehash("not-a-bcrypt-hash") is False
+
+
+@pytest.mark.parametrize("target_ms, expected", [(250, 11), (0.5, 4), (10_000, 15)])
+def test_calibrate_rounds_picks_the_highest_cost_within_the_target(monkeypatch, target_ms, expected):
+    """With 1 ms at cost 4, each step doubling it, cost 11 is the last one within 250 ms."""
+    import app.utils.security as security
+    monkeypatch.setattr(security, "_time_hash", lambda rounds, samples: 2.0 ** (rounds - 4))
+    assert security.calibrate_rounds(target_ms, min_rounds=4, max_rounds=15) == expected
+
+
+def test_scrypt_hashes_verify_and_record_their_parameters():
+    hasher = ScryptHasher(cost=10)
+    hashed = hasher.hash("secure_password")
+    assert hashed.startswith("$scrypt$ln=10,r=8,p=1$")
+    assert hasher_for(hashed).name == "scrypt"
+    assert verify_password("secure_password", hashed) is True
+    assert verify_password("incorrect_password", hashed) is False
+    assert hasher.needs_rehash(hashed) is False
+    assert ScryptHasher(cost=11).needs_rehash(hashed) is True
+
+
+def test_new_hashes_use_the_configured_algorithm_and_old_ones_need_rehash(monkeypatch):
+    import app.utils.security as security
+    bcrypt_hash = hash_password("secure_password", 4)
+    monkeypatch.setattr(security.settings, "password_hash_algorithm", "scrypt")
+    monkeypatch.setitem(security.HASHERS, "scrypt", ScryptHasher(cost=10))
+    hashed = hash_password("secure_password")
+    assert hashed.startswith("$scrypt$")
+    assert needs_rehash(hashed) is False
+    assert needs_rehash(bcrypt_hash) is True
+    assert verify_password("secure_password", bcrypt_hash) is True
+
+
+def test_unknown_algorithm_fails_to_hash(monkeypatch):
+    import app.utils.security as security
+    monkeypatch.setattr(security.settings, "password_hash_algorithm", "md5")
+    with pytest.raises(ValueError):
+        hash_password("secure_password")
+
+
+def test_password_hash_workers_must_be_positive():
+    from pydantic import ValidationError
+    from settings.config import Settings
+    with pytest.raises(ValidationError):
+        Settings(password_hash_workers=0)
@@ -0,0 +1,35 @@
+from uuid import uuid4
+
+from sqlalchemy import select
+
+from app.models.user_model import User
+from app.utils.sharding import ShardRouter, _keys_in_criteria, jump_hash, sync_url
+
+
+def test_jump_hash_only_moves_keys_to_the_new_bucket():
+    keys = [uuid4().int & ((1 << 64) - 1) for _ in range(2000)]
+    before = [jump_hash(key, 4) for key in keys]
+    after = [jump_hash(key, 5) for key in keys]
+    assert all(0 <= bucket < 4 for bucket in before)
+    moved = [(old, new) for old, new in zip(before, after) if old != new]
+    assert all(new == 4 for _, new in moved)
+    assert 200 < len(moved) < 600  # about 1/5 of the keys
+
+
+def test_criteria_pinning_the_key_select_one_shard():
+    router = ShardRouter(["shard_0", "shard_1", "shard_2"])
+    user_id, other_id = uuid4(), uuid4()
+
+    by_id = select(User).where(User.id == user_id, User.is_locked.is_(False))
+    assert _keys_in_criteria(by_id.whereclause, "users", "id") == [user_id]
+    by_ids = select(User).where(User.id.in_([user_id, other_id]))
+    assert sorted(_keys_in_criteria(by_ids.whereclause, "users", "id")) == sorted([user_id, other_id])
+    assert _keys_in_criteria(select(User).filter_by(email="a@b.c").whereclause, "users", "id") is None
+    assert _keys_in_criteria((User.id == user_id) | (User.id == other_id), "users", "id") is None
+
+    assert router.shard_for(user_id) == router.shard_for(str(user_id))
+
+
+def test_sync_url_drops_async_driver():
+    assert sync_url("postgresql+asyncpg://u:p@db/app") == "postgresql://u:p@db/app"
+    assert sync_url("sqlite+aiosqlite:///./shard.db") == "sqlite:///./shard.db"
@@ -0,0 +1,55 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.utils import slow_query_log as slow_query_module
+from app.utils.slow_query_log import SlowQueryLog, instrument_slow_query_log, parameter_shapes, record_caller
+
+
+@record_caller
+class _Repository:
+    @classmethod
+    async def find_big(cls, connection):
+        return await connection.execute(text("SELECT x FROM t WHERE x > :low"), {"low": 1})
+
+
+@pytest.fixture
+async def engine(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'slow.db'}")
+    async with engine.begin() as connection:
+        await connection.execute(text("CREATE TABLE t (x INTEGER)"))
+        await connection.execute(text("INSERT INTO t VALUES (1), (2), (3)"))
+    yield engine
+    await engine.dispose()
+
+
+def test_parameter_shapes_hide_values():
+    assert parameter_shapes({"email": "a@b.c", "limit": 10}) == {"email": "str", "limit": "int"}
+    assert parameter_shapes(("a", 1.5)) == ["str", "float"]
+    assert parameter_shapes([("a",), ("b",)], executemany=True) == {"rows": 2, "first": ["str"]}
+
+
+async def test_slow_statement_is_captured_with_caller_and_plan(engine, monkeypatch):
+    monkeypatch.setattr(slow_query_module.settings, "db_slow_query_threshold_ms", 1e-9)
+    log = SlowQueryLog(size=2)
+    instrument_slow_query_log(engine, log)
+
+    async with engine.connect() as connection:
+        result = await _Repository.find_big(connection)
+        assert sorted(result.scalars().all()) == [2, 3]  # the EXPLAIN does not disturb the result
+        await connection.execute(text("UPDATE t SET x = x + 1"))
+
+    update, select = log.entries()
+    assert select["caller"] == "_Repository.find_big"
+    assert select["parameters"] == ["int"]
+    assert "SCAN t" in select["plan"]
+    assert update["caller"] is None and update["plan"] is None
+
+
+async def test_fast_statements_are_ignored(engine, monkeypatch):
+    monkeypatch.setattr(slow_query_module.settings, "db_slow_query_threshold_ms", 60_000)
+    log = SlowQueryLog(size=2)
+    instrument_slow_query_log(engine, log)
+    async with engine.connect() as connection:
+        await connection.execute(text("SELECT x FROM t"))
+    assert log.entries() == []
@@ -0,0 +1,79 @@
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.utils import statement_cache
+from app.utils.statement_cache import (
+    SchemaRevisionWatcher, asyncpg_connect_args, instrument_engine, statement_cache_metrics,
+)
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    statement_cache_metrics.reset()
+
+
+@pytest.fixture
+async def engine(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'cache.db'}")
+    yield engine
+    await engine.dispose()
+
+
+def test_connect_args_default(monkeypatch):
+    monkeypatch.setattr(statement_cache.settings, "db_statement_cache_size", 250)
+    monkeypatch.setattr(statement_cache.settings, "db_pgbouncer_transaction_mode", False)
+    assert asyncpg_connect_args() == {"prepared_statement_cache_size": 250}
+
+
+def test_connect_args_pgbouncer(monkeypatch):
+    monkeypatch.setattr(statement_cache.settings, "db_pgbouncer_transaction_mode", True)
+    args = asyncpg_connect_args()
+    assert args["statement_cache_size"] == 0
+    name_func = args["prepared_statement_name_func"]
+    assert name_func() != name_func()
+
+
+async def test_hits_and_misses_follow_the_connection_lru(engine):
+    instrument_engine(engine, cache_size=1)
+    async with engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+        await connection.execute(text("SELECT 1"))
+        await connection.execute(text("SELECT 2"))  # evicts SELECT 1
+        await connection.execute(text("SELECT 1"))
+    snapshot = statement_cache_metrics.snapshot()
+    assert (snapshot["hits"], snapshot["misses"]) == (1, 3)
+
+
+async def test_schema_invalidation_turns_hits_into_misses(engine):
+    instrument_engine(engine, cache_size=10)
+    async with engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+        engine.sync_engine.dialect._invalidate_schema_cache_asof = time.time() + 1
+        await connection.execute(text("SELECT 1"))
+    assert statement_cache_metrics.snapshot()["misses"] == 2
+
+
+async def test_revision_change_invalidates_cached_statements(engine, monkeypatch):
+    invalidate = MagicMock()
+    monkeypatch.setattr(engine.sync_engine.dialect, "_invalidate_schema_cache", invalidate, raising=False)
+    async with engine.begin() as connection:
+        await connection.execute(text("CREATE TABLE alembic_version (version_num VARCHAR(32) NOT NULL)"))
+        await connection.execute(text("INSERT INTO alembic_version VALUES ('aaa')"))
+
+    watcher = SchemaRevisionWatcher([engine])
+    assert await watcher.check() is False
+    assert await watcher.check() is False
+
+    async with engine.begin() as connection:
+        await connection.execute(text("UPDATE alembic_version SET version_num = 'bbb'"))
+    assert await watcher.check() is True
+    invalidate.assert_called_once()
+    assert statement_cache_metrics.snapshot()["schema_invalidations"] == 1
+
+
+async def test_missing_alembic_table_is_ignored(engine):
+    assert await SchemaRevisionWatcher([engine]).check() is False
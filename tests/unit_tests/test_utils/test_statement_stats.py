@@ -0,0 +1,58 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.utils.statement_stats import StatementStats, instrument_statement_stats, normalize_statement
+
+
+def test_normalize_collapses_literals_placeholders_and_in_lists():
+    assert normalize_statement("SELECT * FROM users WHERE id = $1 AND email = 'a@b.c'") == \
+        "SELECT * FROM users WHERE id = ? AND email = ?"
+    assert normalize_statement("SELECT users_1.id FROM users AS users_1\n LIMIT 10 OFFSET 20") == \
+        "SELECT users_1.id FROM users AS users_1 LIMIT ? OFFSET ?"
+    assert normalize_statement("SELECT 1 FROM t WHERE x IN (?, ?, ?) AND y::text = :y") == \
+        "SELECT ? FROM t WHERE x IN (...) AND y::text = ?"
+
+
+def test_aggregates_per_fingerprint():
+    stats = StatementStats(max_entries=10)
+    for elapsed in (0.001, 0.003):
+        stats.record("SELECT * FROM users WHERE id = 1", elapsed, 1)
+    stats.record("SELECT * FROM users WHERE id = 2", 0.002, 0)
+
+    (entry,) = stats.snapshot()["statements"]
+    assert entry["calls"] == 3 and entry["rows"] == 2
+    assert entry["total_ms"] == pytest.approx(6.0)
+    assert entry["mean_ms"] == pytest.approx(2.0)
+    assert entry["p99_ms"] == entry["max_ms"] == pytest.approx(3.0)
+
+
+def test_least_called_statement_is_evicted_when_full():
+    stats = StatementStats(max_entries=2)
+    stats.record("SELECT a FROM t", 0.001, 0)
+    stats.record("SELECT a FROM t", 0.001, 0)
+    stats.record("SELECT b FROM t", 0.001, 0)
+    stats.record("SELECT c FROM t", 0.001, 0)
+
+    snapshot = stats.snapshot(order_by="calls")
+    assert [entry["query"] for entry in snapshot["statements"]] == ["SELECT a FROM t", "SELECT c FROM t"]
+    assert snapshot["evictions"] == 1
+    stats.reset()
+    assert stats.snapshot()["tracked"] == 0
+
+
+async def test_engine_hooks_record_statements_and_rows(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'stats.db'}")
+    stats = StatementStats(max_entries=10)
+    instrument_statement_stats(engine, stats)
+    try:
+        async with engine.begin() as connection:
+            await connection.execute(text("CREATE TABLE t (x INTEGER)"))
+            await connection.execute(text("INSERT INTO t VALUES (1), (2), (3)"))
+            await connection.execute(text("SELECT x FROM t WHERE x > :low"), {"low": 0})
+    finally:
+        await engine.dispose()
+
+    by_query = {entry["query"]: entry for entry in stats.snapshot()["statements"]}
+    assert by_query["INSERT INTO t VALUES (?), (?), (?)"]["rows"] == 3
+    assert by_query["SELECT x FROM t WHERE x > ?"]["rows"] == 3